@@ -1,428 +1,373 @@
-import pandas as pd
 import streamlit as st
-from io import BytesIO
 from datetime import datetime
-import re
-import openpyxl
+from functools import partial
 
-# 定数
-RATE_PER_KM = 15
-DAILY_ALLOWANCE = 200
+from pinos.parser import EntryCache, dataframe_fingerprint, format_invalid_dates, invalid_dates, parse_expense_data
+from pinos.ingest import IngestResult, expand_uploads, iter_ingest_results, merge_ingest_results
+from pinos.routes import RouteIndex
+from pinos.dedup import DUPLICATE_EXACT, DUPLICATE_NEAR, drop_duplicates, find_duplicates
+from pinos.policy import DEFAULT_POLICIES, POLICY_COLUMNS, current_period, default_policies, period_label, policies_from_records
+from pinos.settlement import compare_policies, create_settlement
+from pinos.excel import export_to_excel
+from pinos.pdf import export_to_pdf
+from pinos.bundle import export_bundle
+from pinos.instrument import Profile, call_profiled, profiling
+from pinos.jobs import JOB_DONE, JOB_FAILED, JOB_QUEUED, ExportQueue
+from pinos.store import STORE_PATH, EntryStore
+
+# 精算書の表示設定
+REPORT_PAGE_SIZE = 50  # 1ページに表示する担当者数
+EXPORT_POLL_SECONDS = 1  # 出力ファイルの作成状況を更新する間隔（秒）
+HIGHLIGHT_ROW_LIMIT = 5000  # 外れ値の行を色付けする表の最大行数（大きい表は色付けの処理が重いため目印の列のみ）
+
+# 出力ファイルの形式（キー -> 表示名・ファイル名（{period}は精算期間）・MIMEタイプ・ZIPに含める形式）
+EXPORTS = {
+    'xlsx': {
+        'label': "精算書（Excel）",
+        'file_name': '精算書_{period}.xlsx',
+        'mime': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    },
+    'pdf': {
+        'label': "精算書（PDF）",
+        'file_name': '精算書_{period}.pdf',
+        'mime': 'application/pdf',
+    },
+    'zip_xlsx': {
+        'label': "担当者ごとの精算書（ZIP）",
+        'file_name': '精算書_{period}.zip',
+        'mime': 'application/zip',
+        'bundle_formats': ('xlsx',),
+    },
+    'zip_png': {
+        'label': "担当者ごとの精算書画像（PNG・ZIP）",
+        'file_name': '精算書画像_{period}.zip',
+        'mime': 'application/zip',
+        'bundle_formats': ('png',),
+    },
+}
 
 # 計算日付の設定
 calculationDate = datetime.now().strftime("%Y%m%d")
 
-def create_expense_table_image(df, name):
-    # 画像サイズとフォント設定
-    width = 1200
-    row_height = 40
-    header_height = 60
-    padding = 30
-    title_height = 50
-    
-    # 全行数を計算（タイトル + ヘッダー + データ行 + 合計行 + 注釈）
-    total_rows = len(df) + 3
-    height = title_height + header_height + (total_rows * row_height) + padding * 2
-    
-    # 画像作成
-    img = Image.new('RGB', (width, height), 'white')
-    draw = ImageDraw.Draw(img)
-    
-    # フォント設定
-    font = ImageFont.load_default()
-    
-    # タイトル描画
-    title = f"{name}様 2024年12月25日～2025年1月 社内通貨（交通費）清算額"
-    draw.text((padding, padding), title, fill='black', font=font)
-    
-    # ヘッダー
-    headers = ['日付', '経路', '合計距離(km)', '交通費（距離×15P）(円)', '運転手当(円)', '合計(円)']
-    x_positions = [padding, padding + 80, padding + 600, padding + 750, padding + 900, padding + 1050]
-    
-    y = padding + title_height
-    for header, x in zip(headers, x_positions):
-        draw.text((x, y), header, fill='black', font=font)
-    
-    # 罫線
-    line_y = y + header_height - 5
-    draw.line([(padding, line_y), (width - padding, line_y)], fill='black', width=1)
-    
-    # データ行
-    y = padding + title_height + header_height
-    for _, row in df.iterrows():
-        for route in row['routes']:
-            # 日付
-            draw.text((x_positions[0], y), str(row['date']), fill='black', font=font)
-            
-            # 経路
-            draw.text((x_positions[1], y), route['route'], fill='black', font=font)
-            
-            # 最初のルートの行にのみ数値を表示
-            if route == row['routes'][0]:
-                # 距離
-                draw.text((x_positions[2], y), f"{row['total_distance']:.1f}", fill='black', font=font)
-                
-                # 交通費
-                draw.text((x_positions[3], y), f"{int(row['transportation_fee']):,}", fill='black', font=font)
-                
-                # 運転手当
-                draw.text((x_positions[4], y), f"{int(row['allowance']):,}", fill='black', font=font)
-                
-                # 合計
-                draw.text((x_positions[5], y), f"{int(row['total']):,}", fill='black', font=font)
-            
-            y += row_height
-    
-    # 合計行の罫線
-    line_y = y - 5
-    draw.line([(padding, line_y), (width - padding, line_y)], fill='black', width=1)
-    
-    # 合計行
-    y += 10
-    draw.text((x_positions[0], y), "合計", fill='black', font=font)
-    draw.text((x_positions[5], y), f"{int(df['total'].sum()):,}", fill='black', font=font)
-    
-    # 注釈
-    y += row_height * 2
-    draw.text((padding, y), "※2025年1月分給与にて清算しました。", fill='black', font=font)
-    
-    # 計算日時
-    draw.text((padding, y + row_height), f"計算日時: {datetime.now().strftime('%Y/%m/%d')}", fill='black', font=font)
-    
-    # 画像をバイト列に変換
-    img_byte_arr = io.BytesIO()
-    img.save(img_byte_arr, format='PNG')
-    img_byte_arr = img_byte_arr.getvalue()
-    
-    return img_byte_arr
+# 精算データ・出力ファイルのキャッシュ
+# 解析済みデータのフィンガープリント・単価・運転手当の設定表・精算期間をキーにし、同じ内容なら再計算しない
+@st.cache_resource(max_entries=8, show_spinner=False)
+def get_settlement(fingerprint, policies_key, period, _df, _policies):
+    """精算データを取得（全セッションで共有し、読み取り専用として扱う）"""
+    return create_settlement(_df, _policies, period)
 
-def parse_expense_data(text):
-    """テキストデータを解析してDataFrameを作成"""
-    lines = text.replace('\r\n', '\n').split('\n')
-    data = []
-    entry_id = 1
-    current_entry = []
+@st.cache_resource
+def get_export_queue():
+    """出力ファイルの作成ジョブのキュー（全セッションで共有し、同じデータ・形式のファイルは1回だけ作成する）"""
+    return ExportQueue()
+
+def export_function(export_format, profile, df, settlement):
+    """出力形式に応じたファイルの作成処理（進捗の通知先を受け取ってバイト列を返す関数）"""
+    names = settlement.names
+    if export_format == 'xlsx':
+        return lambda progress: call_profiled(profile, partial(export_to_excel, progress=progress), df, names, settlement)
+    if export_format == 'pdf':
+        return lambda progress: call_profiled(profile, partial(export_to_pdf, progress=progress), df, names, settlement)
+    bundle_formats = EXPORTS[export_format]['bundle_formats']
+    return lambda progress: call_profiled(
+        profile, partial(export_bundle, formats=bundle_formats, progress=progress), df, names, settlement
+    )
+
+@st.fragment
+def show_exports(profile, fingerprint, policies_key, df, settlement):
+    """出力ファイルの作成ボタン・作成状況・ダウンロードボタン（作成中も画面は操作できる）
     
-    for line in lines:
-        line = line.strip()
-        if not line:
+    定期的に更新するのは作成中のファイルの進捗のみで、完成したファイルのダウンロードボタンは再描画しない。
+    """
+    queue = get_export_queue()
+    for export_format, export in EXPORTS.items():
+        key = (fingerprint, policies_key, settlement.period, export_format)
+        job = queue.get(key)
+        if job is None or job.status == JOB_FAILED:
+            if job is not None:
+                st.error(f"{export['label']}を作成できませんでした: {job.error}")
+            if st.button(f"{export['label']}を作成", key=f"export_{export_format}"):
+                job = queue.submit(key, export['label'], export_function(export_format, profile, df, settlement))
+        if job is None or job.status == JOB_FAILED:
             continue
-            
-        # 新しいエントリーの開始を検出
-        if '【ピノ】' in line:
-            # 前のエントリーを処理
-            if current_entry:
-                entry_data = process_entry(''.join(current_entry))
-                if entry_data:
-                    entry_data['id'] = entry_id
-                    data.append(entry_data)
-                    entry_id += 1
-            current_entry = [line]
+        if job.status == JOB_DONE:
+            st.download_button(
+                label=f"{export['label']}をダウンロード（{job.elapsed:.1f}秒で作成）",
+                data=job.result,
+                file_name=export['file_name'].format(period=settlement.period_label),
+                mime=export['mime'],
+                key=f"download_{export_format}",
+                on_click='ignore'
+            )
         else:
-            # 距離情報を含む行を追加
-            if any(pattern in line for pattern in ['km', '㎞', 'ｋｍ', 'kｍ']):
-                current_entry.append(line)
-    
-    # 最後のエントリーを処理
-    if current_entry:
-        entry_data = process_entry(''.join(current_entry))
-        if entry_data:
-            entry_data['id'] = entry_id
-            data.append(entry_data)
-    
-    return pd.DataFrame(data)
+            show_export_progress(key, export['label'])
 
-def process_entry(text):
-    """個別のエントリーを解析"""
-    # 基本情報の抽出（名前と日付）
-    name_date_match = re.search(r'【ピノ】\s*([^　\s]+(?:[ 　]+[^　\s]+)*)\s+(\d+/\d+)\s*\([月火水木金土日]\)', text)
-    if not name_date_match:
-        return None
-        
-    name = name_date_match.group(1).strip()
-    date = name_date_match.group(2)
-    
-    # 距離の抽出（複数のパターンに対応）
-    distance_patterns = [
-        r'(\d+\.?\d*)(?:km|㎞|ｋｍ|kｍ)',  # 基本パターン
-        r'距離[：:]\s*(\d+\.?\d*)',        # 「距離:」パターン
-        r'合計[：:]\s*(\d+\.?\d*)',        # 「合計:」パターン
-        r'往復[：:]\s*(\d+\.?\d*)',        # 「往復:」パターン
-    ]
-    
-    distance = None
-    for pattern in distance_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            distance = float(match.group(1))
-            break
-    
-    if not distance:
-        return None
-    
-    # 経路の抽出（日付の後ろから距離の前まで）
-    route_text = text[text.find(')')+1:text.find(str(distance))].strip()
-    route = re.sub(r'\s+', ' ', route_text)  # 複数の空白を1つに
-    
-    return {
-        'name': name,  # 【ピノ】の後の名前を使用
-        'date': date,
-        'route': route,
-        'distance': distance
-    }
+@st.fragment(run_every=EXPORT_POLL_SECONDS)
+def show_export_progress(key, label):
+    """作成待ち・作成中のファイルの進捗（終わったら画面を再実行してダウンロードボタン・エラーに切り替える）"""
+    job = get_export_queue().get(key)
+    if job is None or job.finished:
+        st.rerun()
+    text = "作成待ち" if job.status == JOB_QUEUED else f"作成中（{job.elapsed:.0f}秒経過）"
+    st.progress(job.progress, text=f"{label}: {text}")
 
-def create_expense_report(person_data):
-    """個人の精算書データを作成（経路ごとに表示）"""
-    # データを日付順にソート
-    person_data = person_data.sort_values('date')
-    
-    # 各経路のデータを作成
-    route_data = []
-    current_date = None
-    
-    for _, row in person_data.iterrows():
-        # 日付が変わったら運転手当を付与
-        if current_date != row['date']:
-            current_date = row['date']
-            add_allowance = 200  # 新しい日付の最初の経路に運転手当を付与
-        else:
-            add_allowance = 0  # 同じ日付の2つ目以降の経路には運転手当を付与しない
-        
-        route_data.append({
-            '日付': row['date'],
-            '経路': row['route'],
-            '合計距離(km)': round(row['distance'], 1),
-            '交通費（距離×15P）(円)': int(row['distance'] * 15),
-            '運転手当(円)': add_allowance,
-            '合計(円)': int(row['distance'] * 15 + add_allowance)
-        })
-    
-    # DataFrameを作成
-    expense_data = pd.DataFrame(route_data)
-    
-    # 合計行の追加
-    total_row = pd.DataFrame({
-        '日付': ['合計'],
-        '経路': [''],
-        '合計距離(km)': [expense_data['合計距離(km)'].sum()],
-        '交通費（距離×15P）(円)': [expense_data['交通費（距離×15P）(円)'].sum()],
-        '運転手当(円)': [expense_data['運転手当(円)'].sum()],
-        '合計(円)': [expense_data['合計(円)'].sum()]
-    })
-    
-    # データフレームを結合
-    expense_data = pd.concat([expense_data, total_row], ignore_index=True)
-    
-    return expense_data
+@st.cache_data(max_entries=8, show_spinner=False)
+def get_duplicates(fingerprint, _df):
+    """重複エントリーの検出結果を取得"""
+    return find_duplicates(_df)
 
-def create_pdf(expense_data, name):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=landscape(A4),
-        rightMargin=20*mm,
-        leftMargin=20*mm,
-        topMargin=20*mm,
-        bottomMargin=20*mm
-    )
-    
-    # データをリスト形式に変換
-    data = [expense_data.columns.tolist()]  # ヘッダー
-    data.extend(expense_data.values.tolist())  # データ行
-    
-    # テーブルスタイルの設定
-    table = Table(data)
-    style = TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 10),
-        ('FONT', (0, 1), (-1, -1), 'Helvetica', 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('ALIGN', (2, 1), (-1, -1), 'RIGHT'),
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-    ])
-    table.setStyle(style)
-    
-    # タイトルと注釈を追加
-    elements = []
-    elements.append(table)
-    
-    # PDFを生成
-    doc.build(elements)
-    
-    return buffer
+@st.cache_resource
+def get_store(path):
+    """解析済みエントリーの保存先（全セッションで共有）"""
+    return EntryStore(path)
 
-def create_png(expense_data, name):
-    # HTMLテーブルを作成
-    html_content = f"""
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; padding: 20px; }}
-            table {{ 
-                border-collapse: collapse; 
-                width: 100%;
-                margin-bottom: 20px;
-            }}
-            th, td {{ 
-                border: 1px solid #ddd; 
-                padding: 8px; 
-                text-align: left; 
-            }}
-            th {{ 
-                background-color: #2196F3; 
-                color: white; 
-            }}
-            td {{ text-align: right; }}
-            td:nth-child(1), td:nth-child(2) {{ text-align: left; }}
-            .title {{ 
-                text-align: center; 
-                margin-bottom: 20px; 
-            }}
-            .note {{ 
-                margin-top: 15px; 
-                color: #666; 
-                font-size: 0.9em; 
-            }}
-        </style>
-    </head>
-    <body>
-        <h2 class="title">{name}様 2024年12月25日～2025年1月 社内通貨（交通費）清算額</h2>
-        {expense_data.to_html(index=False)}
-        <div class="note">※2025年1月分給与にて清算しました。</div>
-    </body>
-    </html>
-    """
-    
-    # Chromeのオプション設定
-    chrome_options = Options()
-    chrome_options.add_argument('--headless')  # ヘッドレスモード
-    chrome_options.add_argument('--no-sandbox')
-    chrome_options.add_argument('--disable-dev-shm-usage')
-    
-    # WebDriverの初期化
-    driver = webdriver.Chrome(options=chrome_options)
-    
-    try:
-        # HTMLの読み込みとスクリーンショット
-        driver.get("data:text/html;charset=utf-8," + html_content)
-        driver.set_window_size(1200, len(expense_data) * 30 + 200)
-        png_data = driver.get_screenshot_as_png()
-        return png_data
-    finally:
-        driver.quit()
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_current_route_index(fingerprint, _df):
+    """解析したデータのみから作成した経路ごとの距離の索引（保存済みデータがない場合に使用）"""
+    index = RouteIndex()
+    index.update(_df)
+    return index
 
-def capture_streamlit_table():
-    # 少し待って画面が描画されるのを待つ
-    time.sleep(1)
-    # 画面全体のスクリーンショットを取得
-    screenshot = pyautogui.screenshot()
-    return screenshot
+@st.cache_data(max_entries=8, show_spinner=False)
+def get_distance_check(fingerprint, index_key, _index, _df):
+    """経路ごとの距離の中央値との比較結果を取得"""
+    return _index.check(_df)
 
-def export_to_excel(df, unique_names):
-    """精算書をExcelファイルとして出力"""
-    output = BytesIO()
-    workbook = openpyxl.Workbook()
-    
-    # 最初のシートを使用
-    first_name = unique_names[0]
-    first_sheet = workbook.active
-    first_sheet.title = f"{first_name}様"
-    
-    # 全ての担当者のシートを作成
-    for name in unique_names:
-        if name == first_name:
-            worksheet = first_sheet
-        else:
-            worksheet = workbook.create_sheet(f"{name}様")
-        
-        # 担当者のデータを抽出して精算書を作成
-        person_data = df[df['name'] == name].copy()
-        expense_data = create_expense_report(person_data)
-        
-        # A4サイズに合わせた設定
-        worksheet.page_setup.paperSize = worksheet.PAPERSIZE_A4
-        worksheet.page_setup.orientation = worksheet.ORIENTATION_LANDSCAPE
-        
-        # 列幅の設定
-        worksheet.column_dimensions['A'].width = 15  # 日付
-        worksheet.column_dimensions['B'].width = 50  # 経路
-        worksheet.column_dimensions['C'].width = 15  # 合計距離
-        worksheet.column_dimensions['D'].width = 25  # 交通費
-        worksheet.column_dimensions['E'].width = 15  # 運転手当
-        worksheet.column_dimensions['F'].width = 15  # 合計
-        
-        # 行の高さを設定
-        worksheet.row_dimensions[1].height = 45  # タイトル行
-        worksheet.row_dimensions[2].height = 60  # ヘッダー行
-        
-        # タイトルを追加
-        title = f"{name}様 2025年1月 社内通貨（交通費）清算額"
-        worksheet['A1'] = title
-        worksheet.merge_cells('A1:F1')
-        title_cell = worksheet['A1']
-        title_cell.alignment = openpyxl.styles.Alignment(horizontal='center', vertical='center')
-        title_cell.font = openpyxl.styles.Font(size=14, bold=True)
-        
-        # ヘッダーの書き込み
-        headers = ['日付', '経路', '合計距離(km)', '交通費（距離×15P）(円)', '運転手当(円)', '合計(円)']
-        for col_idx, header in enumerate(headers, 1):
-            cell = worksheet.cell(row=2, column=col_idx)
-            cell.value = header
-            cell.font = openpyxl.styles.Font(size=11, bold=True)
-            cell.alignment = openpyxl.styles.Alignment(horizontal='center', vertical='center', wrap_text=True)
-            cell.fill = openpyxl.styles.PatternFill(start_color='E0E0E0', end_color='E0E0E0', fill_type='solid')
-        
-        # データの書き込み
-        for row_idx, row in enumerate(expense_data.values, 3):
-            worksheet.row_dimensions[row_idx].height = 30  # データ行の高さを30に設定
-            
-            for col_idx, value in enumerate(row, 1):
-                cell = worksheet.cell(row=row_idx, column=col_idx)
-                cell.value = value
-                cell.font = openpyxl.styles.Font(size=11)
+def check_distances(fingerprint, df):
+    """保存済みデータ（なければ解析したデータ）の経路ごとの距離の中央値と比較"""
+    index = get_store(STORE_PATH).route_index()
+    if not len(index):
+        index = get_current_route_index(fingerprint, df)
+    return get_distance_check(fingerprint, (id(index), index.version), index, df)
+
+def highlight_anomalies(view):
+    """距離が外れ値の行の距離を色付け"""
+    styles = view.copy().astype(object)
+    styles[:] = ''
+    styles.loc[view['distance_anomaly'], 'distance'] = 'background-color: #ffd6d6; color: #b00000'
+    return styles
+
+def show_period_input():
+    """精算期間の入力（解析時の日付の年の補完・精算書の表示・保存する精算期間に使う、(年, 月)を返す）"""
+    # 初期値は今月（保存済みデータを読み込んだ場合はその精算期間に合わせるため、値はセッションで持つ）
+    year, month = current_period()
+    st.session_state.setdefault('period_year', year)
+    st.session_state.setdefault('period_month', month)
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        year = st.number_input("精算期間（年）", min_value=2000, max_value=2100, step=1, key='period_year')
+    with col2:
+        month = st.number_input("精算期間（月）", min_value=1, max_value=12, step=1, key='period_month')
+    period = (int(year), int(month))
+    with col3:
+        df_period = st.session_state.get('df_period')
+        if st.session_state.get('df') is not None and df_period and df_period != period:
+            st.caption(f"表示中のデータは{period_label(df_period)}の精算期間で解析しています。変更する場合は再度解析してください。")
+    return period
+
+def load_stored_period(store):
+    """選択した保存済みの精算期間のエントリーを読み込む（精算期間の入力も合わせる）"""
+    period = st.session_state['stored_period']
+    stored_year, stored_month = map(int, period.split('-'))
+    df = store.load_period(stored_year, stored_month)
+    st.session_state['df'] = df
+    st.session_state['df_fingerprint'] = dataframe_fingerprint(df)
+    st.session_state['df_source'] = f"保存済みデータ {period}"
+    st.session_state['df_period'] = (stored_year, stored_month)
+    st.session_state['period_year'] = stored_year
+    st.session_state['period_month'] = stored_month
+
+def show_store_panel(store):
+    """保存済みデータのサイドバー（解析結果の保存と、保存済みの精算期間の読み込み）"""
+    with st.sidebar.expander("保存済みデータ"):
+        # 解析結果を解析時の精算期間で保存（同じエントリーは重複して保存しない）
+        df = st.session_state.get('df')
+        df_period = st.session_state.get('df_period')
+        if df_period:
+            st.caption(f"解析結果は{period_label(df_period)}分として保存します。")
+        if st.button("解析結果を保存", disabled=df is None or df.empty or not df_period):
+            try:
+                count = store.upsert(
+                    df, *df_period, source=st.session_state.get('df_source'),
+                    duplicates=get_duplicates(st.session_state.get('df_fingerprint') or dataframe_fingerprint(df), df)
+                )
+            except ValueError as error:
+                st.error(f"保存できませんでした: {error}")
+            else:
+                st.success(f"{period_label(df_period)}分として{count}件を保存しました")
                 
-                # 数値の書式設定
-                if col_idx in [3, 4, 5, 6]:  # 数値列
-                    cell.alignment = openpyxl.styles.Alignment(horizontal='right', vertical='center')
-                    if col_idx == 3:  # 距離
-                        cell.number_format = '#,##0.0'
-                    else:  # 金額
-                        cell.number_format = '#,##0'
-                else:
-                    cell.alignment = openpyxl.styles.Alignment(horizontal='left', vertical='center', wrap_text=True)
-        
-        # 罫線の設定
-        border = openpyxl.styles.Border(
-            left=openpyxl.styles.Side(style='thin'),
-            right=openpyxl.styles.Side(style='thin'),
-            top=openpyxl.styles.Side(style='thin'),
-            bottom=openpyxl.styles.Side(style='thin')
+        # 保存済みの精算期間を読み込む（再解析は不要）
+        periods = store.periods()
+        if not periods:
+            st.caption("保存済みのデータはありません。")
+            return
+        labels = {period: f"{period}（{count}件）" for period, count in periods}
+        st.selectbox("保存済みの精算期間", list(labels), format_func=labels.get, key='stored_period')
+        st.button("読み込む", on_click=load_stored_period, args=(store,))
+
+def get_policies():
+    """画面で適用している単価・運転手当の設定表（未設定の場合は既定の設定表）"""
+    policies = st.session_state.get('policies')
+    if policies is None:
+        try:
+            policies = default_policies()
+        except (OSError, ValueError) as error:
+            st.error(f"設定表を読み込めませんでした（既定の設定を使用します）: {error}")
+            policies = DEFAULT_POLICIES
+        st.session_state['policies'] = policies
+    return policies
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def get_policy_diff(store_key, old_key, new_key, kinds, _store, _old, _new):
+    """保存済みの全エントリー（kindsの種類の重複は除く）を変更前・変更後の設定表で再計算した担当者ごとの差額"""
+    return compare_policies(_store.load_entries(duplicates=kinds), _old, _new, by_period=False)
+
+def apply_policies(policies):
+    """設定表を適用（表の編集内容は適用した設定表に含まれるので破棄する）"""
+    st.session_state['policies'] = policies
+    st.session_state['policy_version'] = st.session_state.get('policy_version', 0) + 1
+
+def show_policy_panel(store):
+    """単価・運転手当の設定表のサイドバー（編集した設定で保存済みデータを再計算して差額を確認し、適用する）"""
+    policies = get_policies()
+    with st.sidebar.expander("単価・運転手当の設定"):
+        st.caption("適用開始日以降のエントリーにその行の単価・運転手当を適用します。締め日が空欄の場合は月末締めです。")
+        records = st.data_editor(
+            policies.to_records(),
+            column_order=POLICY_COLUMNS,
+            column_config={
+                'effective_from': st.column_config.DateColumn('適用開始日', format="YYYY/MM/DD", required=True),
+                'rate_per_km': st.column_config.NumberColumn('単価(円/km)', min_value=0, required=True),
+                'daily_allowance': st.column_config.NumberColumn('運転手当(円)', min_value=0, step=1, required=True),
+                'closing_day': st.column_config.NumberColumn('締め日', min_value=1, max_value=31, step=1)
+            },
+            num_rows='dynamic',
+            hide_index=True,
+            key=f"policy_editor_{st.session_state.get('policy_version', 0)}"
         )
+        try:
+            edited = policies_from_records(records)
+        except ValueError as error:
+            st.error(str(error))
+            return
+        if edited.key == policies.key:
+            return
+            
+        # 保存済みの全期間のエントリーを変更前・変更後の設定で1回ずつ再計算して比較
+        if store.periods():
+            # 精算と同じく、除外する種類の重複エントリーは再計算に含めない
+            kinds = excluded_duplicate_kinds()
+            diff = get_policy_diff(tuple(store.periods()), policies.key, edited.key, kinds, store, policies, edited)
+            changed = diff[diff['difference'] != 0]
+            st.caption(f"保存済みデータの差額: 合計 {int(diff['difference'].sum()):,}円（{len(changed)}名）")
+            st.dataframe(
+                changed[['total_old', 'total_new', 'difference']].rename_axis('担当者').reset_index(),
+                column_config={
+                    '担当者': st.column_config.TextColumn('担当者'),
+                    'total_old': st.column_config.NumberColumn('変更前(円)', format="%d"),
+                    'total_new': st.column_config.NumberColumn('変更後(円)', format="%d"),
+                    'difference': st.column_config.NumberColumn('差額(円)', format="%d")
+                },
+                hide_index=True
+            )
+        st.button("この設定を適用", on_click=apply_policies, args=(edited,))
+
+def excluded_duplicate_kinds():
+    """精算から除外する重複の種類（重複の確認欄の選択、表示していない場合は既定の選択）"""
+    return tuple(
+        kind for kind, key, default in [
+            (DUPLICATE_EXACT, 'drop_exact_duplicates', True), (DUPLICATE_NEAR, 'drop_near_duplicates', False)
+        ]
+        if st.session_state.get(key, default)
+    )
+
+def show_duplicates(df, duplicates):
+    """重複エントリーを表示し、精算から除外する重複の種類を選択（除外する種類のタプルを返す）"""
+    counts = duplicates['kind'].value_counts()
+    exact, near = counts.get(DUPLICATE_EXACT, 0), counts.get(DUPLICATE_NEAR, 0)
+    st.warning(f"重複の可能性があるエントリーがあります（完全一致 {exact}件 / 類似 {near}件）")
+    with st.expander("重複エントリーを確認"):
+        # 重複した行と、最初に投稿された行を並べて表示
+        entries = df.set_index('id')
+        first = entries.loc[duplicates['duplicate_of']]
+        st.dataframe(
+            {
+                'No.': duplicates['id'],
+                '種類': duplicates['kind'].map({DUPLICATE_EXACT: '完全一致', DUPLICATE_NEAR: '類似'}),
+                '日付': entries.loc[duplicates['id'], 'date'].values,
+                '担当者': entries.loc[duplicates['id'], 'name'].values,
+                '経路': entries.loc[duplicates['id'], 'route'].values,
+                '距離(km)': entries.loc[duplicates['id'], 'distance'].values,
+                '重複元No.': duplicates['duplicate_of'],
+                '重複元の経路': first['route'].values,
+                '重複元の距離(km)': first['distance'].values,
+            },
+            column_config={'日付': st.column_config.DateColumn('日付', format="M/D")},
+            hide_index=True
+        )
+    col1, col2 = st.columns(2)
+    with col1:
+        st.checkbox("完全一致の重複を精算から除外する", value=True, key='drop_exact_duplicates')
+    with col2:
+        st.checkbox("類似した重複も精算から除外する", value=False, key='drop_near_duplicates')
+    return excluded_duplicate_kinds()
+
+def ingest_uploaded_files(uploaded_files, period):
+    """アップロードされたトーク履歴を並列に解析し、ファイルごとの進捗とエラーを表示（日付はperiodの年で補完）"""
+    logs, results = expand_uploads([(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files])
+    total = len(logs) + len(results)
+    progress = st.progress(len(results) / total, text=f"ファイルを解析しています（{len(results)}/{total}）")
+    for result in iter_ingest_results(logs, period=period):
+        results.append(result)
+        progress.progress(len(results) / total, text=f"{result.name} を解析しました（{len(results)}/{total}）")
+    progress.empty()
+    
+    # 読み込めなかったファイルの表示
+    for result in results:
+        if result.error:
+            st.warning(f"{result.name}: {result.error}")
+    return results
+
+def get_profile(panel):
+    """サイドバーの設定に応じて計測用のプロファイルを取得（計測しない場合はNone）"""
+    with panel:
+        enabled = st.toggle("処理時間を計測する", key='profiling_enabled')
+        memory = st.toggle("メモリ使用量も計測する（処理が遅くなります）", key='profiling_memory', disabled=not enabled)
+    if not enabled:
+        return None
         
-        for row in worksheet.iter_rows(min_row=2, max_row=len(expense_data.values)+2, min_col=1, max_col=6):
-            for cell in row:
-                cell.border = border
-        
-        # 注釈を追加
-        note_row = len(expense_data) + 4
-        worksheet.row_dimensions[note_row].height = 30
-        note_cell = worksheet[f'A{note_row}']
-        note_cell.value = "※2025年1月分給与にて清算しました。"
-        worksheet.merge_cells(f'A{note_row}:F{note_row}')
-        note_cell.alignment = openpyxl.styles.Alignment(horizontal='left', vertical='center')
-        note_cell.font = openpyxl.styles.Font(size=9)
-    
-    # ファイルを保存
-    workbook.save(output)
-    
-    return output.getvalue()
+    # 計測結果はセッション内で累積する（メモリ計測の有無を切り替えた場合は作り直す）
+    profile = st.session_state.get('profile')
+    if profile is None or profile.memory != memory:
+        profile = st.session_state['profile'] = Profile(memory=memory)
+    return profile
+
+def show_profile(panel, profile):
+    """計測結果をサイドバーに表示"""
+    with panel:
+        rows = profile.rows()
+        if not rows:
+            st.caption("まだ計測結果がありません。")
+            return
+        st.dataframe(
+            rows,
+            column_config={
+                'stage': st.column_config.TextColumn('処理'),
+                'calls': st.column_config.NumberColumn('回数'),
+                'seconds': st.column_config.NumberColumn('時間(秒)', format="%.3f"),
+                'rows': st.column_config.NumberColumn('行数'),
+                'peak_mib': st.column_config.NumberColumn('メモリ(MiB)', format="%.1f")
+            },
+            hide_index=True
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("JSON", profile.to_json(), file_name=f'計測結果_{calculationDate}.json', mime='application/json')
+        with col2:
+            st.download_button("CSV", profile.to_csv(), file_name=f'計測結果_{calculationDate}.csv', mime='text/csv')
+        if st.button("計測結果をリセット"):
+            profile.clear()
+            st.rerun()
 
 def main():
     # ページ設定
@@ -431,29 +376,91 @@ def main():
         layout="wide"
     )
     
+    # 計測が有効な場合のみ各処理の時間・メモリを記録する
+    panel = st.sidebar.expander("処理時間の計測")
+    profile = get_profile(panel)
+    if profile is None:
+        show_app(None)
+    else:
+        with profiling(profile):
+            show_app(profile)
+        show_profile(panel, profile)
+
+def show_app(profile):
+    """画面の表示（profileは計測用、計測しない場合はNone）"""
     st.title("PINO精算アプリケーション")
     
+    # 解析結果キャッシュ（同じログを再度貼り付けた場合は新規・変更エントリーのみ解析）
+    if 'entry_cache' not in st.session_state:
+        st.session_state['entry_cache'] = EntryCache()
+    entry_cache = st.session_state['entry_cache']
+    
+    # 精算期間（「M/D」の日付の年は精算期間から補完する）
+    period = show_period_input()
+    
     # テキストエリアの表示
     input_text = st.text_area("精算データを貼り付けてください", height=200)
     
+    # トーク履歴ファイルのアップロード（複数の.txt・ZIPをまとめて取り込める）
+    uploaded_files = st.file_uploader(
+        "またはトーク履歴ファイル（.txt・ZIP）をアップロードしてください",
+        type=['txt', 'zip'],
+        accept_multiple_files=True
+    )
+    
     # 解析ボタンとクリアボタン
     col1, col2 = st.columns([1, 1])
     with col1:
         if st.button("データを解析"):
-            if input_text:
-                df = parse_expense_data(input_text)
+            if input_text or uploaded_files:
+                entry_cache.reset_stats()
+                results = ingest_uploaded_files(uploaded_files, period) if uploaded_files else []
+                if input_text:
+                    df = parse_expense_data(input_text, cache=entry_cache, period=period)
+                    results.append(IngestResult("貼り付けたテキスト", df=df))
+                df = merge_ingest_results(results)
                 st.session_state['df'] = df
+                st.session_state['df_fingerprint'] = dataframe_fingerprint(df)
+                st.session_state['df_source'] = ', '.join(result.name for result in results)
+                st.session_state['df_period'] = period
                 st.success("データを解析しました！")
+                for result in results:
+                    skipped = {} if result.df is None else invalid_dates(result.df)
+                    if skipped:
+                        st.warning(f"{result.name}: 日付が正しくないエントリー{len(skipped)}件を除外しました（{format_invalid_dates(skipped)}）")
+                if uploaded_files:
+                    st.caption(f"{len(results)}件のファイルから{len(df)}件のエントリーを取り込みました")
+                    st.dataframe(
+                        [{'ファイル': result.name, 'エントリー数': result.entries, 'エラー': result.error or ''} for result in results],
+                        hide_index=True
+                    )
+                if input_text:
+                    st.caption(f"キャッシュ: ヒット {entry_cache.hits}件 / ミス {entry_cache.misses}件")
     with col2:
         if st.button("クリア"):
             st.session_state['df'] = None
+            st.session_state['df_fingerprint'] = None
+            st.session_state['df_period'] = None
             st.session_state['show_expense_report'] = False
             st.rerun()
     
+    # 保存済みデータ（解析結果を反映してから表示する）
+    show_store_panel(get_store(STORE_PATH))
+    show_policy_panel(get_store(STORE_PATH))
+    
     # データ一覧と精算書の表示
     if 'df' in st.session_state and st.session_state['df'] is not None:
         df = st.session_state['df']
+        fingerprint = st.session_state.get('df_fingerprint') or dataframe_fingerprint(df)
         if not df.empty:
+            # 重複エントリーの確認（除外した場合は除外後のデータで精算する）
+            duplicates = get_duplicates(fingerprint, df)
+            if not duplicates.empty:
+                kinds = show_duplicates(df, duplicates)
+                if kinds:
+                    df = drop_duplicates(df, duplicates, kinds)
+                    fingerprint = f"{fingerprint}:{'-'.join(kinds)}"
+            
             # データ一覧の表示
             st.markdown("""
             <h2 style='text-align: center; padding: 20px 0;'>
@@ -461,14 +468,24 @@ def main():
             </h2>
             """, unsafe_allow_html=True)
             
+            # 経路ごとの距離の中央値から大きく外れたエントリーに目印を付ける
+            check = check_distances(fingerprint, df)
+            view = df.assign(route_median=check['route_median'], distance_anomaly=check['distance_anomaly'])
+            anomalies = int(check['distance_anomaly'].sum())
+            if anomalies:
+                st.caption(f"距離が経路の中央値から大きく外れているエントリーが{anomalies}件あります")
+                if st.checkbox("距離が外れ値のエントリーのみ表示", key='show_anomalies_only'):
+                    view = view[view['distance_anomaly']]
             st.dataframe(
-                df,
+                view.style.apply(highlight_anomalies, axis=None) if len(view) <= HIGHLIGHT_ROW_LIMIT else view,
                 column_config={
                     'id': st.column_config.NumberColumn('No.', width=70),
-                    'date': st.column_config.TextColumn('日付', width=100),
+                    'date': st.column_config.DateColumn('日付', format="M/D", width=100),
                     'name': st.column_config.TextColumn('担当者', width=120),
                     'route': st.column_config.TextColumn('経路', width=500),
-                    'distance': st.column_config.NumberColumn('距離(km)', format="%.1f", width=100)
+                    'distance': st.column_config.NumberColumn('距離(km)', format="%.1f", width=100),
+                    'route_median': st.column_config.NumberColumn('経路の中央値(km)', format="%.1f", width=130),
+                    'distance_anomaly': st.column_config.CheckboxColumn('要確認', width=70)
                 },
                 hide_index=True
             )
@@ -479,70 +496,97 @@ def main():
                 if st.button("精算書を表示"):
                     st.session_state['show_expense_report'] = True
                     st.rerun()
-            
+                    
             # 精算書の表示
             if st.session_state.get('show_expense_report', False):
-                # 担当者ごとのタブを作成
-                unique_names = sorted(df['name'].unique())
-                tabs = st.tabs([f"{name}様" for name in unique_names])
+                policies = get_policies()
+                settlement = get_settlement(fingerprint, policies.key, st.session_state.get('df_period'), df, policies)
+                unique_names = settlement.names
+                if settlement.excluded:
+                    st.caption(f"{settlement.period_label}の精算期間に含まれないエントリー{settlement.excluded}件（別の月・締め日より後の日付）は精算書に含めていません")
                 
-                # 担当者ごとの精算書表示
-                for i, name in enumerate(unique_names):
-                    with tabs[i]:
-                        title = f"{name}様 2025年1月 社内通貨（交通費）清算額"
-                        st.markdown(f"### {title}")
-                        
-                        # 担当者のデータを抽出して精算書を作成
-                        person_data = df[df['name'] == name].copy()
-                        expense_data = create_expense_report(person_data)
-                        
-                        # 精算書の表示
-                        st.dataframe(
-                            expense_data,
-                            column_config={
-                                '日付': st.column_config.TextColumn('日付', width=120),
-                                '経路': st.column_config.TextColumn('経路', width=600),
-                                '合計距離(km)': st.column_config.NumberColumn(
-                                    '合計距離(km)',
-                                    format="%.1f",
-                                    width=150
-                                ),
-                                '交通費（距離×15P）(円)': st.column_config.NumberColumn(
-                                    '交通費（距離×15P）(円)',
-                                    format="%.0f",
-                                    width=200
-                                ),
-                                '運転手当(円)': st.column_config.NumberColumn(
-                                    '運転手当(円)',
-                                    format="%.0f",
-                                    width=150
-                                ),
-                                '合計(円)': st.column_config.NumberColumn(
-                                    '合計(円)',
-                                    format="%.0f",
-                                    width=150
-                                )
-                            },
-                            hide_index=True,
-                            height=400
-                        )
-                        
-                        # 注釈表示
-                        st.markdown("""
-                            <div style='margin-top: 15px; color: #666;'>
-                                ※2025年1月分給与にて清算しました。
-                            </div>
-                        """, unsafe_allow_html=True)
+                # 担当者の検索とページ切り替え（表示するのは1ページ分の担当者のみ）
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    keyword = st.text_input("担当者を検索", placeholder="名前の一部を入力")
+                matched_names = [name for name in unique_names if keyword in name] if keyword else unique_names
+                page_count = max(1, -(-len(matched_names) // REPORT_PAGE_SIZE))
+                with col2:
+                    page = st.number_input(
+                        f"ページ（全{page_count}ページ）",
+                        min_value=1,
+                        max_value=page_count,
+                        value=1,
+                        step=1
+                    )
+                page_names = matched_names[(page - 1) * REPORT_PAGE_SIZE:page * REPORT_PAGE_SIZE]
                 
-                # ダウンロードボタン
-                st.markdown("---")
-                excel_data = export_to_excel(df, unique_names)  # unique_namesはここで定義済み
-                st.download_button(
-                    label="精算書をExcelでダウンロード",
-                    data=excel_data,
-                    file_name=f'精算書_2025年1月.xlsx',
-                    mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                # 担当者別の合計一覧
+                st.markdown(f"### 担当者別合計（{len(matched_names)}名中 {len(page_names)}名を表示）")
+                st.dataframe(
+                    settlement.totals.loc[page_names].rename_axis('担当者').reset_index(),
+                    column_config={
+                        '担当者': st.column_config.TextColumn('担当者', width=200),
+                        '合計距離(km)': st.column_config.NumberColumn('合計距離(km)', format="%.1f", width=150),
+                        settlement.fee_column: st.column_config.NumberColumn(settlement.fee_column, format="%.0f", width=200),
+                        '運転手当(円)': st.column_config.NumberColumn('運転手当(円)', format="%.0f", width=150),
+                        '合計(円)': st.column_config.NumberColumn('合計(円)', format="%.0f", width=150)
+                    },
+                    hide_index=True
                 )
+                
+                # 選択した担当者の精算書のみ表示
+                if page_names:
+                    name = st.selectbox("担当者を選択", page_names)
+                    title = f"{name}様 {settlement.period_label} 社内通貨（交通費）清算額"
+                    st.markdown(f"### {title}")
+                    
+                    # 担当者の精算書を取得
+                    expense_data = settlement.report(name)
+                    
+                    # 精算書の表示
+                    st.dataframe(
+                        expense_data,
+                        column_config={
+                            '日付': st.column_config.TextColumn('日付', width=120),
+                            '経路': st.column_config.TextColumn('経路', width=600),
+                            '合計距離(km)': st.column_config.NumberColumn(
+                                '合計距離(km)',
+                                format="%.1f",
+                                width=150
+                            ),
+                            settlement.fee_column: st.column_config.NumberColumn(
+                                settlement.fee_column,
+                                format="%.0f",
+                                width=200
+                            ),
+                            '運転手当(円)': st.column_config.NumberColumn(
+                                '運転手当(円)',
+                                format="%.0f",
+                                width=150
+                            ),
+                            '合計(円)': st.column_config.NumberColumn(
+                                '合計(円)',
+                                format="%.0f",
+                                width=150
+                            )
+                        },
+                        hide_index=True,
+                        height=400
+                    )
+                    
+                    # 注釈表示
+                    st.markdown(f"""
+                        <div style='margin-top: 15px; color: #666;'>
+                            ※{settlement.period_label}分給与にて清算しました。
+                        </div>
+                    """, unsafe_allow_html=True)
+                else:
+                    st.info("該当する担当者がいません。")
+                    
+                # 出力ファイル（バックグラウンドで作成し、完成したらダウンロードできる）
+                st.markdown("---")
+                show_exports(profile, fingerprint, policies.key, df, settlement)
 
 if __name__ == "__main__":
     main()
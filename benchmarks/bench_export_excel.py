@@ -0,0 +1,183 @@
+"""export_to_excel の計測
+
+変更前の export_to_excel（通常モードのブックでセルごとに書式オブジェクトを
+作成する方式）、書き込み専用モード＋名前付きスタイルの方式と、テンプレートの
+レイアウトを複製してシートのXMLを直接書き出す現行実装を比較する。
+
+    python -m benchmarks.bench_export_excel [シート数] [シートあたりの行数] [--no-legacy]
+"""
+import sys
+import time
+from io import BytesIO
+
+import openpyxl
+from openpyxl.worksheet.worksheet import Worksheet
+
+from benchmarks.loggen import generate_dataframe
+from pinos.excel import (
+    EXCEL_COLUMN_STYLES, EXCEL_COLUMN_WIDTHS, EXCEL_STYLE_HEADER, EXCEL_STYLE_NOTE, EXCEL_STYLE_TITLE,
+    export_to_excel, register_excel_styles, styled_cell
+)
+from pinos.settlement import create_settlement
+
+
+def legacy_export_to_excel(df, unique_names, settlement):
+    """変更前の export_to_excel（比較用）"""
+    output = BytesIO()
+    workbook = openpyxl.Workbook()
+
+    first_name = unique_names[0]
+    first_sheet = workbook.active
+    first_sheet.title = f"{first_name}様"
+
+    for name in unique_names:
+        if name == first_name:
+            worksheet = first_sheet
+        else:
+            worksheet = workbook.create_sheet(f"{name}様")
+
+        expense_data = settlement.report(name)
+
+        worksheet.page_setup.paperSize = worksheet.PAPERSIZE_A4
+        worksheet.page_setup.orientation = worksheet.ORIENTATION_LANDSCAPE
+
+        worksheet.column_dimensions['A'].width = 15
+        worksheet.column_dimensions['B'].width = 50
+        worksheet.column_dimensions['C'].width = 15
+        worksheet.column_dimensions['D'].width = 25
+        worksheet.column_dimensions['E'].width = 15
+        worksheet.column_dimensions['F'].width = 15
+
+        worksheet.row_dimensions[1].height = 45
+        worksheet.row_dimensions[2].height = 60
+
+        title = f"{name}様 2025年1月 社内通貨（交通費）清算額"
+        worksheet['A1'] = title
+        worksheet.merge_cells('A1:F1')
+        title_cell = worksheet['A1']
+        title_cell.alignment = openpyxl.styles.Alignment(horizontal='center', vertical='center')
+        title_cell.font = openpyxl.styles.Font(size=14, bold=True)
+
+        headers = ['日付', '経路', '合計距離(km)', '交通費（距離×15P）(円)', '運転手当(円)', '合計(円)']
+        for col_idx, header in enumerate(headers, 1):
+            cell = worksheet.cell(row=2, column=col_idx)
+            cell.value = header
+            cell.font = openpyxl.styles.Font(size=11, bold=True)
+            cell.alignment = openpyxl.styles.Alignment(horizontal='center', vertical='center', wrap_text=True)
+            cell.fill = openpyxl.styles.PatternFill(start_color='E0E0E0', end_color='E0E0E0', fill_type='solid')
+
+        for row_idx, row in enumerate(expense_data.values, 3):
+            worksheet.row_dimensions[row_idx].height = 30
+
+            for col_idx, value in enumerate(row, 1):
+                cell = worksheet.cell(row=row_idx, column=col_idx)
+                cell.value = value
+                cell.font = openpyxl.styles.Font(size=11)
+
+                if col_idx in [3, 4, 5, 6]:
+                    cell.alignment = openpyxl.styles.Alignment(horizontal='right', vertical='center')
+                    if col_idx == 3:
+                        cell.number_format = '#,##0.0'
+                    else:
+                        cell.number_format = '#,##0'
+                else:
+                    cell.alignment = openpyxl.styles.Alignment(horizontal='left', vertical='center', wrap_text=True)
+
+        border = openpyxl.styles.Border(
+            left=openpyxl.styles.Side(style='thin'),
+            right=openpyxl.styles.Side(style='thin'),
+            top=openpyxl.styles.Side(style='thin'),
+            bottom=openpyxl.styles.Side(style='thin')
+        )
+
+        for row in worksheet.iter_rows(min_row=2, max_row=len(expense_data.values)+2, min_col=1, max_col=6):
+            for cell in row:
+                cell.border = border
+
+        note_row = len(expense_data) + 4
+        worksheet.row_dimensions[note_row].height = 30
+        note_cell = worksheet[f'A{note_row}']
+        note_cell.value = "※2025年1月分給与にて清算しました。"
+        worksheet.merge_cells(f'A{note_row}:F{note_row}')
+        note_cell.alignment = openpyxl.styles.Alignment(horizontal='left', vertical='center')
+        note_cell.font = openpyxl.styles.Font(size=9)
+
+    workbook.save(output)
+
+    return output.getvalue()
+
+
+def write_only_export_to_excel(df, unique_names, settlement):
+    """書き込み専用モード＋名前付きスタイルの export_to_excel（比較用）"""
+    output = BytesIO()
+    workbook = openpyxl.Workbook(write_only=True)
+    register_excel_styles(workbook)
+    period = settlement.period_label
+
+    for name in unique_names:
+        expense_data = settlement.report(name)
+        worksheet = workbook.create_sheet(f"{name}様")
+        worksheet.page_setup.paperSize = Worksheet.PAPERSIZE_A4
+        worksheet.page_setup.orientation = Worksheet.ORIENTATION_LANDSCAPE
+        for column, width in EXCEL_COLUMN_WIDTHS.items():
+            worksheet.column_dimensions[column].width = width
+
+        worksheet.row_dimensions[1].height = 45
+        worksheet.append([styled_cell(worksheet, f"{name}様 {period} 社内通貨（交通費）清算額", EXCEL_STYLE_TITLE)])
+        worksheet.merged_cells.add('A1:F1')
+        worksheet.row_dimensions[2].height = 60
+        worksheet.append([styled_cell(worksheet, header, EXCEL_STYLE_HEADER) for header in expense_data.columns])
+
+        for row_idx, row in enumerate(expense_data.itertuples(index=False, name=None), 3):
+            worksheet.row_dimensions[row_idx].height = 30
+            worksheet.append([styled_cell(worksheet, value, style) for value, style in zip(row, EXCEL_COLUMN_STYLES)])
+
+        note_row = len(expense_data) + 4
+        worksheet.append([])
+        worksheet.row_dimensions[note_row].height = 30
+        worksheet.append([styled_cell(worksheet, f"※{period}分給与にて清算しました。", EXCEL_STYLE_NOTE)])
+        worksheet.merged_cells.add(f'A{note_row}:F{note_row}')
+
+    workbook.save(output)
+    return output.getvalue()
+
+
+def fresh_settlement(settlement):
+    """作成済みの精算書を使わないよう、同じ明細・合計から新しいSettlementを作成"""
+    return type(settlement)(settlement.rows, settlement.totals, settlement.index, settlement.period)
+
+
+def timeit(label, func):
+    start = time.perf_counter()
+    data = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.3f} s  {len(data) / 1024:10,.0f} KiB")
+    return elapsed
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    sheets = int(args[0]) if len(args) > 0 else 200
+    rows_per_sheet = int(args[1]) if len(args) > 1 else 100
+    df = generate_dataframe(sheets * rows_per_sheet, sheets)
+    settlement = create_settlement(df)
+    names = settlement.names
+    print(f"{sheets} sheets x {rows_per_sheet} rows")
+
+    # 精算書のDataFrameの作成も含めて比較する（現行実装は精算書のDataFrameを作らない）
+    timings = {}
+    if '--no-legacy' not in sys.argv:
+        timings['legacy'] = timeit(
+            'legacy export_to_excel', lambda: legacy_export_to_excel(df, names, fresh_settlement(settlement))
+        )
+    timings['write_only'] = timeit(
+        'write-only export_to_excel', lambda: write_only_export_to_excel(df, names, fresh_settlement(settlement))
+    )
+    current = timeit('export_to_excel', lambda: export_to_excel(df, names, fresh_settlement(settlement)))
+
+    for label, elapsed in timings.items():
+        print(f"speedup vs {label}: x{elapsed / current:.2f}")
+
+
+if __name__ == '__main__':
+    main()
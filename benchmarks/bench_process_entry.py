@@ -0,0 +1,74 @@
+"""process_entry のスループット計測
+
+旧実装（正規表現を順番に実行する方式）と、1回の走査で抽出する現行の
+process_entry / process_entries を合成エントリーで比較する。
+
+    python -m benchmarks.bench_process_entry [件数]
+"""
+import re
+import sys
+import time
+
+from benchmarks.loggen import generate_entries
+from pinos.parser import process_entry, process_entries
+
+
+def legacy_process_entry(text):
+    """変更前の process_entry（比較用）"""
+    name_date_match = re.search(r'【ピノ】\s*([^　\s]+(?:[ 　]+[^　\s]+)*)\s+(\d+/\d+)\s*\([月火水木金土日]\)', text)
+    if not name_date_match:
+        return None
+
+    name = name_date_match.group(1).strip()
+    date = name_date_match.group(2)
+
+    distance_patterns = [
+        r'(\d+\.?\d*)(?:km|㎞|ｋｍ|kｍ)',
+        r'距離[：:]\s*(\d+\.?\d*)',
+        r'合計[：:]\s*(\d+\.?\d*)',
+        r'往復[：:]\s*(\d+\.?\d*)',
+    ]
+
+    distance = None
+    for pattern in distance_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            distance = float(match.group(1))
+            break
+
+    if not distance:
+        return None
+
+    route_text = text[text.find(')')+1:text.find(str(distance))].strip()
+    route = re.sub(r'\s+', ' ', route_text)
+
+    return {
+        'name': name,
+        'date': date,
+        'route': route,
+        'distance': distance
+    }
+
+
+def timeit(label, func, entries):
+    start = time.perf_counter()
+    func(entries)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.3f} s  {len(entries) / elapsed:12,.0f} entries/s")
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    entries = generate_entries(count, 50)
+    print(f"{count:,} entries")
+
+    legacy = timeit('legacy process_entry', lambda xs: [legacy_process_entry(x) for x in xs], entries)
+    single = timeit('process_entry', lambda xs: [process_entry(x) for x in xs], entries)
+    batch = timeit('process_entries (batch)', process_entries, entries)
+
+    print(f"speedup: process_entry x{legacy / single:.2f}, process_entries x{legacy / batch:.2f}")
+
+
+if __name__ == '__main__':
+    main()
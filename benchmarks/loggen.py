@@ -0,0 +1,155 @@
+"""合成LINEトーク履歴の生成
+
+LINEの「トーク履歴を保存」で書き出される形式（日付行・時刻<TAB>送信者<TAB>本文、
+複数行の本文は二重引用符で囲まれる）を模して、【ピノ】投稿と雑談などの
+ノイズ行を混ぜたトーク履歴を生成する。
+
+    python -m benchmarks.loggen [エントリー数] [担当者数] > sample.txt
+"""
+import calendar
+import random
+import sys
+
+WEEKDAYS = '月火水木金土日'
+SURNAMES = [
+    '佐藤', '鈴木', '高橋', '田中', '伊藤', '渡辺', '山本', '中村', '小林', '加藤',
+    '吉田', '山田', '佐々木', '山口', '松本', '井上', '木村', '林', '斎藤', '清水',
+    '山崎', '森', '池田', '橋本', '阿部', '石川', '山下', '中島', '石井', '小川',
+    '前田', '岡田', '長谷川', '藤田', '後藤', '近藤', '村上', '遠藤', '青木', '坂本',
+]
+GIVEN_NAMES = [
+    '太郎', '花子', '一郎', '健', '翔太', '美咲', '大輔', '陽子', '誠', '由美',
+    '拓也', '直子', '浩', '恵', '亮', '愛', '修', '彩', '剛', '香織',
+    '隆', '舞', '学', '優子', '達也', '真理', '豊', '綾', '進', '智子',
+]
+PLACES = [
+    '事務所', '本社', '倉庫', '駅前店', '市役所', '中央病院', '北小学校', '港町', '緑ヶ丘',
+    '旭町', '若葉台', '桜通り', '川口', '東町', '西町', '南団地', '工業団地', '道の駅',
+]
+# 自宅から各場所までの距離(km)（経路の距離はこれを元に少しばらつかせる）
+PLACE_DISTANCES = {place: 3 + (index * 7) % 31 for index, place in enumerate(PLACES)}
+LOG_PERIOD = (2025, 1)  # generate_log()の既定の精算期間（年, 月）、解析時の日付の年の補完に使う
+OUTLIER_RATE = 0.02  # 経路に対して距離が極端な（入力ミスを模した）エントリーの割合
+KM_SPELLINGS = ['km', 'km', 'km', '㎞', 'ｋｍ', 'kｍ']
+DISTANCE_LABELS = ['距離：', '距離:', '合計：', '往復：']
+NOISE_MESSAGES = [
+    'お疲れ様です', '了解しました', 'よろしくお願いします', '本日は直帰します',
+    '[スタンプ]', '[写真]', '明日の予定を共有します', 'ありがとうございます',
+    '渋滞のため少し遅れます', '今月分の提出お願いします',
+]
+NOISE_KM_MESSAGES = ['高速が事故で5km渋滞しています', '迂回したので10kmくらい余計に走りました']
+
+
+def employee_names(count, seed=0):
+    """担当者名を生成（半角・全角スペース区切りと区切りなしを混在させる）"""
+    rng = random.Random(seed)
+    pairs = [(surname, given) for surname in SURNAMES for given in GIVEN_NAMES]
+    rng.shuffle(pairs)
+    if count > len(pairs):
+        raise ValueError(f"担当者数は{len(pairs)}人までです")
+    separators = [' ', ' ', '　', '']
+    return [surname + rng.choice(separators) + given for surname, given in pairs[:count]]
+
+
+def route_distance(stops):
+    """経路の標準的な距離(km)（自宅から経由地を順に回って自宅に戻る）"""
+    points = [0, *(PLACE_DISTANCES[stop] for stop in stops), 0]
+    return sum(abs(a - b) + 2 for a, b in zip(points, points[1:]))
+
+
+def generate_records(entries, employees, seed=0, year=2025, month=1):
+    """エントリーの元データ（担当者・日付・曜日・経路・距離の表記）を生成"""
+    rng = random.Random(seed)
+    outlier_rng = random.Random(seed + 2)
+    names = employee_names(employees, seed)
+    days = calendar.monthrange(year, month)[1]
+    records = []
+    for i in range(entries):
+        # 全員に1件以上割り当て、残りは無作為に割り当てる
+        name = names[i] if i < len(names) else rng.choice(names)
+        day = rng.randint(1, days)
+        stops = rng.sample(PLACES, rng.randint(1, 3))
+        route = '→'.join(['自宅', *stops, '自宅'])
+        # 経路の標準距離から±5%ばらつかせ、一部は桁違いの入力ミスにする
+        variation = 0.95 + 0.1 * (rng.uniform(1, 80) - 1) / 79
+        if outlier_rng.random() < OUTLIER_RATE:
+            variation *= outlier_rng.choice([0.1, 3, 10])
+        distance = round(route_distance(stops) * variation, rng.choice([0, 1, 1]))
+        if rng.random() < 0.15:
+            distance_text = f"{rng.choice(DISTANCE_LABELS)}{distance:g}"
+        else:
+            distance_text = f"{distance:g}{rng.choice(KM_SPELLINGS)}"
+        records.append({
+            'name': name,
+            'day': day,
+            'date': f"{month}/{day}",
+            'weekday': WEEKDAYS[calendar.weekday(year, month, day)],
+            'route': route,
+            'distance_text': distance_text,
+        })
+    return records
+
+
+def entry_lines(record):
+    """1件の【ピノ】投稿を本文の行に変換"""
+    header = f"【ピノ】{record['name']} {record['date']}({record['weekday']})"
+    body = f"{record['route']} {record['distance_text']}"
+    # 「距離：」などのラベル表記は距離の目印（km）を含まないため見出し行に続けて書く
+    if record['distance_text'][0].isdigit():
+        return [header, body]
+    return [f"{header} {body}"]
+
+
+def generate_entries(entries, employees, seed=0):
+    """解析前の結合済みエントリー文字列（process_entryの入力）を生成"""
+    return [''.join(entry_lines(record)) for record in generate_records(entries, employees, seed)]
+
+
+def generate_log(entries, employees, seed=0, noise=0.2, year=2025, month=1):
+    """LINEトーク履歴のテキストを生成（noiseは投稿1件あたりの雑談の割合）"""
+    rng = random.Random(seed + 1)
+    records = sorted(generate_records(entries, employees, seed, year, month), key=lambda record: record['day'])
+    lines = [
+        '[LINE] ピノ交通費のトーク履歴',
+        f"保存日時：{year}/{month:02d}/{calendar.monthrange(year, month)[1]} 23:59",
+        '',
+    ]
+    current_day = None
+    for record in records:
+        if record['day'] != current_day:
+            current_day = record['day']
+            lines.append('')
+            lines.append(f"{year}/{month:02d}/{current_day:02d}({record['weekday']})")
+        sender = record['name'].replace(' ', '').replace('　', '')
+        time = f"{rng.randint(7, 20):02d}:{rng.randint(0, 59):02d}"
+
+        body = entry_lines(record)
+        if len(body) == 1:
+            lines.append(f"{time}\t{sender}\t{body[0]}")
+        else:
+            lines.append(f'{time}\t{sender}\t"{body[0]}')
+            lines.extend(body[1:-1])
+            lines.append(f'{body[-1]}"')
+
+        # 雑談・スタンプなどのノイズ行
+        while rng.random() < noise:
+            message = rng.choice(NOISE_KM_MESSAGES) if rng.random() < 0.05 else rng.choice(NOISE_MESSAGES)
+            lines.append(f"{time}\t{rng.choice(records)['name']}\t{message}")
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def generate_dataframe(entries, employees, seed=0):
+    """合成トーク履歴を解析済みデータ（DataFrame）に変換"""
+    from pinos.parser import parse_expense_data
+
+    return parse_expense_data(generate_log(entries, employees, seed), period=LOG_PERIOD)
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    employees = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    sys.stdout.write(generate_log(entries, employees))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+"""パイプライン各段階の計測とリグレッション検出
+
+合成トーク履歴（benchmarks.loggen）を使い、解析から各形式の出力までの段階ごとに
+処理時間とメモリ使用量のピーク（tracemalloc）を、エントリー数 × 担当者数の
+組み合わせで計測する。基準値は benchmarks/baseline.json に保存し、--check では
+基準値より閾値を超えて遅くなった（メモリが増えた）段階があれば終了コード1を返す。
+基準値は計測したマシンに依存するため、比較するマシンで保存し直すこと。
+
+    python -m benchmarks.suite                   # 全ケース（1k/10k/100k件 × 10/100/1000人）
+    python -m benchmarks.suite --quick           # 1k/10k件 × 10/100人のみ
+    python -m benchmarks.suite --stages parse export_to_excel
+    python -m benchmarks.suite --save-baseline   # 結果を基準値として保存
+    python -m benchmarks.suite --check           # 基準値と比較
+"""
+import argparse
+from datetime import date
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.loggen import LOG_PERIOD, generate_entries, generate_log
+
+ENTRY_SIZES = (1_000, 10_000, 100_000)
+EMPLOYEE_SIZES = (10, 100, 1_000)
+QUICK_ENTRY_SIZES = (1_000, 10_000)
+QUICK_EMPLOYEE_SIZES = (10, 100)
+BASELINE_PATH = Path(__file__).with_name('baseline.json')
+DEFAULT_THRESHOLD = 0.25  # 基準値からの許容増加率
+MIN_SECONDS_DELTA = 0.05  # これより小さい差は計測誤差として扱う
+MIN_PEAK_MIB_DELTA = 1.0
+MAX_IMAGE_ROWS = 1_000  # 1人あたりの行数がこれを超えるケースは画像を描画しない（キャンバスが巨大になるため）
+
+
+class Case:
+    """1つの計測ケース（エントリー数 × 担当者数）の入力データ（必要になった時点で作成）"""
+
+    def __init__(self, entries, employees, seed=0):
+        self.entries = entries
+        self.employees = employees
+        self.seed = seed
+        self._text = None
+        self._entry_texts = None
+        self._df = None
+        self._settlement = None
+
+    @property
+    def key(self):
+        return f"{self.entries}x{self.employees}"
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = generate_log(self.entries, self.employees, self.seed)
+        return self._text
+
+    @property
+    def entry_texts(self):
+        if self._entry_texts is None:
+            self._entry_texts = generate_entries(self.entries, self.employees, self.seed)
+        return self._entry_texts
+
+    @property
+    def df(self):
+        if self._df is None:
+            from pinos.parser import parse_expense_data
+            self._df = parse_expense_data(self.text, period=LOG_PERIOD)
+        return self._df
+
+    @property
+    def settlement(self):
+        if self._settlement is None:
+            from pinos.settlement import create_settlement
+            self._settlement = create_settlement(self.df)
+        return self._settlement
+
+
+def stage_parse(case):
+    from pinos.parser import parse_expense_data
+    text = case.text
+    return lambda: parse_expense_data(text, period=LOG_PERIOD)
+
+
+def stage_process_entry(case):
+    from pinos.parser import process_entry
+    entry_texts = case.entry_texts
+    return lambda: [process_entry(text) for text in entry_texts]
+
+
+def stage_find_duplicates(case):
+    from pinos.dedup import find_duplicates
+    df = case.df
+    return lambda: find_duplicates(df)
+
+
+def stage_check_distances(case):
+    from pinos.routes import RouteIndex
+    df = case.df
+    index = RouteIndex()
+    index.update(df)
+    return lambda: index.check(df)
+
+
+def stage_create_settlement(case):
+    from pinos.settlement import create_settlement
+    df = case.df
+    return lambda: create_settlement(df)
+
+
+def stage_recalculate(case):
+    from pinos.policy import PolicyTable, RatePolicy
+    from pinos.settlement import recalculate
+    df = case.df
+    # 期間の途中で単価・運転手当・締め日が変わる設定表で再計算する
+    policies = PolicyTable([
+        RatePolicy(date(2000, 1, 1)),
+        RatePolicy(date(2025, 1, 10), rate_per_km=18, daily_allowance=250, closing_day=20),
+    ])
+    return lambda: recalculate(df, policies)
+
+
+def stage_report(case):
+    from pinos.settlement import Settlement
+    settlement = case.settlement
+
+    def run():
+        # 作成済みの精算書を使わないよう、毎回新しいSettlementで全員分を作成する
+        fresh = Settlement(settlement.rows, settlement.totals, settlement.index)
+        return [fresh.report(name) for name in fresh.names]
+    return run
+
+
+def stage_export_to_excel(case):
+    from pinos.excel import export_to_excel
+    df, settlement = case.df, case.settlement
+    return lambda: export_to_excel(df, settlement.names, settlement)
+
+
+def stage_export_to_pdf(case):
+    from pinos.pdf import export_to_pdf
+    df, settlement = case.df, case.settlement
+    return lambda: export_to_pdf(df, settlement.names, settlement)
+
+
+def stage_render_expense_image(case):
+    from pinos.image import render_expense_image
+    settlement = case.settlement
+    if max(stop - start for start, stop in settlement.index.values()) > MAX_IMAGE_ROWS:
+        return None
+    reports = [(name, settlement.report(name)) for name in settlement.names]
+    return lambda: [render_expense_image(name, report) for name, report in reports]
+
+
+# 段階名 -> 計測対象を作成する関数（Noneを返した場合はそのケースを計測しない）
+STAGES = {
+    'parse': stage_parse,
+    'process_entry': stage_process_entry,
+    'find_duplicates': stage_find_duplicates,
+    'check_distances': stage_check_distances,
+    'create_settlement': stage_create_settlement,
+    'recalculate': stage_recalculate,
+    'report': stage_report,
+    'export_to_excel': stage_export_to_excel,
+    'export_to_pdf': stage_export_to_pdf,
+    'render_expense_image': stage_render_expense_image,
+}
+
+
+def measure(run, repeat=1, memory=True):
+    """処理時間（repeat回の最小値）とメモリ使用量のピーク(MiB)を計測"""
+    seconds = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    peak_mib = None
+    if memory:
+        # tracemallocは処理を遅くするため、時間とは別に1回だけ実行する
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            peak_mib = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return {'seconds': round(seconds, 4), 'peak_mib': None if peak_mib is None else round(peak_mib, 2)}
+
+
+def warm_up():
+    """ライブラリの読み込みと初回呼び出しの準備を計測の前に済ませる"""
+    case = Case(10, 2)
+    case.settlement.report(case.settlement.names[0])
+
+
+def run_suite(entry_sizes, employee_sizes, stages, repeat=1, memory=True):
+    """全ケース・全段階を計測して {"段階/エントリー数x担当者数": 結果} を返す"""
+    warm_up()
+    results = {}
+    for entries in entry_sizes:
+        for employees in employee_sizes:
+            case = Case(entries, employees)
+            for stage in stages:
+                run = STAGES[stage](case)
+                key = f"{stage}/{case.key}"
+                if run is None:
+                    print(f"{key:<40} skipped", flush=True)
+                    continue
+                results[key] = measure(run, repeat, memory)
+                peak = results[key]['peak_mib']
+                peak_text = '' if peak is None else f"{peak:10,.1f} MiB"
+                print(f"{key:<40} {results[key]['seconds']:9.3f} s {peak_text}", flush=True)
+    return results
+
+
+def load_baseline(path):
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding='utf-8')).get('results', {})
+
+
+def save_baseline(path, results):
+    """計測結果を基準値として保存（計測しなかったケースの既存の基準値は残す）"""
+    baseline = load_baseline(path)
+    baseline.update(results)
+    data = {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+        },
+        'results': dict(sorted(baseline.items())),
+    }
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2) + '\n', encoding='utf-8')
+
+
+def find_regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """基準値より閾値を超えて悪化した段階の一覧（説明文）を返す"""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        limits = [('seconds', 's', MIN_SECONDS_DELTA), ('peak_mib', 'MiB', MIN_PEAK_MIB_DELTA)]
+        for metric, unit, min_delta in limits:
+            value, base_value = result.get(metric), base.get(metric)
+            if value is None or base_value is None:
+                continue
+            if value > base_value * (1 + threshold) and value - base_value > min_delta:
+                regressions.append(
+                    f"{key}: {metric} {base_value:,.3f} -> {value:,.3f} {unit} (x{value / base_value:.2f})"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite', description='パイプライン各段階の計測')
+    parser.add_argument('--entries', type=int, nargs='+', help=f"エントリー数（既定: {ENTRY_SIZES}）")
+    parser.add_argument('--employees', type=int, nargs='+', help=f"担当者数（既定: {EMPLOYEE_SIZES}）")
+    parser.add_argument('--quick', action='store_true', help='小さいケースのみ計測')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--repeat', type=int, default=1, help='処理時間の計測回数（最小値を採用）')
+    parser.add_argument('--no-memory', action='store_true', help='メモリ使用量を計測しない')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='結果を基準値として保存')
+    parser.add_argument('--check', action='store_true', help='基準値と比較し、悪化していれば終了コード1')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='許容する増加率（既定: 0.25）')
+    args = parser.parse_args(argv)
+
+    entry_sizes = args.entries or (QUICK_ENTRY_SIZES if args.quick else ENTRY_SIZES)
+    employee_sizes = args.employees or (QUICK_EMPLOYEE_SIZES if args.quick else EMPLOYEE_SIZES)
+    results = run_suite(entry_sizes, employee_sizes, args.stages, args.repeat, not args.no_memory)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f"saved baseline: {args.baseline}")
+
+    if args.check:
+        baseline = load_baseline(args.baseline)
+        missing = [key for key in results if key not in baseline]
+        if missing:
+            print(f"no baseline for {len(missing)} case(s): {', '.join(missing)}")
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f"REGRESSION (threshold +{args.threshold:.0%}):")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"no regressions (threshold +{args.threshold:.0%})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
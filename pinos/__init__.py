@@ -0,0 +1,51 @@
+"""PINO精算の解析・精算・出力処理（Streamlitに依存しない）
+
+pandas・openpyxlなどは属性を参照した時点で読み込むため、
+``import pinos`` 自体は軽量です。
+"""
+import importlib
+
+# 公開する関数・クラスと定義モジュール
+LAZY_ATTRIBUTES = {
+    'EntryCache': 'parser',
+    'parse_expense_data': 'parser',
+    'parse_expense_stream': 'parser',
+    'dataframe_fingerprint': 'parser',
+    'find_duplicates': 'dedup',
+    'drop_duplicates': 'dedup',
+    'route_key': 'routes',
+    'RouteIndex': 'routes',
+    'Settlement': 'settlement',
+    'create_settlement': 'settlement',
+    'split_settlements': 'settlement',
+    'recalculate': 'settlement',
+    'diff_settlements': 'settlement',
+    'compare_policies': 'settlement',
+    'RATE_PER_KM': 'policy',
+    'DAILY_ALLOWANCE': 'policy',
+    'RatePolicy': 'policy',
+    'PolicyTable': 'policy',
+    'load_policies': 'policy',
+    'export_to_excel': 'excel',
+    'export_to_pdf': 'pdf',
+    'export_bundle': 'bundle',
+    'render_expense_image': 'image',
+    'EntryStore': 'store',
+    'ExportQueue': 'jobs',
+    'Profile': 'instrument',
+    'profiling': 'instrument',
+}
+
+__all__ = list(LAZY_ATTRIBUTES)
+
+def __getattr__(name):
+    """公開属性を初回参照時に定義モジュールから読み込む"""
+    module_name = LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
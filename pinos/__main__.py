@@ -0,0 +1,6 @@
+"""python -m pinos でコマンドラインから実行"""
+import sys
+
+from .cli import main
+
+sys.exit(main())
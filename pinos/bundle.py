@@ -0,0 +1,91 @@
+"""担当者ごとの精算書ファイルをまとめたZIPの出力"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from io import BytesIO
+import os
+import re
+import zipfile
+
+from .instrument import stage
+
+# ZIPに含められるファイル形式
+BUNDLE_FORMATS = ('xlsx', 'pdf', 'png')
+# ZIP内のファイル名に使えない文字（パス区切り・Windowsで使えない記号・制御文字）
+MEMBER_NAME_PATTERN = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+def member_stem(name, used):
+    """担当者名からZIP内のファイル名（拡張子を除く）を作成（使えない文字・「..」は置き換え、重複は番号を付ける）"""
+    base = MEMBER_NAME_PATTERN.sub('_', f"{name}様_精算書").replace('..', '_').strip(' .')
+    stem = base
+    suffix = 1
+    while stem.lower() in used:
+        suffix += 1
+        stem = f"{base}_{suffix}"
+    used.add(stem.lower())
+    return stem
+
+def member_stems(unique_names):
+    """担当者名 -> ZIP内のファイル名（拡張子を除く、担当者ごとに重複しない）"""
+    used = set()
+    return {name: member_stem(name, used) for name in unique_names}
+
+def render_person_files(name, expense_data, formats=('xlsx',), stem=None):
+    """担当者1人分の精算書ファイルを作成（プロセスプールのワーカーで実行、stemはZIP内のファイル名）"""
+    stem = stem or member_stem(name, set())
+    # 出力する形式のライブラリだけを読み込む
+    files = []
+    if 'xlsx' in formats:
+        from .excel import export_person_excel
+        files.append((f"{stem}.xlsx", export_person_excel(name, expense_data)))
+    if 'pdf' in formats:
+        from .pdf import create_pdf
+        files.append((f"{stem}.pdf", create_pdf(expense_data, name).getvalue()))
+    if 'png' in formats:
+        from .image import render_expense_image
+        files.append((f"{stem}.png", render_expense_image(name, expense_data)))
+    return files
+
+def iter_person_files(settlement, unique_names, formats=('xlsx',), max_workers=None):
+    """担当者ごとの精算書ファイルを完成した順に生成"""
+    max_workers = max_workers or os.cpu_count() or 1
+    stems = member_stems(unique_names)
+    
+    # 1プロセスで足りる場合はプールを起動しない
+    if max_workers == 1 or len(unique_names) <= 1:
+        for name in unique_names:
+            yield from render_person_files(name, settlement.report(name), formats, stems[name])
+        return
+        
+    # 処理中の担当者数をワーカー数の2倍までに制限し、完成したファイルから順に返す
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for name in unique_names:
+            pending.add(executor.submit(render_person_files, name, settlement.report(name), formats, stems[name]))
+            if len(pending) >= max_workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        for future in as_completed(pending):
+            yield from future.result()
+
+@stage('export_bundle', rows=lambda args, data: len(args[0]))
+def export_bundle(df, unique_names, settlement=None, formats=('xlsx',), max_workers=None, progress=None):
+    """担当者ごとの精算書ファイルと集計表をZIPにまとめて出力（progressは進捗の通知先）"""
+    unknown = set(formats) - set(BUNDLE_FORMATS)
+    if unknown:
+        raise ValueError(f"未対応のファイル形式です: {', '.join(sorted(unknown))}")
+    from .excel import export_summary_excel
+    from .settlement import create_settlement
+    if settlement is None:
+        settlement = create_settlement(df)
+        
+    output = BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        # 完成したファイルはすぐにアーカイブへ書き込み、手元に溜めない
+        total = len(unique_names) * len(formats)
+        for done, (filename, data) in enumerate(iter_person_files(settlement, unique_names, formats, max_workers), 1):
+            archive.writestr(filename, data)
+            if progress is not None:
+                progress(done, total)
+        archive.writestr("集計.xlsx", export_summary_excel(settlement.totals.loc[list(unique_names)]))
+        
+    return output.getvalue()
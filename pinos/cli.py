@@ -0,0 +1,249 @@
+"""コマンドラインからの一括精算（pinosコマンド）"""
+import argparse
+from contextlib import nullcontext
+import json
+from pathlib import Path
+import sys
+
+from .instrument import profiling
+
+# 出力できるファイル形式（zipは担当者ごとの精算書をまとめたもの）
+OUTPUT_FORMATS = ('xlsx', 'pdf', 'zip')
+# 精算前に除外する重複エントリー（keep: 除外しない、exact: 完全一致のみ、all: 類似したものも含む）
+DUPLICATE_MODES = ('keep', 'exact', 'all')
+INPUT_SUFFIX = '.txt'
+ANOMALY_REPORT_LIMIT = 20  # 距離の外れ値として表示するエントリー番号の最大数
+INPUT_ENCODING = 'utf-8-sig'  # LINEのトーク履歴はBOM付きで保存される場合がある
+
+def build_parser():
+    """コマンドライン引数の定義を作成"""
+    from .bundle import BUNDLE_FORMATS
+    
+    parser = argparse.ArgumentParser(
+        prog='pinos',
+        description='LINEトーク履歴から交通費の精算書を作成します。'
+    )
+    parser.add_argument(
+        'inputs', nargs='+', type=Path, metavar='INPUT',
+        help='トーク履歴のテキストファイル、またはそれを含むディレクトリ（*.txt）'
+    )
+    parser.add_argument(
+        '-o', '--output-dir', type=Path, default=Path('.'),
+        help='出力先ディレクトリ（既定: カレントディレクトリ）'
+    )
+    parser.add_argument(
+        '-f', '--format', dest='formats', action='append', choices=OUTPUT_FORMATS,
+        help='出力形式（複数指定可、既定: xlsx）'
+    )
+    parser.add_argument(
+        '--bundle-format', dest='bundle_formats', action='append', choices=BUNDLE_FORMATS,
+        help='zipに含める担当者ごとのファイル形式（複数指定可、既定: xlsx）'
+    )
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help='zip作成時のワーカープロセス数（既定: CPU数）'
+    )
+    parser.add_argument(
+        '--encoding', default=INPUT_ENCODING,
+        help=f'入力ファイルの文字コード（既定: {INPUT_ENCODING}）'
+    )
+    parser.add_argument(
+        '--duplicates', choices=DUPLICATE_MODES, default='exact',
+        help='精算前に除外する重複エントリー（keep: 除外しない、exact: 完全一致のみ、all: 類似したものも含む、既定: exact）'
+    )
+    parser.add_argument(
+        '--period', type=parse_period, metavar='YYYY-MM',
+        help='精算期間（この精算期間のエントリーだけを精算する、既定: 精算期間ごとに出力し、日付の年は今月から補完する）'
+    )
+    parser.add_argument(
+        '--policy', type=Path, metavar='PATH',
+        help='単価・運転手当・締め日の設定表（effective_from,rate_per_km,daily_allowance,closing_day列のCSV）'
+    )
+    parser.add_argument(
+        '--store', type=Path, metavar='PATH',
+        help='解析したエントリーを保存するSQLiteファイル（同じエントリーは重複して保存しない）'
+    )
+    parser.add_argument(
+        '--profile', type=Path, metavar='PATH',
+        help='処理段階ごとの計測結果の出力先（.csvは追記、それ以外はJSON）'
+    )
+    parser.add_argument(
+        '--profile-memory', action='store_true',
+        help='計測時にメモリ使用量のピークも記録する（処理が遅くなります）'
+    )
+    return parser
+
+def write_profiles(path, profiles):
+    """入力ファイルごとの計測結果を書き出す（CSVは既存のログに追記）"""
+    if path.suffix.lower() == '.csv':
+        header = not path.exists() or path.stat().st_size == 0
+        with open(path, 'a', encoding='utf-8', newline='') as log:
+            for input_path, profile in profiles:
+                log.write(profile.to_csv(header=header, input=str(input_path)))
+                header = False
+    else:
+        data = [json.loads(profile.to_json(input=str(input_path))) for input_path, profile in profiles]
+        path.write_text(json.dumps(data, ensure_ascii=False, indent=2) + '\n', encoding='utf-8')
+
+def parse_period(text):
+    """「YYYY-MM」形式の精算期間を(年, 月)に変換"""
+    try:
+        year, month = map(int, text.split('-'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"精算期間はYYYY-MM形式で指定してください: {text}") from None
+    if not 1 <= month <= 12:
+        raise argparse.ArgumentTypeError(f"月が正しくありません: {text}")
+    return year, month
+
+def expand_inputs(inputs):
+    """入力パスを展開（ディレクトリは直下の*.txtを名前順に並べる）"""
+    paths = []
+    for path in inputs:
+        if path.is_dir():
+            paths.extend(sorted(p for p in path.iterdir() if p.suffix == INPUT_SUFFIX and p.is_file()))
+        else:
+            paths.append(path)
+    return paths
+
+def remove_duplicates(path, df, duplicates, mode):
+    """検出した重複エントリーを報告し、modeに応じて除外したデータを返す"""
+    from .dedup import DUPLICATE_EXACT, DUPLICATE_NEAR, drop_duplicates
+    
+    if duplicates.empty:
+        return df
+    counts = duplicates['kind'].value_counts()
+    exact, near = counts.get(DUPLICATE_EXACT, 0), counts.get(DUPLICATE_NEAR, 0)
+    kinds, note = {
+        'keep': ((), "除外していません"),
+        'exact': ((DUPLICATE_EXACT,), "完全一致のみ除外しました"),
+        'all': ((DUPLICATE_EXACT, DUPLICATE_NEAR), "すべて除外しました"),
+    }[mode]
+    print(f"pinos: {path}: 重複エントリー 完全一致{exact}件・類似{near}件（{note}）", file=sys.stderr)
+    return drop_duplicates(df, duplicates, kinds)
+
+def report_invalid_dates(path, df):
+    """日付が正しくないため解析時に除外したエントリーを報告"""
+    from .parser import format_invalid_dates, invalid_dates
+    
+    skipped = invalid_dates(df)
+    if skipped:
+        print(f"pinos: {path}: 日付が正しくないエントリー {len(skipped)}件を除外しました（{format_invalid_dates(skipped)}）", file=sys.stderr)
+
+def report_distance_anomalies(path, df, index):
+    """経路ごとの距離の中央値から大きく外れたエントリーを報告"""
+    check = index.check(df)
+    ids = df.loc[check['distance_anomaly'], 'id'].tolist()
+    if ids:
+        listed = ', '.join(map(str, ids[:ANOMALY_REPORT_LIMIT])) + (' ...' if len(ids) > ANOMALY_REPORT_LIMIT else '')
+        print(f"pinos: {path}: 距離が経路の中央値から大きく外れているエントリー {len(ids)}件（No. {listed}）", file=sys.stderr)
+
+def process_file(
+    path, output_dir, formats, bundle_formats, jobs, encoding, cache,
+    store=None, period=None, duplicates='exact', policies=None
+):
+    """1つのトーク履歴を解析し、精算書を出力先に書き出す（書き出したパスの一覧を返す）"""
+    # pandas・openpyxlなどは実際にファイルを処理する時点で読み込む
+    from .dedup import find_duplicates
+    from .parser import parse_expense_stream
+    from .policy import current_period
+    from .settlement import create_settlement, split_settlements
+    from .store import period_key
+    
+    # 精算期間を指定しない場合は、アプリと同じく今月の精算期間で日付の年を補完する
+    resolve_period = period or current_period()
+    with open(path, encoding=encoding) as lines:
+        df = parse_expense_stream(lines, cache=cache, period=resolve_period)
+    report_invalid_dates(path, df)
+    if df.empty:
+        return []
+    detected = find_duplicates(df)
+    if store is not None:
+        # 保存済みデータの経路ごとの距離と比較してから保存する（重複エントリーは種類を記録して保存する）
+        report_distance_anomalies(path, df, store.route_index())
+        store.upsert(df, *resolve_period, source=str(path), duplicates=detected)
+    df = remove_duplicates(path, df, detected, duplicates)
+    
+    # 精算期間を指定した場合はその精算期間のエントリーだけを、指定しない場合は精算期間ごとに精算する
+    if period is None:
+        settlements = split_settlements(df, policies)
+    else:
+        settlements = {period: create_settlement(df, policies, period)}
+        excluded = settlements[period].excluded
+        if excluded:
+            print(f"pinos: {path}: {period_key(*period)}の精算期間に含まれないエントリー {excluded}件は精算していません", file=sys.stderr)
+            
+    written = []
+    for settlement_period, settlement in settlements.items():
+        names = settlement.names
+        if not names:
+            continue
+        # 複数の精算期間にまたがる場合はファイル名に精算期間を付ける
+        stem = f"{path.stem}_精算書_{period_key(*settlement_period)}" if len(settlements) > 1 else f"{path.stem}_精算書"
+        for output_format in formats:
+            if output_format == 'xlsx':
+                from .excel import export_to_excel
+                data = export_to_excel(df, names, settlement)
+            elif output_format == 'pdf':
+                from .pdf import export_to_pdf
+                data = export_to_pdf(df, names, settlement)
+            else:
+                from .bundle import export_bundle
+                data = export_bundle(df, names, settlement, formats=bundle_formats, max_workers=jobs)
+            output_path = output_dir / f"{stem}.{output_format}"
+            output_path.write_bytes(data)
+            written.append(output_path)
+            
+    return written
+
+def main(argv=None):
+    """pinosコマンドのエントリーポイント（終了コードを返す）"""
+    args = build_parser().parse_args(argv)
+    formats = tuple(dict.fromkeys(args.formats or ['xlsx']))
+    bundle_formats = tuple(dict.fromkeys(args.bundle_formats or ['xlsx']))
+    
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        print("pinos: 入力ファイルが見つかりません", file=sys.stderr)
+        return 1
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    
+    # 同じエントリーを含むトーク履歴が続く場合に解析結果を使い回す
+    from .parser import EntryCache
+    cache = EntryCache()
+    # 単価・運転手当の設定表（未指定の場合はPINOS_POLICY_PATHのCSV、なければ既定の設定）
+    from .policy import POLICY_PATH, default_policies, load_policies
+    try:
+        policies = load_policies(args.policy) if args.policy else default_policies()
+    except (OSError, UnicodeDecodeError, ValueError) as error:
+        print(f"pinos: {args.policy or POLICY_PATH}: {error}", file=sys.stderr)
+        return 1
+    store = None
+    if args.store:
+        from .store import EntryStore
+        store = EntryStore(args.store)
+        
+    failed = 0
+    profiles = []
+    for path in paths:
+        try:
+            # 計測する場合は入力ファイルごとに結果をまとめる
+            with profiling(memory=args.profile_memory) if args.profile else nullcontext() as profile:
+                written = process_file(
+                    path, args.output_dir, formats, bundle_formats, args.jobs, args.encoding, cache,
+                    store, args.period, args.duplicates, policies
+                )
+        except (OSError, UnicodeDecodeError, ValueError) as error:
+            print(f"pinos: {path}: {error}", file=sys.stderr)
+            failed += 1
+            continue
+        if profile is not None:
+            profiles.append((path, profile))
+        if not written:
+            print(f"pinos: {path}: 精算対象のエントリーがありません", file=sys.stderr)
+            continue
+        for output_path in written:
+            print(output_path)
+            
+    if args.profile and profiles:
+        write_profiles(args.profile, profiles)
+    return 1 if failed else 0
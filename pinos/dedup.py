@@ -0,0 +1,100 @@
+"""重複エントリーの検出（同じ投稿の再投稿・重複したトーク履歴の取り込み）"""
+from bisect import bisect_left, bisect_right
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+from .instrument import stage
+from .parser import entry_distances
+from .routes import route_key
+
+# 類似した重複とみなす条件（経由地の数が同じで、各経由地の表記が似ていて、距離の差が小さい）
+NEAR_DUPLICATE_PLACE_RATIO = 0.75     # 経由地の表記の類似度（0〜1）
+NEAR_DUPLICATE_SUBSTRING_MIN = 2      # 一方の表記が他方に含まれる場合に類似とみなす短い方の最小文字数
+NEAR_DUPLICATE_SUBSTRING_RATIO = 0.5  # 同じく短い方と長い方の文字数の比の下限（「本社」と「本社ビル」まで）
+NEAR_DUPLICATE_DISTANCE_RATIO = 0.05  # 距離の差の許容割合
+NEAR_DUPLICATE_DISTANCE_MIN = 0.5     # 距離の差の許容値の下限(km)
+
+# 検出結果の列
+DUPLICATE_COLUMNS = ['id', 'duplicate_of', 'kind', 'similarity']
+DUPLICATE_EXACT = 'exact'
+DUPLICATE_NEAR = 'near'
+
+def distance_tolerance(distance):
+    """距離の差の許容値(km)"""
+    return max(NEAR_DUPLICATE_DISTANCE_MIN, NEAR_DUPLICATE_DISTANCE_RATIO * distance)
+
+@lru_cache(maxsize=65536)
+def similar_place(a, b):
+    """経由地の表記が似ているか（「本社」と「本社ビル」、1文字の誤字など、空の表記は似ていないとする）"""
+    if not a or not b:
+        return False
+    if a == b:
+        return True
+    shorter, longer = sorted((a, b), key=len)
+    if shorter in longer:
+        # 「駅」と「駅前店」のように短い表記が長い表記の一部なだけの場合は別の場所とする
+        return len(shorter) >= NEAR_DUPLICATE_SUBSTRING_MIN and len(shorter) >= NEAR_DUPLICATE_SUBSTRING_RATIO * len(longer)
+    if 2 * min(len(a), len(b)) < NEAR_DUPLICATE_PLACE_RATIO * (len(a) + len(b)):
+        return False  # 文字数の差だけで類似度が足りない
+    return SequenceMatcher(None, a, b).ratio() >= NEAR_DUPLICATE_PLACE_RATIO
+
+def similar_route(a, b):
+    """経由地の数が同じ経路どうしで、すべての経由地の表記が似ているか"""
+    return all(similar_place(place_a, place_b) for place_a, place_b in zip(a, b))
+
+@stage('find_duplicates', rows=lambda args, duplicates: len(args[0]))
+def find_duplicates(df):
+    """重複エントリーを検出（2件目以降の行を、最初の行のidと種類・経路の類似度と共に返す）
+    
+    完全な重複は担当者・日付・正規化した経路・距離のハッシュで検出し、類似した重複は
+    同じ担当者・日付・経由地の数の中で距離が近い経路とのみ比較するため、全体の件数にほぼ比例した時間で終わる。
+    """
+    import pandas as pd
+    
+    exact = {}   # (担当者, 日付, 経路キー, 距離) -> 最初のid
+    blocks = {}  # (担当者, 日付, 経由地の数) -> ([距離, ...], [(id, 経路キー, 経由地, 許容値), ...])（距離順）
+    duplicates = []
+    
+    # 担当者・日付は比較にのみ使うので、カテゴリのコード・整数値にして高速に比較する
+    names = df['name'].astype('category').cat.codes.tolist()
+    dates = df['date'].to_numpy().view('int64').tolist()
+    columns = [names, dates, df['id'].tolist(), df['route'].tolist(), entry_distances(df).tolist()]
+    for name, date, entry_id, route, distance in zip(*columns):
+        key = route_key(route)
+        first = exact.setdefault((name, date, key, distance), entry_id)
+        if first != entry_id:
+            duplicates.append((entry_id, first, DUPLICATE_EXACT, 1.0))
+            continue
+            
+        # 経路のないエントリーは比べる経由地がないため、類似した重複とはみなさない
+        if not key:
+            continue
+            
+        # 同じ担当者・日付・経由地の数で、距離の差が許容値以内の経路とのみ比較する
+        places = key.split('→')
+        distances, entries = blocks.setdefault((name, date, len(places)), ([], []))
+        tolerance = distance_tolerance(distance)
+        low = bisect_left(distances, distance - tolerance)
+        high = bisect_right(distances, max(distance + tolerance, distance / (1 - NEAR_DUPLICATE_DISTANCE_RATIO)))
+        for index in range(low, high):
+            other_id, other_key, other_places, other_tolerance = entries[index]
+            difference = abs(distance - distances[index])
+            if difference > tolerance and difference > other_tolerance:
+                continue
+            if similar_route(places, other_places):
+                ratio = SequenceMatcher(None, other_key, key).ratio()
+                duplicates.append((entry_id, other_id, DUPLICATE_NEAR, round(ratio, 3)))
+                break
+        else:
+            index = bisect_right(distances, distance)
+            distances.insert(index, distance)
+            entries.insert(index, (entry_id, key, places, tolerance))
+            
+    return pd.DataFrame(duplicates, columns=DUPLICATE_COLUMNS)
+
+def drop_duplicates(df, duplicates, kinds=(DUPLICATE_EXACT,)):
+    """検出した重複のうち、指定した種類の行を除外"""
+    ids = duplicates.loc[duplicates['kind'].isin(kinds), 'id']
+    if ids.empty:
+        return df
+    return df[~df['id'].isin(ids)].reset_index(drop=True)
@@ -0,0 +1,232 @@
+"""精算書のExcel出力"""
+from io import BytesIO
+import os
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.worksheet.worksheet import Worksheet
+from pandas.api.types import is_numeric_dtype
+
+from .instrument import stage
+from .settlement import create_settlement, report_period
+from .xlsx import XlsxBook, load_template
+
+# Excel出力設定
+EXCEL_COLUMN_WIDTHS = {
+    'A': 15,  # 日付
+    'B': 50,  # 経路
+    'C': 15,  # 合計距離
+    'D': 25,  # 交通費
+    'E': 15,  # 運転手当
+    'F': 15   # 合計
+}
+EXCEL_STYLE_TITLE = 'pinos_title'
+EXCEL_STYLE_HEADER = 'pinos_header'
+EXCEL_STYLE_TEXT = 'pinos_text'
+EXCEL_STYLE_DISTANCE = 'pinos_distance'
+EXCEL_STYLE_AMOUNT = 'pinos_amount'
+EXCEL_STYLE_NOTE = 'pinos_note'
+EXCEL_COLUMN_STYLES = [
+    EXCEL_STYLE_TEXT,      # 日付
+    EXCEL_STYLE_TEXT,      # 経路
+    EXCEL_STYLE_DISTANCE,  # 合計距離
+    EXCEL_STYLE_AMOUNT,    # 交通費
+    EXCEL_STYLE_AMOUNT,    # 運転手当
+    EXCEL_STYLE_AMOUNT     # 合計
+]
+
+# 精算書テンプレートの設定（既定のテンプレートの行の高さ・見出し、見出しは出力時に精算書の列名で置き換える）
+EXCEL_TEMPLATE_PATH = os.environ.get('PINOS_EXCEL_TEMPLATE')
+EXCEL_TEMPLATE_ROW_HEIGHTS = {1: 45, 2: 60, 3: 30, 4: 30, 6: 30}
+EXCEL_TEMPLATE_HEADERS = ['日付', '経路', '合計距離(km)', '交通費(円)', '運転手当(円)', '合計(円)']
+
+# 集計シートの設定
+EXCEL_SUMMARY_COLUMN_WIDTHS = {
+    'A': 25,  # 担当者
+    'B': 15,  # 合計距離
+    'C': 25,  # 交通費
+    'D': 15,  # 運転手当
+    'E': 15   # 合計
+}
+EXCEL_SUMMARY_INDEX_HEADER = '担当者'
+EXCEL_SUMMARY_COLUMN_STYLES = [
+    EXCEL_STYLE_TEXT,
+    EXCEL_STYLE_DISTANCE,
+    EXCEL_STYLE_AMOUNT,
+    EXCEL_STYLE_AMOUNT,
+    EXCEL_STYLE_AMOUNT
+]
+
+def register_excel_styles(workbook):
+    """精算書の書式を名前付きスタイルとしてブックに登録（全セルで共有）"""
+    thin = Side(style='thin')
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    
+    workbook.add_named_style(NamedStyle(
+        name=EXCEL_STYLE_TITLE,
+        font=Font(size=14, bold=True),
+        alignment=Alignment(horizontal='center', vertical='center')
+    ))
+    workbook.add_named_style(NamedStyle(
+        name=EXCEL_STYLE_HEADER,
+        font=Font(size=11, bold=True),
+        alignment=Alignment(horizontal='center', vertical='center', wrap_text=True),
+        fill=PatternFill(start_color='E0E0E0', end_color='E0E0E0', fill_type='solid'),
+        border=border
+    ))
+    workbook.add_named_style(NamedStyle(
+        name=EXCEL_STYLE_TEXT,
+        font=Font(size=11),
+        alignment=Alignment(horizontal='left', vertical='center', wrap_text=True),
+        border=border
+    ))
+    workbook.add_named_style(NamedStyle(
+        name=EXCEL_STYLE_DISTANCE,
+        font=Font(size=11),
+        alignment=Alignment(horizontal='right', vertical='center'),
+        border=border,
+        number_format='#,##0.0'
+    ))
+    workbook.add_named_style(NamedStyle(
+        name=EXCEL_STYLE_AMOUNT,
+        font=Font(size=11),
+        alignment=Alignment(horizontal='right', vertical='center'),
+        border=border,
+        number_format='#,##0'
+    ))
+    workbook.add_named_style(NamedStyle(
+        name=EXCEL_STYLE_NOTE,
+        font=Font(size=9),
+        alignment=Alignment(horizontal='left', vertical='center')
+    ))
+
+def styled_cell(worksheet, value, style):
+    """名前付きスタイルを適用した書き込み専用セルを作成"""
+    cell = WriteOnlyCell(worksheet, value)
+    cell.style = style
+    return cell
+
+def build_excel_template():
+    """既定の精算書テンプレート（タイトル・見出し・明細・合計・注釈の書式見本を並べた1シートのxlsx）を作成"""
+    workbook = openpyxl.Workbook()
+    register_excel_styles(workbook)
+    worksheet = workbook.active
+    worksheet.title = "テンプレート"
+    
+    # A4サイズに合わせた設定と列幅
+    worksheet.page_setup.paperSize = Worksheet.PAPERSIZE_A4
+    worksheet.page_setup.orientation = Worksheet.ORIENTATION_LANDSCAPE
+    for column, width in EXCEL_COLUMN_WIDTHS.items():
+        worksheet.column_dimensions[column].width = width
+        
+    # タイトル行・見出し行・明細行・合計行・（空行）・注釈行
+    for row, height in EXCEL_TEMPLATE_ROW_HEIGHTS.items():
+        worksheet.row_dimensions[row].height = height
+    worksheet['A1'] = "{name}様 {period} 社内通貨（交通費）清算額"
+    worksheet['A1'].style = EXCEL_STYLE_TITLE
+    worksheet.merge_cells('A1:F1')
+    for column, header in enumerate(EXCEL_TEMPLATE_HEADERS, 1):
+        worksheet.cell(row=2, column=column, value=header).style = EXCEL_STYLE_HEADER
+    for row in (3, 4):
+        for column, style in enumerate(EXCEL_COLUMN_STYLES, 1):
+            worksheet.cell(row=row, column=column).style = style
+    worksheet['A6'] = "※{period}分給与にて清算しました。"
+    worksheet['A6'].style = EXCEL_STYLE_NOTE
+    worksheet.merge_cells('A6:F6')
+    
+    output = BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+def save_excel_template(path):
+    """既定の精算書テンプレートをファイルに保存（書式を編集してPINOS_EXCEL_TEMPLATEに指定できる）"""
+    with open(path, 'wb') as file:
+        file.write(build_excel_template().getvalue())
+
+def get_excel_template(path=None):
+    """精算書テンプレートを取得（既定はPINOS_EXCEL_TEMPLATE、未指定なら既定のテンプレート、プロセスごとに1回だけ読み込む）"""
+    return load_template(path or EXCEL_TEMPLATE_PATH, build_excel_template)
+
+@stage('export_to_excel', rows=lambda args, data: len(args[0]))
+def export_to_excel(df, unique_names, settlement=None, progress=None, template=None):
+    """精算書をExcelファイルとして出力（テンプレートのレイアウトで各担当者のシートを明細の配列から直接書き出す）
+    
+    templateはテンプレートのパス（既定はget_excel_template()）、progressは進捗の通知先。
+    """
+    if settlement is None:
+        settlement = create_settlement(df)
+    book_template = get_excel_template(template)
+    
+    output = BytesIO()
+    book = XlsxBook(book_template, output)
+    
+    # 明細・合計の列を一度だけリストとして取り出し（文字列の列は共有文字列の番号に変換）、担当者ごとに行範囲で切り出す
+    rows = settlement.rows
+    headers = list(rows.columns)
+    text_columns = {index for index, column in enumerate(headers) if not is_numeric_dtype(rows[column])}
+    row_columns = [
+        book.string_column(rows[column].to_numpy()) if index in text_columns else rows[column].to_numpy().tolist()
+        for index, column in enumerate(headers)
+    ]
+    totals = settlement.totals
+    total_rows = dict(zip(totals.index, totals.itertuples(index=False, name=None)))
+    period = settlement.period_label
+    
+    for done, name in enumerate(unique_names, 1):
+        start, stop = settlement.index[name]
+        columns = [values[start:stop] for values in row_columns]
+        book.add_sheet(name, period, headers, columns, ['合計', '', *total_rows[name]], text_columns)
+        if progress is not None:
+            progress(done, len(unique_names))
+    book.close()
+    
+    return output.getvalue()
+
+@stage('export_person_excel', rows=lambda args, data: len(args[1]))
+def export_person_excel(name, expense_data, template=None):
+    """担当者1人分の精算書（合計行付きのDataFrame）をExcelファイルとして出力"""
+    columns = [expense_data[column].to_numpy().tolist() for column in expense_data.columns]
+    output = BytesIO()
+    book = XlsxBook(get_excel_template(template), output)
+    book.add_sheet(
+        name, report_period(expense_data), list(expense_data.columns),
+        [values[:-1] for values in columns], [values[-1] for values in columns]
+    )
+    book.close()
+    return output.getvalue()
+
+@stage('export_summary_excel', rows=lambda args, data: len(args[0]))
+def export_summary_excel(totals):
+    """担当者別の合計一覧をExcelファイルとして出力"""
+    output = BytesIO()
+    workbook = openpyxl.Workbook(write_only=True)
+    register_excel_styles(workbook)
+    worksheet = workbook.create_sheet("集計")
+    
+    worksheet.page_setup.paperSize = Worksheet.PAPERSIZE_A4
+    worksheet.page_setup.orientation = Worksheet.ORIENTATION_LANDSCAPE
+    for column, width in EXCEL_SUMMARY_COLUMN_WIDTHS.items():
+        worksheet.column_dimensions[column].width = width
+        
+    # タイトル行・ヘッダー行
+    worksheet.row_dimensions[1].height = 45
+    worksheet.append([styled_cell(worksheet, f"{report_period(totals)} 社内通貨（交通費）清算額 集計", EXCEL_STYLE_TITLE)])
+    worksheet.merged_cells.add('A1:E1')
+    worksheet.row_dimensions[2].height = 60
+    headers = [EXCEL_SUMMARY_INDEX_HEADER, *totals.columns]
+    worksheet.append([styled_cell(worksheet, header, EXCEL_STYLE_HEADER) for header in headers])
+    
+    # 担当者ごとの合計行と全体の合計行
+    rows = list(totals.itertuples(name=None))
+    rows.append(('合計', *totals.sum()))
+    for row_idx, row in enumerate(rows, 3):
+        worksheet.row_dimensions[row_idx].height = 30
+        worksheet.append([
+            styled_cell(worksheet, value, style)
+            for value, style in zip(row, EXCEL_SUMMARY_COLUMN_STYLES)
+        ])
+        
+    workbook.save(output)
+    return output.getvalue()
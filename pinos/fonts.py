@@ -0,0 +1,24 @@
+"""日本語フォントの検索"""
+import os
+
+# 日本語TrueTypeフォントの候補（環境変数 PINOS_FONT_PATH で指定したものを優先）
+JAPANESE_FONT_CANDIDATES = [
+    '/usr/share/fonts/opentype/ipafont-gothic/ipagp.ttf',    # Debian/Ubuntu: fonts-ipafont-gothic
+    '/usr/share/fonts/opentype/ipafont-gothic/ipag.ttf',
+    '/usr/share/fonts/truetype/fonts-japanese-gothic.ttf',
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',  # Debian/Ubuntu: fonts-noto-cjk
+    '/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc',
+    '/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc',          # macOS
+    'C:/Windows/Fonts/meiryo.ttc',                             # Windows
+    'C:/Windows/Fonts/msgothic.ttc',
+]
+
+def find_japanese_font():
+    """利用できる日本語フォントのパスを取得（見つからない場合はNone）"""
+    path = os.environ.get('PINOS_FONT_PATH')
+    if path:
+        return path
+    for candidate in JAPANESE_FONT_CANDIDATES:
+        if os.path.exists(candidate):
+            return candidate
+    return None
@@ -0,0 +1,188 @@
+"""精算書のPNG画像出力（Pillowで描画）"""
+from datetime import datetime
+from io import BytesIO
+import threading
+import warnings
+
+from PIL import Image, ImageDraw, ImageFont
+
+from .fonts import find_japanese_font
+from .instrument import stage
+from .settlement import report_period
+
+# 画像のレイアウト
+IMAGE_PADDING = 30
+IMAGE_TITLE_HEIGHT = 60
+IMAGE_HEADER_HEIGHT = 56
+IMAGE_ROW_HEIGHT = 36
+IMAGE_FOOTER_HEIGHT = 80
+IMAGE_CELL_PADDING = 8
+IMAGE_COLUMN_WIDTHS = [110, 470, 130, 210, 130, 130]
+IMAGE_WIDTH = IMAGE_PADDING * 2 + sum(IMAGE_COLUMN_WIDTHS)
+IMAGE_COMPRESS_LEVEL = 1  # PNGの圧縮レベル（一括出力の速度を優先）
+
+# 配色
+IMAGE_HEADER_COLOR = '#2196F3'
+IMAGE_BORDER_COLOR = '#DDDDDD'
+IMAGE_TOTAL_ROW_COLOR = '#F5F5F5'
+IMAGE_NOTE_COLOR = '#666666'
+
+# スレッドごとの描画器（Streamlitの複数セッションで同じキャンバスを共有しない）
+local = threading.local()
+
+def load_font(path, size):
+    """フォントを読み込み（パスがない場合はPillowの既定フォント）"""
+    if path:
+        return ImageFont.truetype(path, size)
+    return ImageFont.load_default(size)
+
+class ExpenseImageRenderer:
+    """精算書画像の描画（フォント・グリフ・キャンバスを使い回す）"""
+    
+    def __init__(self, font_path=None):
+        font_path = font_path or find_japanese_font()
+        if font_path is None:
+            warnings.warn("日本語フォントが見つかりません。PINOS_FONT_PATHでフォントを指定してください。")
+        self.title_font = load_font(font_path, 22)
+        self.header_font = load_font(font_path, 15)
+        self.body_font = load_font(font_path, 15)
+        self.note_font = load_font(font_path, 13)
+        self.glyphs = {}  # フォント -> {文字: (マスク, 左オフセット, 上オフセット, 送り幅)}
+        self.canvas = None
+        self.draw = None
+        
+    def glyph(self, char, font):
+        """文字のグリフ（描画済みマスクと寸法）を取得（一度描画した文字は再利用）"""
+        glyphs = self.glyphs.setdefault(id(font), {})
+        glyph = glyphs.get(char)
+        if glyph is None:
+            left, top, right, bottom = font.getbbox(char)
+            mask = None
+            if right > left and bottom > top:
+                mask = Image.new('L', (right - left, bottom - top), 0)
+                ImageDraw.Draw(mask).text((-left, -top), char, font=font, fill=255)
+            glyph = glyphs[char] = (mask, left, top, font.getlength(char))
+        return glyph
+        
+    def text_width(self, text, font):
+        """文字列の描画幅（グリフの送り幅の合計）"""
+        return sum(self.glyph(char, font)[3] for char in text)
+        
+    def draw_text(self, position, text, font, fill='black', align='left'):
+        """キャッシュしたグリフを貼り付けて文字列を描画（positionの縦位置は行の中央）"""
+        x, middle = position
+        if align == 'right':
+            x -= self.text_width(text, font)
+        elif align == 'center':
+            x -= self.text_width(text, font) / 2
+        ascent, descent = font.getmetrics()
+        y = middle - (ascent + descent) / 2
+        for char in text:
+            mask, left, top, advance = self.glyph(char, font)
+            if mask is not None:
+                self.canvas.paste(fill, (round(x + left), round(y + top)), mask)
+            x += advance
+            
+    def wrap_text(self, text, font, max_width):
+        """列幅に合わせて文字列を折り返す"""
+        lines = ['']
+        width = 0
+        for char in text:
+            advance = self.glyph(char, font)[3]
+            if lines[-1] and width + advance > max_width:
+                lines.append('')
+                width = 0
+            lines[-1] += char
+            width += advance
+        return lines
+        
+    def get_canvas(self, height):
+        """キャンバスを取得（必要な高さに足りない場合のみ作り直す）"""
+        if self.canvas is None or self.canvas.height < height:
+            self.canvas = Image.new('RGB', (IMAGE_WIDTH, height), 'white')
+            self.draw = ImageDraw.Draw(self.canvas)
+        else:
+            self.draw.rectangle([0, 0, IMAGE_WIDTH, height], fill='white')
+        return self.canvas
+        
+    def render(self, name, expense_data):
+        """担当者1人分の精算書をPNGとして描画"""
+        # 日付・経路は列幅で折り返し、行の高さを折り返した行数に合わせる（経路を省略しない）
+        body_line_height = sum(self.body_font.getmetrics()) + 2
+        rows = []
+        for date, route, distance, fee, allowance, total in expense_data.itertuples(index=False, name=None):
+            texts = [
+                self.wrap_text(str(text), self.body_font, column_width - IMAGE_CELL_PADDING * 2)
+                for text, column_width in zip((date, route), IMAGE_COLUMN_WIDTHS)
+            ]
+            row_height = max(IMAGE_ROW_HEIGHT, body_line_height * max(map(len, texts)) + IMAGE_CELL_PADDING * 2)
+            rows.append((row_height, texts, [f"{distance:,.1f}", f"{int(fee):,}", f"{int(allowance):,}", f"{int(total):,}"]))
+        height = (IMAGE_PADDING * 2 + IMAGE_TITLE_HEIGHT + IMAGE_HEADER_HEIGHT
+                  + sum(row[0] for row in rows) + IMAGE_FOOTER_HEIGHT)
+        canvas = self.get_canvas(height)
+        draw = self.draw
+        left = IMAGE_PADDING
+        right = IMAGE_WIDTH - IMAGE_PADDING
+        
+        # タイトル
+        period = report_period(expense_data)
+        title = f"{name}様 {period} 社内通貨（交通費）清算額"
+        self.draw_text((IMAGE_WIDTH / 2, IMAGE_PADDING + IMAGE_TITLE_HEIGHT / 2), title, self.title_font, align='center')
+        
+        # ヘッダー
+        top = IMAGE_PADDING + IMAGE_TITLE_HEIGHT
+        draw.rectangle([left, top, right, top + IMAGE_HEADER_HEIGHT], fill=IMAGE_HEADER_COLOR)
+        line_height = sum(self.header_font.getmetrics()) + 2
+        x = left
+        for header, column_width in zip(expense_data.columns, IMAGE_COLUMN_WIDTHS):
+            lines = self.wrap_text(header, self.header_font, column_width - IMAGE_CELL_PADDING * 2)
+            middle = top + IMAGE_HEADER_HEIGHT / 2 - line_height * (len(lines) - 1) / 2
+            for line in lines:
+                self.draw_text((x + column_width / 2, middle), line, self.header_font, fill='white', align='center')
+                middle += line_height
+            x += column_width
+            
+        # データ行（最終行は合計行）
+        top += IMAGE_HEADER_HEIGHT
+        for row_idx, (row_height, texts, numbers) in enumerate(rows):
+            if row_idx == len(rows) - 1:
+                draw.rectangle([left, top, right, top + row_height], fill=IMAGE_TOTAL_ROW_COLOR)
+            middle = top + row_height / 2
+            x = left
+            # 日付・経路は左寄せ（折り返した行を縦方向の中央に揃える）
+            for lines, column_width in zip(texts, IMAGE_COLUMN_WIDTHS):
+                line_middle = middle - body_line_height * (len(lines) - 1) / 2
+                for line in lines:
+                    self.draw_text((x + IMAGE_CELL_PADDING, line_middle), line, self.body_font)
+                    line_middle += body_line_height
+                x += column_width
+            # 数値は右寄せ
+            for text, column_width in zip(numbers, IMAGE_COLUMN_WIDTHS[2:]):
+                self.draw_text((x + column_width - IMAGE_CELL_PADDING, middle), text, self.body_font, align='right')
+                x += column_width
+            top += row_height
+            draw.line([(left, top), (right, top)], fill=IMAGE_BORDER_COLOR, width=1)
+            
+        # 罫線（外枠と列の区切り）
+        table_top = IMAGE_PADDING + IMAGE_TITLE_HEIGHT
+        draw.rectangle([left, table_top, right, top], outline=IMAGE_BORDER_COLOR, width=1)
+        x = left
+        for column_width in IMAGE_COLUMN_WIDTHS[:-1]:
+            x += column_width
+            draw.line([(x, table_top + IMAGE_HEADER_HEIGHT), (x, top)], fill=IMAGE_BORDER_COLOR, width=1)
+            
+        # 注釈と計算日時
+        self.draw_text((left, top + 28), f"※{period}分給与にて清算しました。", self.note_font, fill=IMAGE_NOTE_COLOR)
+        self.draw_text((left, top + 52), f"計算日時: {datetime.now().strftime('%Y/%m/%d')}", self.note_font, fill=IMAGE_NOTE_COLOR)
+        
+        output = BytesIO()
+        canvas.crop((0, 0, IMAGE_WIDTH, height)).save(output, format='PNG', compress_level=IMAGE_COMPRESS_LEVEL)
+        return output.getvalue()
+
+@stage('render_expense_image', rows=lambda args, data: len(args[1]))
+def render_expense_image(name, expense_data):
+    """精算書画像をPNGとして出力（描画器はスレッド・プロセスごとに1つだけ作成して使い回す）"""
+    renderer = getattr(local, 'renderer', None)
+    if renderer is None:
+        renderer = local.renderer = ExpenseImageRenderer()
+    return renderer.render(name, expense_data)
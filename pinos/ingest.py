@@ -0,0 +1,100 @@
+"""アップロードされたトーク履歴ファイル（.txt・ZIP）の一括取り込み"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+import os
+from pathlib import PurePosixPath
+import zipfile
+
+from .parser import ENTRY_COLUMNS, compact_entries, parse_expense_data
+
+# 取り込み設定
+LOG_SUFFIX = '.txt'
+LOG_ENCODINGS = ('utf-8-sig', 'cp932')  # LINEの書き出し（UTF-8）と、Windowsで保存し直したファイル
+
+class IngestResult:
+    """1ファイル分の取り込み結果"""
+    
+    def __init__(self, name, df=None, error=None):
+        self.name = name    # ファイル名（ZIP内のファイルは「ZIP名/ファイル名」）
+        self.df = df        # 解析結果（失敗した場合はNone）
+        self.error = error  # エラーメッセージ（成功した場合はNone）
+        
+    @property
+    def entries(self):
+        """解析できたエントリー数"""
+        return 0 if self.df is None else len(self.df)
+
+def decode_log(data):
+    """トーク履歴のバイト列を文字列に変換"""
+    for encoding in LOG_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    raise UnicodeDecodeError(LOG_ENCODINGS[-1], data, 0, len(data), '文字コードを判別できません')
+
+def expand_upload(name, data):
+    """アップロードファイルをトーク履歴ごとに展開（ZIPは中の.txtを名前順に取り出す）"""
+    if not name.lower().endswith('.zip'):
+        return [(name, data)]
+    with zipfile.ZipFile(BytesIO(data)) as archive:
+        members = sorted(
+            info.filename for info in archive.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(LOG_SUFFIX)
+            and not PurePosixPath(info.filename).name.startswith('.')  # macOSの._ファイルなどを除外
+        )
+        return [(f"{name}/{member}", archive.read(member)) for member in members]
+
+def parse_log_file(name, data, period=None):
+    """トーク履歴1ファイルを文字コード判定して解析（プロセスプールのワーカーで実行、日付はperiodの年で補完）"""
+    try:
+        return IngestResult(name, df=parse_expense_data(decode_log(data), period=period))
+    except UnicodeDecodeError:
+        return IngestResult(name, error="文字コードを判別できません（UTF-8またはShift_JISで保存してください）")
+
+def expand_uploads(files):
+    """アップロードファイル（ファイル名, バイト列）を展開し、トーク履歴と開けなかったファイルの結果に分ける"""
+    logs = []
+    failures = []
+    for name, data in files:
+        try:
+            expanded = expand_upload(name, data)
+        except zipfile.BadZipFile:
+            failures.append(IngestResult(name, error="ZIPファイルを開けません"))
+            continue
+        if not expanded:
+            failures.append(IngestResult(name, error="トーク履歴（.txt）が含まれていません"))
+        logs.extend(expanded)
+    return logs, failures
+
+def iter_ingest_results(logs, max_workers=None, period=None):
+    """トーク履歴（ファイル名, バイト列）を並列に解析し、完了した順に結果を生成（periodは精算期間（年, 月））"""
+    max_workers = min(max_workers or os.cpu_count() or 1, len(logs) or 1)
+    
+    # 1プロセスで足りる場合はプールを起動しない
+    if max_workers == 1:
+        for name, data in logs:
+            yield parse_log_file(name, data, period)
+        return
+        
+    # 大きいファイルから投入し、全体の処理時間を最大のファイルの処理時間に近づける
+    logs.sort(key=lambda log: len(log[1]), reverse=True)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(parse_log_file, name, data, period) for name, data in logs]
+        for future in as_completed(futures):
+            yield future.result()
+
+def merge_ingest_results(results):
+    """解析できたファイルの結果をファイル名順に1つのDataFrameにまとめる（idは通し番号に振り直す）"""
+    import pandas as pd
+    
+    frames = [
+        result.df for result in sorted(results, key=lambda result: result.name)
+        if result.df is not None and not result.df.empty
+    ]
+    if not frames:
+        return compact_entries(pd.DataFrame(columns=ENTRY_COLUMNS))
+    df = pd.concat(frames, ignore_index=True)
+    df['id'] = range(1, len(df) + 1)
+    # ファイルごとにカテゴリが異なる担当者・経路の列をまとめ直す
+    return compact_entries(df)
@@ -0,0 +1,211 @@
+"""処理段階ごとの計測（処理時間・呼び出し回数・行数・メモリ使用量のピーク）"""
+from contextlib import contextmanager
+import csv
+from datetime import datetime
+from functools import wraps
+from io import StringIO
+import json
+import threading
+import time
+import tracemalloc
+
+# 計測結果の列
+PROFILE_COLUMNS = ['stage', 'calls', 'seconds', 'rows', 'peak_mib']
+
+# 計測中のプロファイルと段階のスタック（スレッドごと。計測していない場合はNone）
+local = threading.local()
+
+# tracemallocのピークはプロセス全体で1つなので、リセットする前に全スレッドの計測中の段階へ反映する
+frames_lock = threading.Lock()
+active_frames = set()  # 計測中の段階（全スレッド）
+tracing_users = 0      # tracemallocを開始した計測のうち、終了していないものの数
+
+class Frame:
+    """計測中の段階の開始時のメモリ使用量と、開始時からの増加分のピーク"""
+    
+    __slots__ = ('start', 'peak')
+    
+    def __init__(self, start):
+        self.start = start
+        self.peak = 0
+
+class Profile:
+    """段階ごとの計測結果の集計"""
+    
+    def __init__(self, memory=True):
+        self.memory = memory  # tracemallocでメモリ使用量のピークを計測するか
+        self.stages = {}      # 段階名 -> {'calls', 'seconds', 'rows', 'peak_mib'}
+        self.lock = threading.Lock()
+        
+    def record(self, stage, seconds, rows=None, peak=None, calls=1):
+        """段階の計測結果を追加"""
+        with self.lock:
+            stats = self.stages.setdefault(stage, {'calls': 0, 'seconds': 0.0, 'rows': 0, 'peak_mib': None})
+            stats['calls'] += calls
+            stats['seconds'] += seconds
+            if rows is not None:
+                stats['rows'] += rows
+            if peak is not None:
+                peak_mib = peak / 2**20
+                stats['peak_mib'] = max(stats['peak_mib'] or 0.0, peak_mib)
+                
+    def rows(self):
+        """計測結果を表の行（辞書）の一覧として取得"""
+        with self.lock:
+            return [
+                {
+                    'stage': stage,
+                    'calls': stats['calls'],
+                    'seconds': round(stats['seconds'], 4),
+                    'rows': stats['rows'],
+                    'peak_mib': None if stats['peak_mib'] is None else round(stats['peak_mib'], 2),
+                }
+                for stage, stats in self.stages.items()
+            ]
+            
+    def clear(self):
+        """計測結果を消去"""
+        with self.lock:
+            self.stages.clear()
+            
+    def to_json(self, **metadata):
+        """計測結果をJSON文字列として出力"""
+        return json.dumps(
+            {'recorded_at': datetime.now().isoformat(timespec='seconds'), **metadata, 'stages': self.rows()},
+            ensure_ascii=False,
+            indent=2
+        )
+        
+    def to_csv(self, header=True, **metadata):
+        """計測結果をCSV（1段階1行、metadataは各行の先頭列）として出力"""
+        output = StringIO()
+        columns = ['recorded_at', *metadata, *PROFILE_COLUMNS]
+        writer = csv.DictWriter(output, fieldnames=columns, lineterminator='\n')
+        if header:
+            writer.writeheader()
+        recorded_at = datetime.now().isoformat(timespec='seconds')
+        for row in self.rows():
+            writer.writerow({'recorded_at': recorded_at, **metadata, **row})
+        return output.getvalue()
+
+def active_profile():
+    """このスレッドで計測中のプロファイルを取得（計測していない場合はNone）"""
+    return getattr(local, 'profile', None)
+
+@contextmanager
+def profiling(profile=None, memory=True):
+    """with文の中で実行された段階を計測（profileを渡すと結果を追加していく）"""
+    if profile is None:
+        profile = Profile(memory)
+    previous = active_profile()
+    started_tracing = profile.memory and start_tracing()
+    local.profile = profile
+    try:
+        yield profile
+    finally:
+        local.profile = previous
+        if started_tracing:
+            stop_tracing()
+
+def start_tracing():
+    """計測用にtracemallocを開始（他のスレッドの計測と共有し、計測以外で開始されている場合はFalse）"""
+    global tracing_users
+    with frames_lock:
+        if not tracing_users:
+            if tracemalloc.is_tracing():
+                return False
+            tracemalloc.start()
+        tracing_users += 1
+        return True
+
+def stop_tracing():
+    """計測用のtracemallocを終了（最後の計測が終わった時点で止める）"""
+    global tracing_users
+    with frames_lock:
+        tracing_users -= 1
+        if not tracing_users:
+            tracemalloc.stop()
+
+def update_frames(peak):
+    """計測中のすべての段階にピークを反映（frames_lockを取得して呼び出す）"""
+    for frame in active_frames:
+        frame.peak = max(frame.peak, peak - frame.start)
+
+def enter_frame(profile):
+    """段階の開始時のメモリ使用量を記録（計測中の段階のピークを確定してからリセット）"""
+    if not (profile.memory and tracemalloc.is_tracing()):
+        return None
+    with frames_lock:
+        current, peak = tracemalloc.get_traced_memory()
+        update_frames(peak)
+        tracemalloc.reset_peak()
+        frame = Frame(current)
+        active_frames.add(frame)
+    frames = getattr(local, 'frames', None)
+    if frames is None:
+        frames = local.frames = []
+    frames.append(frame)
+    return frame
+
+def exit_frame(profile, frame):
+    """段階の終了時にメモリ使用量のピーク（開始時からの増加分）を取得"""
+    if frame is None:
+        return None
+    with frames_lock:
+        update_frames(tracemalloc.get_traced_memory()[1])
+        active_frames.discard(frame)
+    # 段階は入れ子で終わるため、このスレッドのスタックの最後がこの段階になる
+    local.frames.pop()
+    return frame.peak
+
+def stage(name, rows=None):
+    """関数を計測対象の段階にするデコレーター（rowsは引数と戻り値から行数を返す関数）"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = active_profile()
+            if profile is None:
+                return func(*args, **kwargs)
+                
+            frame = enter_frame(profile)
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                peak = exit_frame(profile, frame)
+            profile.record(name, seconds, rows(args, result) if rows else None, peak)
+            return result
+        return wrapper
+    return decorator
+
+@contextmanager
+def aggregated(name, func):
+    """1件ごとに何度も呼ばれる関数の合計時間・呼び出し回数を計測（計測していない場合はfuncをそのまま使う）"""
+    profile = active_profile()
+    if profile is None:
+        yield func
+        return
+        
+    totals = [0, 0.0]  # 呼び出し回数, 合計時間
+    perf_counter = time.perf_counter
+    
+    def wrapper(*args):
+        start = perf_counter()
+        try:
+            return func(*args)
+        finally:
+            totals[0] += 1
+            totals[1] += perf_counter() - start
+    try:
+        yield wrapper
+    finally:
+        if totals[0]:
+            profile.record(name, totals[1], rows=totals[0], calls=totals[0])
+
+def call_profiled(profile, func, *args):
+    """profileが指定されている場合は計測しながらfuncを実行（別スレッドで実行される処理用）"""
+    if profile is None:
+        return func(*args)
+    with profiling(profile):
+        return func(*args)
@@ -0,0 +1,120 @@
+"""出力ファイルのバックグラウンド作成（画面を止めずにExcel・PDF・ZIPを作成する）"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+# ジョブの状態
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# ジョブキューの設定
+JOB_WORKERS = 2                  # 同時に作成するファイル数
+JOB_CACHE_BYTES = 256 * 2**20    # 完成したファイルを保持する合計サイズの上限
+JOB_HISTORY = 32                 # 保持する終了済みジョブ（失敗を含む）の最大数
+
+class ExportJob:
+    """1つの出力ファイルの作成ジョブ"""
+    
+    def __init__(self, key, label):
+        self.key = key            # ジョブのキー（データのフィンガープリント・形式など）
+        self.label = label        # 画面に表示する名前
+        self.status = JOB_QUEUED
+        self.progress = 0.0       # 進捗（0〜1）
+        self.result = None        # 完成したファイル（バイト列）
+        self.error = None         # 失敗した場合のエラーメッセージ
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        
+    @property
+    def finished(self):
+        return self.status in (JOB_DONE, JOB_FAILED)
+        
+    @property
+    def elapsed(self):
+        """実行時間（秒、未開始の場合は0）"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+        
+    def report_progress(self, done, total):
+        """作成処理から進捗を受け取る（作成処理のスレッドから呼ばれる）"""
+        self.progress = min(done / total, 1.0) if total else 1.0
+
+class ExportQueue:
+    """出力ファイルの作成ジョブをスレッドプールで実行するキュー
+    
+    同じキーのジョブは1回だけ実行し、完成したファイルは合計サイズの上限まで保持する
+    （上限を超えた場合は最も長く参照されていないものから破棄する）。
+    """
+    
+    def __init__(self, max_workers=JOB_WORKERS, max_bytes=JOB_CACHE_BYTES, history=JOB_HISTORY):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pinos-export')
+        self.max_bytes = max_bytes
+        self.history = history
+        self.jobs = OrderedDict()  # キー -> ジョブ（参照された順）
+        self.lock = threading.Lock()
+        
+    def submit(self, key, label, func):
+        """ジョブを投入（func(progress)がファイルのバイト列を返す）
+        
+        同じキーのジョブが待機中・実行中・完成済みの場合は新しく投入せずにそのジョブを返す。
+        """
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None and job.status != JOB_FAILED:
+                self.jobs.move_to_end(key)
+                return job
+            job = self.jobs[key] = ExportJob(key, label)
+        self.executor.submit(self.run, job, func)
+        return job
+        
+    def get(self, key):
+        """キーのジョブを取得（ない場合・破棄された場合はNone）"""
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None:
+                self.jobs.move_to_end(key)
+            return job
+            
+    def run(self, job, func):
+        """ジョブを実行（ワーカースレッドで実行される）"""
+        job.status = JOB_RUNNING
+        job.started_at = time.monotonic()
+        try:
+            job.result = func(job.report_progress)
+        except Exception as error:  # 失敗はジョブの状態として画面に表示する
+            job.error = f"{type(error).__name__}: {error}"
+            job.status = JOB_FAILED
+        else:
+            job.progress = 1.0
+            job.status = JOB_DONE
+        finally:
+            job.finished_at = time.monotonic()
+        with self.lock:
+            self.evict(keep=job)
+            
+    def cached_bytes(self):
+        """保持している完成ファイルの合計サイズ"""
+        return sum(len(job.result) for job in list(self.jobs.values()) if job.status == JOB_DONE)
+        
+    def evict(self, keep=None):
+        """上限を超えた完成ファイル・終了済みジョブを古いものから破棄（ロック中に呼び出す）"""
+        total = self.cached_bytes()
+        finished = sum(job.finished for job in self.jobs.values())
+        for key, job in list(self.jobs.items()):
+            if total <= self.max_bytes and finished <= self.history:
+                break
+            if job is keep or not job.finished:
+                continue
+            if job.status == JOB_DONE:
+                total -= len(job.result)
+            finished -= 1
+            del self.jobs[key]
+            
+    def shutdown(self):
+        """実行中のジョブの終了を待ってワーカーを止める"""
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,247 @@
+"""LINEトーク履歴（【ピノ】投稿）の解析"""
+from io import StringIO
+from collections import OrderedDict
+from datetime import date
+import hashlib
+import re
+
+from .instrument import aggregated, stage
+
+# 解析設定
+PARSE_CHUNK_SIZE = 10000  # DataFrameを組み立てる際のチャンク行数
+ENTRY_COLUMNS = ['name', 'date', 'route', 'distance', 'id']
+DISTANCE_MARKERS = ['km', '㎞', 'ｋｍ', 'kｍ']
+DISTANCE_DECIMALS = 3  # float32で保持した距離を入力時の値に戻す際の小数桁数
+INVALID_DATES_ATTR = 'invalid_dates'  # 日付が正しくないため除外したエントリー（DataFrameのattrsのキー）
+INVALID_DATE_REPORT_LIMIT = 20  # 除外したエントリーとして表示する最大数
+
+# エントリー抽出用の正規表現（名前・日付・経路・距離を1回の走査で取得）
+ENTRY_PATTERN = re.compile(
+    r'【ピノ】\s*(?P<name>[^　\s]+(?:[ 　]+[^　\s]+)*?)\s+(?P<date>\d+/\d+)\s*\([月火水木金土日]\)'
+    r'(?P<route>.*?)'
+    r'(?:'
+    r'(?P<distance>\d+\.?\d*)(?:km|㎞|ｋｍ|kｍ)'              # 「12.5km」パターン
+    r'|(?:距離|合計|往復)[：:]\s*(?P<labeled_distance>\d+\.?\d*)'  # 「距離:」「合計:」「往復:」パターン
+    r')',
+    re.IGNORECASE | re.DOTALL
+)
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# 解析結果キャッシュの最大件数
+ENTRY_CACHE_SIZE = 100000
+
+def iter_expense_entries(lines, cache=None):
+    """行のイテラブル（ファイルオブジェクト可）からエントリーを1件ずつ生成"""
+    parse_entry = cache.process_entry if cache is not None else process_entry
+    with aggregated('process_entry', parse_entry) as parse_entry:
+        yield from iter_entries(lines, parse_entry)
+
+def iter_entries(lines, parse_entry):
+    """行をエントリーごとにまとめ、parse_entryで解析したものを1件ずつ生成"""
+    entry_id = 1
+    current_entry = []
+    
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+            
+        # 新しいエントリーの開始を検出
+        if '【ピノ】' in line:
+            # 前のエントリーを処理
+            if current_entry:
+                entry_data = parse_entry(''.join(current_entry))
+                if entry_data:
+                    entry_data['id'] = entry_id
+                    yield entry_data
+                    entry_id += 1
+            current_entry = [line]
+        elif current_entry:
+            # 距離情報を含む行を追加（最初の【ピノ】より前の行は解析対象外なので保持しない）
+            if any(pattern in line for pattern in DISTANCE_MARKERS):
+                current_entry.append(line)
+                
+    # 最後のエントリーを処理
+    if current_entry:
+        entry_data = parse_entry(''.join(current_entry))
+        if entry_data:
+            entry_data['id'] = entry_id
+            yield entry_data
+
+def iter_expense_frames(lines, chunk_size=PARSE_CHUNK_SIZE, cache=None):
+    """エントリーをchunk_size件ずつのDataFrameにまとめて生成"""
+    import pandas as pd  # pandasは必要になった時点で読み込む（エントリー単位の解析には不要）
+    
+    chunk = []
+    for entry_data in iter_expense_entries(lines, cache):
+        chunk.append(entry_data)
+        if len(chunk) >= chunk_size:
+            yield pd.DataFrame(chunk, columns=ENTRY_COLUMNS)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk, columns=ENTRY_COLUMNS)
+
+@stage('parse_expense_stream', rows=lambda args, df: len(df))
+def parse_expense_stream(lines, chunk_size=PARSE_CHUNK_SIZE, cache=None, period=None):
+    """行のイテラブルを逐次解析してDataFrameを作成（入力全体をメモリに載せない、日付はperiodの年で補完）"""
+    import pandas as pd
+    
+    frames = list(iter_expense_frames(lines, chunk_size, cache))
+    if not frames:
+        return compact_entries(pd.DataFrame(columns=ENTRY_COLUMNS), period)
+    return compact_entries(pd.concat(frames, ignore_index=True), period)
+
+@stage('parse_expense_data', rows=lambda args, df: len(df))
+def parse_expense_data(text, cache=None, period=None):
+    """テキストデータを解析してDataFrameを作成"""
+    return parse_expense_stream(StringIO(text), cache=cache, period=period)
+
+def resolve_dates(dates, year, month):
+    """「M/D」形式の日付を精算期間（year年month月）の年で補完してdatetime64に変換
+
+    精算月より後の月は前年の日付として扱う（2025年1月の精算なら「12/25」は2024/12/25）。
+    存在しない日付（「2/30」など）はNaTになる。
+    """
+    import numpy as np
+    import pandas as pd
+    
+    # 日付の種類は多くても数百なので、種類ごとに1回だけ変換する
+    codes, texts = pd.factorize(np.asarray(dates, dtype=object))
+    resolved = np.empty(len(texts) + 1, dtype='datetime64[ns]')
+    resolved[-1] = np.datetime64('NaT')  # 欠損値（codes=-1）用
+    for i, text in enumerate(texts):
+        entry_month, entry_day = map(int, text.split('/'))
+        try:
+            resolved[i] = date(year - 1 if entry_month > month else year, entry_month, entry_day)
+        except ValueError:
+            resolved[i] = np.datetime64('NaT')
+    return resolved[codes]
+
+def compact_entries(df, period=None):
+    """解析結果を型付きの列に変換（日付はdatetime64、担当者・経路はカテゴリ型、距離はfloat32）
+
+    「M/D」形式の日付はperiod（精算期間（年, 月））の年で補完する（未指定の場合はValueError）。
+    存在しない日付（「2/30」など）のエントリーは除外し、エントリー番号と元の日付をattrsに記録する
+    （invalid_dates()で取得する）。
+
+    担当者・経路は同じ文字列が繰り返し現れるため、カテゴリ型にして文字列を1つずつだけ保持する。
+    """
+    import numpy as np
+    import pandas as pd
+    
+    if pd.api.types.is_datetime64_dtype(df['date']) or df.empty:
+        dates = df['date'].to_numpy(dtype='datetime64[ns]')
+    elif period is None:
+        raise ValueError("「M/D」形式の日付の年を補完する精算期間（年, 月）を指定してください")
+    else:
+        dates = resolve_dates(df['date'], *period)
+        
+    # 存在しない日付は精算期間・運転手当を決められないため、解析時に除外して報告する
+    invalid = np.isnat(dates)
+    skipped = {}
+    if invalid.any():
+        skipped = dict(zip(df['id'].to_numpy()[invalid].tolist(), df['date'].to_numpy()[invalid].tolist()))
+        df = df[~invalid]
+        dates = dates[~invalid]
+    compact = pd.DataFrame({
+        'name': pd.Categorical(df['name'].astype(str)),
+        'date': dates,
+        'route': pd.Categorical(df['route'].astype(str)),
+        'distance': df['distance'].to_numpy(dtype='float32'),
+        'id': df['id'].to_numpy(dtype='int64'),
+    }, columns=ENTRY_COLUMNS)
+    if skipped:
+        compact.attrs[INVALID_DATES_ATTR] = skipped
+    return compact
+
+def invalid_dates(df):
+    """解析時に日付が正しくないため除外したエントリー（{エントリー番号: 元の「M/D」}）"""
+    return df.attrs.get(INVALID_DATES_ATTR, {})
+
+def format_invalid_dates(skipped, limit=INVALID_DATE_REPORT_LIMIT):
+    """除外したエントリーの表示（「No. 3 (2/30), No. 7 (13/1)」、多い場合は先頭のみ）"""
+    items = [f"No. {entry_id} ({text})" for entry_id, text in list(skipped.items())[:limit]]
+    return ', '.join(items) + (' ...' if len(skipped) > limit else '')
+
+def entry_distances(df):
+    """距離をfloat64で取得（float32の丸め誤差を除き、入力時の値に戻す）"""
+    import numpy as np
+    
+    return np.round(df['distance'].to_numpy(dtype='float64'), DISTANCE_DECIMALS)
+
+def date_labels(dates):
+    """datetime64の日付を精算書の表示形式（「M/D」）に変換（存在しない日付は空文字）"""
+    import numpy as np
+    import pandas as pd
+    
+    codes, days = pd.factorize(dates)
+    days = pd.DatetimeIndex(days)
+    labels = np.array([f"{month}/{day}" for month, day in zip(days.month, days.day)] + [''], dtype=object)
+    return labels[codes]
+
+def process_entry(text):
+    """個別のエントリーを解析"""
+    # 名前・日付・経路・距離を1回の走査で抽出
+    match = ENTRY_PATTERN.search(text)
+    if not match:
+        return None
+        
+    distance = float(match.group('distance') or match.group('labeled_distance'))
+    if not distance:
+        return None
+        
+    return {
+        'name': match.group('name').strip(),  # 【ピノ】の後の名前を使用
+        'date': match.group('date'),
+        'route': WHITESPACE_PATTERN.sub(' ', match.group('route').strip()),  # 複数の空白を1つに
+        'distance': distance
+    }
+
+def process_entries(texts):
+    """複数のエントリーをまとめて解析（解析できないエントリーはNone、抽出処理はprocess_entryと共通）"""
+    return [process_entry(text) for text in texts]
+
+def dataframe_fingerprint(df):
+    """解析済みデータの内容からフィンガープリント（キャッシュのキー）を作成"""
+    import pandas as pd
+    
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update('\x1f'.join(map(str, df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+class EntryCache:
+    """エントリー本文のハッシュをキーにした解析結果のLRUキャッシュ"""
+    
+    def __init__(self, maxsize=ENTRY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        
+    def process_entry(self, text):
+        """キャッシュを参照してエントリーを解析（未登録・変更されたエントリーのみ解析）"""
+        key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            entry_data = self.entries[key]
+        else:
+            self.misses += 1
+            entry_data = process_entry(text)
+            self.entries[key] = entry_data
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)  # 最も古いエントリーを削除
+                
+        # 呼び出し側でidを付与するためコピーを返す
+        return dict(entry_data) if entry_data else None
+        
+    def reset_stats(self):
+        """ヒット数・ミス数をリセット"""
+        self.hits = 0
+        self.misses = 0
+        
+    def clear(self):
+        """キャッシュを空にする"""
+        self.entries.clear()
+        self.reset_stats()
@@ -0,0 +1,201 @@
+"""精算書のPDF出力"""
+from io import BytesIO
+import re
+import threading
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from .fonts import find_japanese_font
+from .instrument import stage
+from .settlement import create_settlement, report_period
+
+# PDFのレイアウト
+PDF_CID_FONT = 'HeiseiKakuGo-W5'  # フォントファイルが見つからない場合に使うCIDフォント
+PDF_TTF_FONT = 'PinosGothic'
+PDF_FONT_SIZE = 9
+PDF_MARGIN = 20*mm
+PDF_FRAME_PADDING = 6  # SimpleDocTemplateの本文枠の余白(pt)
+PDF_FRAME_WIDTH = landscape(A4)[0] - PDF_MARGIN * 2 - PDF_FRAME_PADDING * 2
+PDF_FRAME_HEIGHT = landscape(A4)[1] - PDF_MARGIN * 2 - PDF_FRAME_PADDING * 2
+PDF_SPACING = 4*mm
+PDF_HEADER_BREAK = re.compile(r'(?=[(（])')  # 列名の単位・計算式の前で改行する
+PDF_COLUMN_WIDTHS = [22*mm, 105*mm, 25*mm, 40*mm, 30*mm, 30*mm]
+PDF_HEADER_HEIGHT = 12*mm
+PDF_ROW_HEIGHT = 7*mm
+PDF_CELL_PADDING = 12  # 表のセルの左右余白の合計(pt、TableStyleの既定値6ptずつ)
+PDF_CELL_VERTICAL_PADDING = 6  # 表のセルの上下余白の合計(pt)
+PDF_ROUTE_WIDTH = PDF_COLUMN_WIDTHS[1] - PDF_CELL_PADDING  # 経路を1行で表示できる幅
+
+# フォント・スタイルはプロセスごとに1回だけ作成する
+font_lock = threading.Lock()
+pdf_styles = None
+
+def register_japanese_font():
+    """日本語フォントを登録してフォント名を返す（TTFが見つからない場合はCIDフォント）"""
+    path = find_japanese_font()
+    if path and path.lower().endswith('.ttf'):
+        pdfmetrics.registerFont(TTFont(PDF_TTF_FONT, path))
+        return PDF_TTF_FONT
+    pdfmetrics.registerFont(UnicodeCIDFont(PDF_CID_FONT))
+    return PDF_CID_FONT
+
+def get_pdf_styles():
+    """フォント名と表・段落のスタイルを取得（初回のみフォントを登録）"""
+    global pdf_styles
+    with font_lock:
+        if pdf_styles is None:
+            font_name = register_japanese_font()
+            pdf_styles = {
+                'font': font_name,
+                'title': ParagraphStyle('pinos_title', fontName=font_name, fontSize=14, leading=20, alignment=1),
+                'route': ParagraphStyle('pinos_route', fontName=font_name, fontSize=PDF_FONT_SIZE,
+                                        leading=PDF_FONT_SIZE + 2, wordWrap='CJK'),
+                'note': ParagraphStyle('pinos_note', fontName=font_name, fontSize=9, leading=12,
+                                       textColor=colors.HexColor('#666666')),
+                'table': TableStyle([
+                    ('FONT', (0, 0), (-1, -1), font_name, PDF_FONT_SIZE),
+                    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                    # ヘッダー
+                    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+                    # 数値列は右寄せ
+                    ('ALIGN', (2, 1), (-1, -1), 'RIGHT'),
+                ]),
+                # 合計行（担当者の最後の表にのみ適用）
+                'total': TableStyle([
+                    ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#F5F5F5')),
+                ]),
+            }
+    return pdf_styles
+
+def route_cell(route, styles):
+    """経路のセルと行の高さ（列幅に収まらない経路は折り返す段落にし、行を高くする）"""
+    if pdfmetrics.stringWidth(route, styles['font'], PDF_FONT_SIZE) <= PDF_ROUTE_WIDTH:
+        return route, PDF_ROW_HEIGHT
+    paragraph = Paragraph(escape(route), styles['route'])
+    height = paragraph.wrap(PDF_ROUTE_WIDTH, PDF_FRAME_HEIGHT)[1] + PDF_CELL_VERTICAL_PADDING
+    return paragraph, max(PDF_ROW_HEIGHT, height)
+
+def page_stop(heights, start, height):
+    """start行目から指定した高さ（ヘッダー行を含む）に収まる表の終わりの行（少なくとも1行は含める）"""
+    used = PDF_HEADER_HEIGHT + heights[start]
+    stop = start + 1
+    while stop < len(heights) and used + heights[stop] <= height:
+        used += heights[stop]
+        stop += 1
+    return stop
+
+def pdf_headers(columns):
+    """精算書の列名を表のヘッダーに変換（「合計距離(km)」は「合計距離」と「(km)」の2行にする）"""
+    return [PDF_HEADER_BREAK.sub('\n', str(column), count=1) for column in columns]
+
+def settlement_table(headers, rows, heights, styles, last=False):
+    """精算書の表を作成（行の高さを指定して再計算を省き、ページをまたぐ場合はヘッダーを繰り返す）"""
+    table = Table(
+        [headers, *rows],
+        colWidths=PDF_COLUMN_WIDTHS,
+        rowHeights=[PDF_HEADER_HEIGHT, *heights],
+        repeatRows=1
+    )
+    table.setStyle(styles['table'])
+    if last:
+        table.setStyle(styles['total'])
+    return table
+
+def settlement_flowables(name, headers, columns, styles, period):
+    """担当者1人分の精算書（タイトル・表・注釈）を作成（columnsは合計行を含む精算書6列分の配列）"""
+    rows = []
+    heights = []
+    for date, route, distance, fee, allowance, total in zip(*columns):
+        route, height = route_cell(str(route), styles)
+        rows.append([str(date), route, f"{distance:,.1f}", f"{int(fee):,}", f"{int(allowance):,}", f"{int(total):,}"])
+        heights.append(height)
+    
+    title = Paragraph(f"{name}様 {period} 社内通貨（交通費）清算額", styles['title'])
+    elements = [title, Spacer(1, PDF_SPACING)]
+    
+    # 1ページに収まる行数ごとに表を分ける
+    # （1つの大きな表のままだと、改ページのたびに残りの行全体で表が作り直され、行数の2乗で遅くなる）
+    height = PDF_FRAME_HEIGHT - title.wrap(PDF_FRAME_WIDTH, PDF_FRAME_HEIGHT)[1] - PDF_SPACING
+    start = 0
+    while start < len(rows):
+        stop = page_stop(heights, start, height)
+        elements.append(settlement_table(headers, rows[start:stop], heights[start:stop], styles, last=stop >= len(rows)))
+        start = stop
+        height = PDF_FRAME_HEIGHT
+        
+    elements.append(Spacer(1, PDF_SPACING))
+    elements.append(Paragraph(f"※{period}分給与にて清算しました。", styles['note']))
+    return elements
+
+def build_pdf(elements, title, progress=None):
+    """フローアブルからA4横のPDFを作成（progressにはページごとに進捗を通知）"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=landscape(A4),
+        rightMargin=PDF_MARGIN,
+        leftMargin=PDF_MARGIN,
+        topMargin=PDF_MARGIN,
+        bottomMargin=PDF_MARGIN,
+        title=title
+    )
+    if progress is None:
+        doc.build(elements)
+        return buffer
+        
+    # 表は1ページ分ずつに分けてあるので、表の数をページ数の目安にする
+    pages = sum(isinstance(element, Table) for element in elements)
+    
+    def on_page(canvas, doc):
+        progress(min(doc.page, pages), pages)
+    doc.build(elements, onFirstPage=on_page, onLaterPages=on_page)
+    return buffer
+
+@stage('create_pdf', rows=lambda args, buffer: len(args[0]))
+def create_pdf(expense_data, name):
+    """担当者1人分の精算書（合計行付きのDataFrame）をPDFとして出力"""
+    styles = get_pdf_styles()
+    columns = [expense_data[column].to_numpy() for column in expense_data.columns]
+    elements = settlement_flowables(name, pdf_headers(expense_data.columns), columns, styles, report_period(expense_data))
+    return build_pdf(elements, f"{name}様 精算書")
+
+@stage('export_to_pdf', rows=lambda args, data: len(args[0]))
+def export_to_pdf(df, unique_names, settlement=None, progress=None):
+    """全担当者の精算書を1つのPDF（担当者ごとに改ページ）として出力（progressは進捗の通知先）"""
+    if settlement is None:
+        settlement = create_settlement(df)
+    styles = get_pdf_styles()
+    
+    # 明細・合計の列を一度だけ配列として取り出し、担当者ごとに行範囲で切り出す
+    rows = settlement.rows
+    row_columns = [rows[column].to_numpy() for column in rows.columns]
+    totals = settlement.totals
+    total_columns = [totals[column].to_numpy() for column in totals.columns]
+    total_positions = {name: position for position, name in enumerate(totals.index)}
+    headers = pdf_headers(rows.columns)
+    
+    elements = []
+    for name in unique_names:
+        start, stop = settlement.index[name]
+        position = total_positions[name]
+        columns = [
+            [*row_columns[0][start:stop], '合計'],
+            [*row_columns[1][start:stop], ''],
+            *([*column[start:stop], total[position]] for column, total in zip(row_columns[2:], total_columns))
+        ]
+        if elements:
+            elements.append(PageBreak())
+        elements.extend(settlement_flowables(name, headers, columns, styles, settlement.period_label))
+        
+    return build_pdf(elements, f"精算書 {settlement.period_label}", progress).getvalue()
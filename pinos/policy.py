@@ -0,0 +1,130 @@
+"""精算の単価・運転手当・締め日の設定（適用開始日ごとの設定表）"""
+import csv
+from datetime import date
+import os
+
+import numpy as np
+
+# 既定の設定
+RATE_PER_KM = 15
+DAILY_ALLOWANCE = 200
+SETTLEMENT_PERIOD = (2025, 1)  # 精算期間（年, 月）
+CLOSING_DAY = None             # 締め日（Noneは月末締め）
+POLICY_COLUMNS = ['effective_from', 'rate_per_km', 'daily_allowance', 'closing_day']
+POLICY_PATH = os.environ.get('PINOS_POLICY_PATH')  # 設定表のCSV（未指定の場合は既定の設定のみ）
+
+class RatePolicy:
+    """適用開始日以降のエントリーに適用する単価・運転手当・締め日"""
+    
+    def __init__(self, effective_from, rate_per_km=RATE_PER_KM, daily_allowance=DAILY_ALLOWANCE, closing_day=CLOSING_DAY):
+        if closing_day is not None and not 1 <= closing_day <= 31:
+            raise ValueError(f"締め日は1〜31で指定してください: {closing_day}")
+        self.effective_from = effective_from  # 適用開始日（date）
+        self.rate_per_km = rate_per_km        # 1kmあたりの交通費(円)
+        self.daily_allowance = daily_allowance  # 1日あたりの運転手当(円)
+        self.closing_day = closing_day        # 締め日（この日より後の日付は翌月の精算になる）
+        
+    def key(self):
+        return (self.effective_from.isoformat(), self.rate_per_km, self.daily_allowance, self.closing_day)
+
+class PolicyTable:
+    """適用開始日順に並べた設定表（エントリーの日付から有効な設定をまとめて引く）"""
+    
+    def __init__(self, policies):
+        if not policies:
+            raise ValueError("設定が1件もありません")
+        self.policies = sorted(policies, key=lambda policy: policy.effective_from)
+        starts = [policy.effective_from for policy in self.policies]
+        if len(set(starts)) != len(starts):
+            raise ValueError("適用開始日が重複しています")
+        self.starts = np.array(starts, dtype='datetime64[ns]')
+        self.rates = np.array([policy.rate_per_km for policy in self.policies], dtype='float64')
+        self.allowances = np.array([policy.daily_allowance for policy in self.policies], dtype='int64')
+        self.closing_days = np.array([policy.closing_day or 31 for policy in self.policies], dtype='int64')
+        
+    @property
+    def key(self):
+        """キャッシュのキー（設定表の内容が同じなら同じ値）"""
+        return tuple(policy.key() for policy in self.policies)
+        
+    def lookup(self, dates):
+        """各日付に有効な設定の位置（適用開始日より前・存在しない日付は最初の設定）"""
+        dates = np.asarray(dates, dtype='datetime64[ns]')
+        positions = np.searchsorted(self.starts, dates, side='right') - 1
+        # searchsorted()は存在しない日付（NaT）を末尾に並べるため、最初の設定に置き換える
+        return np.where(np.isnat(dates), 0, np.clip(positions, 0, None))
+        
+    def periods(self, dates, positions=None):
+        """各日付の精算期間（年 × 100 + 月の整数、締め日より後の日付は翌月、存在しない日付は0）"""
+        if positions is None:
+            positions = self.lookup(dates)
+        days = np.asarray(dates, dtype='datetime64[D]')
+        months = days.astype('datetime64[M]')
+        day_of_month = (days - months).astype('int64') + 1
+        months = months + (day_of_month > self.closing_days[positions]).astype('int64')
+        month_index = months.astype('int64')  # 1970年1月からの月数
+        return np.where(np.isnat(days), 0, (month_index // 12 + 1970) * 100 + month_index % 12 + 1)
+        
+    def to_records(self):
+        """設定表を辞書の一覧として取得（表の編集用、適用開始日はdate）"""
+        return [
+            dict(zip(POLICY_COLUMNS, (policy.effective_from, policy.rate_per_km, policy.daily_allowance, policy.closing_day)))
+            for policy in self.policies
+        ]
+        
+    def to_csv(self):
+        """設定表をCSV文字列として出力"""
+        lines = [','.join(POLICY_COLUMNS)]
+        for effective_from, rate, allowance, closing_day in (policy.key() for policy in self.policies):
+            lines.append(f"{effective_from},{rate:g},{allowance},{'' if closing_day is None else closing_day}")
+        return '\n'.join(lines) + '\n'
+
+def current_period():
+    """今月の精算期間（年, 月）（精算期間を指定しない場合に日付の年の補完に使う）"""
+    today = date.today()
+    return today.year, today.month
+
+def period_label(period):
+    """精算期間の表示（「2025年1月」）"""
+    year, month = period
+    return f"{year}年{month}月"
+
+def blank(value):
+    """設定表の値が空か（CSVの空欄・表の編集で削除した値）"""
+    return value is None or value == '' or value != value
+
+def parse_policy(record):
+    """設定表の1行（文字列・数値の辞書）をRatePolicyに変換（空欄の単価・運転手当は既定の値）"""
+    try:
+        effective_from = record['effective_from']
+        if blank(effective_from):
+            raise ValueError("適用開始日がありません")
+        if isinstance(effective_from, str):
+            effective_from = date.fromisoformat(effective_from.strip())
+        elif hasattr(effective_from, 'date'):
+            effective_from = effective_from.date()  # pandasのTimestamp・datetime
+        rate = RATE_PER_KM if blank(record.get('rate_per_km')) else float(record['rate_per_km'])
+        allowance = DAILY_ALLOWANCE if blank(record.get('daily_allowance')) else int(float(record['daily_allowance']))
+        closing_day = None if blank(record.get('closing_day')) else int(float(record['closing_day']))
+    except (KeyError, TypeError, ValueError) as error:
+        raise ValueError(f"設定表の行が正しくありません: {record} ({error})") from None
+    if rate < 0 or allowance < 0:
+        raise ValueError(f"単価・運転手当は0以上で指定してください: {record}")
+    return RatePolicy(effective_from, int(rate) if float(rate).is_integer() else rate, allowance, closing_day)
+
+def policies_from_records(records):
+    """辞書の一覧から設定表を作成"""
+    return PolicyTable([parse_policy(record) for record in records])
+
+def load_policies(path):
+    """CSV（effective_from,rate_per_km,daily_allowance,closing_day）から設定表を読み込む"""
+    with open(path, encoding='utf-8-sig', newline='') as file:
+        return policies_from_records(list(csv.DictReader(file)))
+
+def default_policies():
+    """既定の設定表（PINOS_POLICY_PATHが指定されていればそのCSV）"""
+    if POLICY_PATH:
+        return load_policies(POLICY_PATH)
+    return DEFAULT_POLICIES
+
+DEFAULT_POLICIES = PolicyTable([RatePolicy(date(1900, 1, 1))])
@@ -0,0 +1,74 @@
+"""経路の正規化と、経路ごとの距離の統計による外れ値の検出"""
+from bisect import insort
+from functools import lru_cache
+import re
+import threading
+import unicodedata
+
+from .instrument import stage
+
+# 経路の区切り（矢印・波ダッシュなど）を「→」にそろえる
+ROUTE_ARROW_PATTERN = re.compile(r'\s*(?:→|⇒|➡|->|=>|ー>|~|〜|－)\s*')
+# 経路の比較で無視する空白・句読点・括弧
+ROUTE_NOISE_PATTERN = re.compile(r'[\s、。,.・「」『』()\[\]【】]+')
+
+# 距離の外れ値とみなす条件（過去の件数が少ない経路は判定しない）
+ROUTE_MIN_SAMPLES = 3         # 判定に必要な過去の件数
+ROUTE_ANOMALY_RATIO = 0.5     # 中央値からの許容割合
+ROUTE_ANOMALY_MIN_KM = 2.0    # 中央値からの許容値の下限(km)
+
+@lru_cache(maxsize=65536)
+def route_key(route):
+    """経路の比較用キーを作成（全角・半角、空白、句読点、矢印の表記揺れを吸収）"""
+    text = unicodedata.normalize('NFKC', route).lower()
+    text = ROUTE_ARROW_PATTERN.sub('→', text)
+    text = ROUTE_NOISE_PATTERN.sub('', text)
+    return text.strip('→')
+
+class RouteIndex:
+    """経路ごとの距離の中央値の索引（エントリーを追加するたびに更新し、判定は1件あたりO(1)）"""
+    
+    def __init__(self):
+        self.distances = {}  # 経路キー -> 距離の昇順リスト
+        self.medians = {}    # 経路キー -> 距離の中央値（件数がROUTE_MIN_SAMPLES以上の経路のみ）
+        self.version = 0     # 更新するたびに増える（判定結果のキャッシュのキー）
+        self.lock = threading.Lock()
+        
+    def __len__(self):
+        return len(self.distances)
+        
+    @stage('route_index_update', rows=lambda args, result: len(args[1]))
+    def update(self, df):
+        """エントリー（route・distance列）を索引に追加"""
+        with self.lock:
+            changed = set()
+            for route, distance in zip(df['route'].tolist(), df['distance'].tolist()):
+                key = route_key(route)
+                insort(self.distances.setdefault(key, []), float(distance))
+                changed.add(key)
+            for key in changed:
+                distances = self.distances[key]
+                count = len(distances)
+                if count >= ROUTE_MIN_SAMPLES:
+                    middle = count // 2
+                    self.medians[key] = distances[middle] if count % 2 else (distances[middle - 1] + distances[middle]) / 2
+            self.version += 1
+            
+    def median(self, route):
+        """経路の距離の中央値（過去の件数が足りない場合はNone）"""
+        return self.medians.get(route_key(route))
+        
+    @stage('check_distances', rows=lambda args, checked: len(checked))
+    def check(self, df):
+        """エントリーの距離を経路の中央値と比較（route_median・distance_anomaly列を返す、dfと同じ行順）"""
+        import numpy as np
+        import pandas as pd
+        
+        # 経路はカテゴリ型なので、種類ごとに1回だけ中央値を引く
+        routes = df['route'].astype('category').cat
+        with self.lock:
+            medians = [self.medians.get(route_key(route)) for route in routes.categories]
+        medians = pd.Series(np.array(medians + [None], dtype=float)[routes.codes.to_numpy()], index=df.index)
+        tolerance = (medians * ROUTE_ANOMALY_RATIO).clip(lower=ROUTE_ANOMALY_MIN_KM)
+        anomaly = (df['distance'].astype(float) - medians).abs() > tolerance
+        return pd.DataFrame({'route_median': medians, 'distance_anomaly': anomaly})
@@ -0,0 +1,205 @@
+"""担当者ごとの交通費精算"""
+import numpy as np
+import pandas as pd
+
+from .instrument import stage
+from .parser import date_labels, entry_distances
+from .policy import DEFAULT_POLICIES, RATE_PER_KM, SETTLEMENT_PERIOD, current_period, period_label
+
+# 精算書の列名（交通費の列名には単価を表示する）
+FEE_COLUMN = '交通費（距離×{rate}P）(円)'
+FEE_COLUMN_MIXED = '交通費（距離×単価）(円)'  # 期間内で単価が変わる場合
+REPORT_PERIOD_ATTR = 'period'  # 精算書・合計のDataFrameに付ける精算期間の表示（attrsのキー）
+
+# 再計算結果の金額の列
+AMOUNT_COLUMNS = ['distance', 'fee', 'allowance', 'total']
+
+class Settlement:
+    """全担当者の精算データ（経路ごとの明細・担当者別合計・担当者ごとの行範囲）"""
+    
+    def __init__(self, rows, totals, index, period=SETTLEMENT_PERIOD, excluded=0):
+        self.rows = rows      # 担当者・日付順に並べた経路ごとの明細
+        self.totals = totals  # 担当者別の合計（担当者名がインデックス）
+        self.index = index    # 担当者名 -> 明細の行範囲(開始, 終了)
+        self.period = period  # 精算期間（年, 月）
+        self.excluded = excluded  # 別の精算期間になるため含めなかったエントリーの数
+        self.reports = {}     # 作成済みの精算書（担当者名 -> DataFrame）
+        self.totals.attrs[REPORT_PERIOD_ATTR] = self.period_label
+        
+    @property
+    def names(self):
+        """担当者名の一覧（名前順）"""
+        return list(self.index)
+        
+    @property
+    def period_label(self):
+        """精算期間の表示（「2025年1月」）"""
+        return period_label(self.period)
+        
+    @property
+    def fee_column(self):
+        """交通費の列名"""
+        return self.rows.columns[3]
+        
+    def details(self, name):
+        """担当者の明細行を取得"""
+        start, stop = self.index[name]
+        return self.rows.iloc[start:stop]
+        
+    def report(self, name):
+        """担当者の精算書データ（合計行付き）を取得"""
+        report = self.reports.get(name)
+        if report is None:
+            report = self.reports[name] = self.build_report(name)
+        return report
+        
+    @stage('create_expense_report', rows=lambda args, report: len(report))
+    def build_report(self, name):
+        """担当者の明細に合計行を付けた精算書データを作成"""
+        total_row = self.totals.loc[[name]].reset_index(drop=True)
+        total_row.insert(0, '日付', '合計')
+        total_row.insert(1, '経路', '')
+        report = pd.concat([self.details(name), total_row], ignore_index=True)
+        # 出力処理（別プロセスを含む）で精算期間を表示できるよう精算書に付けておく
+        report.attrs[REPORT_PERIOD_ATTR] = self.period_label
+        return report
+
+def report_period(data):
+    """精算書・合計のDataFrameに付けた精算期間の表示を取得（ない場合は既定の精算期間）"""
+    return data.attrs.get(REPORT_PERIOD_ATTR) or period_label(SETTLEMENT_PERIOD)
+
+def fee_column(rates):
+    """交通費の列名（適用した単価が1種類ならその単価を表示）"""
+    rates = np.unique(rates)
+    if len(rates) == 1:
+        return FEE_COLUMN.format(rate=f"{rates[0]:g}")
+    return FEE_COLUMN_MIXED if len(rates) else FEE_COLUMN.format(rate=RATE_PER_KM)
+
+def entry_amounts(data, policies=DEFAULT_POLICIES):
+    """担当者・日付順に並べたエントリーの単価・交通費・運転手当を一括で計算
+    
+    各エントリーの日付に有効な設定を適用し、担当者の日付ごとの最初の経路にのみ運転手当を付与する
+    （日付のないエントリーは同じ日としてまとめず、運転手当を付与しない）。
+    精算期間（年 × 100 + 月）・距離・単価・交通費・運転手当の配列を返す。
+    """
+    dates = data['date'].to_numpy()
+    positions = policies.lookup(dates)
+    distance = entry_distances(data)
+    rates = policies.rates[positions]
+    first_of_date = ~data.duplicated(['name', 'date']).to_numpy() & ~np.isnat(dates)
+    allowance = np.where(first_of_date, policies.allowances[positions], 0).astype('int64')
+    return policies.periods(dates, positions), distance, rates, distance * rates, allowance
+
+def settlement_periods(periods):
+    """エントリーの精算期間（年 × 100 + 月の配列）を(年, 月)の一覧にする（古い順、日付のないエントリーは除く）"""
+    return [(value // 100, value % 100) for value in np.unique(periods[periods > 0]).tolist()]
+
+@stage('create_settlement', rows=lambda args, settlement: len(settlement.rows))
+def create_settlement(df, policies=None, period=None):
+    """全担当者の精算データを一括で作成（経路ごとに表示）
+    
+    policiesは単価・運転手当の設定表（既定は定数の設定）、periodは精算期間（年, 月）。
+    設定表の締め日から求めた精算期間がperiodのエントリーだけを精算する（含めなかった件数はexcluded）。
+    periodを省略した場合はエントリーの精算期間を使い、複数の精算期間にまたがる場合はValueError
+    （split_settlements()で精算期間ごとに作成する）。
+    """
+    # 担当者・日付順にソート（同じ日付の経路は入力順を維持）
+    # 担当者はカテゴリ型（名前順のコード）、日付はdatetime64なので年をまたぐ期間も正しく並ぶ
+    data = df.sort_values(['name', 'date'], kind='stable')
+    periods, distance, rates, fee, allowance = entry_amounts(data, policies or DEFAULT_POLICIES)
+    if period is None:
+        found = settlement_periods(periods)
+        if len(found) > 1:
+            labels = '、'.join(period_label(found_period) for found_period in found)
+            raise ValueError(f"エントリーが複数の精算期間（{labels}）にまたがっています。精算期間を指定してください")
+        period = found[0] if found else current_period()
+        
+    # 締め日より後の日付など、別の精算期間になるエントリーは含めない
+    # （運転手当は同じ日付のエントリーの中で決まり、同じ日付は同じ精算期間になるため、絞り込む前に計算してよい）
+    selected = periods == period[0] * 100 + period[1]
+    excluded = len(selected) - int(selected.sum())
+    if excluded:
+        data = data[selected]
+        distance, rates, fee, allowance = distance[selected], rates[selected], fee[selected], allowance[selected]
+    names = data['name'].to_numpy()
+    
+    rows = pd.DataFrame({
+        '日付': date_labels(data['date'].to_numpy()),
+        '経路': data['route'].to_numpy(),
+        '合計距離(km)': distance.round(1),
+        fee_column(rates): fee.astype('int64'),
+        '運転手当(円)': allowance,
+        '合計(円)': (fee + allowance).astype('int64')
+    })
+    
+    # 担当者ごとの行範囲（ソート済みなので連続した区間になる）
+    starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]]) if len(names) else np.array([], dtype='int64')
+    stops = np.r_[starts[1:], len(names)]
+    index = {names[start]: (int(start), int(stop)) for start, stop in zip(starts, stops)}
+    
+    # 担当者別の合計
+    totals = rows.iloc[:, 2:].groupby(names, sort=False).sum()
+    
+    return Settlement(rows, totals, index, period, excluded)
+
+def split_settlements(df, policies=None):
+    """エントリーを精算期間ごとに分けて精算データを作成（{(年, 月): Settlement}、古い順）"""
+    policies = policies or DEFAULT_POLICIES
+    periods = policies.periods(df['date'].to_numpy())
+    return {
+        period: create_settlement(df[periods == period[0] * 100 + period[1]], policies, period)
+        for period in settlement_periods(periods)
+    }
+
+def create_expense_report(person_data, policies=None, period=None):
+    """個人の精算書データを作成（経路ごとに表示）"""
+    settlement = create_settlement(person_data, policies, period)
+    return settlement.report(settlement.names[0])
+
+@stage('recalculate', rows=lambda args, entries: len(entries))
+def recalculate(df, policies=DEFAULT_POLICIES):
+    """複数月のエントリーを設定表に従って1回で再計算（エントリーごとの精算期間・単価・金額を返す）
+    
+    精算期間（YYYY-MM）は各エントリーの日付と締め日から求めるため、1年分の履歴をまとめて渡せる。
+    """
+    data = df.sort_values(['name', 'date'], kind='stable')
+    periods, distance, rates, fee, allowance = entry_amounts(data, policies)
+    
+    # 精算期間の種類ごとに1回だけ表示用の文字列を作成する
+    months, codes = np.unique(periods, return_inverse=True)
+    labels = [f"{month // 100:04d}-{month % 100:02d}" if month else '' for month in months.tolist()]
+    return pd.DataFrame({
+        'period': pd.Categorical.from_codes(codes.reshape(-1), labels),
+        'name': data['name'].to_numpy(),
+        'date': data['date'].to_numpy(),
+        'route': data['route'].to_numpy(),
+        'id': data['id'].to_numpy(),
+        'rate': rates,
+        'distance': distance.round(1),
+        'fee': fee.astype('int64'),
+        'allowance': allowance,
+        'total': (fee + allowance).astype('int64'),
+    })
+
+def period_totals(entries):
+    """再計算結果の精算期間・担当者ごとの合計"""
+    return entries.groupby(['period', 'name'], observed=True)[AMOUNT_COLUMNS].sum()
+
+def diff_settlements(old, new, by_period=True):
+    """2つの再計算結果の担当者ごとの合計を比較（by_periodがFalseなら全期間の合計で比較）
+    
+    片方にしかない担当者・精算期間は0として比較し、差額（new - old）の絶対値が大きい順に返す。
+    """
+    old_totals, new_totals = period_totals(old), period_totals(new)
+    if not by_period:
+        old_totals = old_totals.groupby(level='name', observed=True).sum()
+        new_totals = new_totals.groupby(level='name', observed=True).sum()
+    diff = old_totals.join(new_totals, how='outer', lsuffix='_old', rsuffix='_new').fillna(0)
+    for column in AMOUNT_COLUMNS[1:]:
+        diff[[f'{column}_old', f'{column}_new']] = diff[[f'{column}_old', f'{column}_new']].astype('int64')
+    diff['difference'] = diff['total_new'] - diff['total_old']
+    return diff.sort_values('difference', key=np.abs, ascending=False, kind='stable')
+
+def compare_policies(df, old_policies, new_policies, by_period=True):
+    """同じエントリーを2つの設定表で再計算し、担当者ごとの合計の差を返す"""
+    return diff_settlements(recalculate(df, old_policies), recalculate(df, new_policies), by_period)
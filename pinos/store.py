@@ -0,0 +1,209 @@
+"""解析済みエントリーの永続ストア（SQLite）"""
+from datetime import date
+import hashlib
+import os
+import sqlite3
+import threading
+
+from .dedup import find_duplicates
+from .instrument import stage
+from .parser import compact_entries, entry_distances
+
+# ストアの設定
+STORE_PATH = os.environ.get('PINOS_STORE_PATH', 'pinos.db')
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    hash TEXT NOT NULL UNIQUE,    -- 担当者・日付・経路・距離・同一内容の出現順から作成したキー
+    period TEXT NOT NULL,         -- 取り込んだ精算期間（YYYY-MM）
+    name TEXT NOT NULL,
+    date TEXT NOT NULL,           -- YYYY-MM-DD
+    route TEXT NOT NULL,
+    distance REAL NOT NULL,
+    source TEXT,                  -- 取り込み元（ファイル名など）
+    imported_at TEXT NOT NULL,
+    duplicate TEXT                -- 取り込み時に検出した重複の種類（exact/near、重複でなければNULL）
+);
+CREATE INDEX IF NOT EXISTS entries_name ON entries (name, date);
+CREATE INDEX IF NOT EXISTS entries_date ON entries (date);
+CREATE INDEX IF NOT EXISTS entries_period ON entries (period);
+"""
+STORE_COLUMNS = ['period', 'name', 'date', 'route', 'distance', 'source', 'imported_at', 'duplicate']
+STORE_QUERY_CHUNK = 500  # IN句に一度に渡すキーの数（SQLiteの変数の上限より小さくする）
+
+def period_key(year, month):
+    """精算期間のキー（YYYY-MM）"""
+    return f"{year:04d}-{month:02d}"
+
+def period_range(year, month):
+    """精算期間に保存できる日付の範囲（ISO形式、解析時に年を補完する範囲と同じく精算月までの12か月）"""
+    start = date(year, 1, 1) if month == 12 else date(year - 1, month + 1, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start.isoformat(), date.fromordinal(end.toordinal() - 1).isoformat()
+
+def iso_dates(dates, ids):
+    """datetime64の日付をISO形式（YYYY-MM-DD）の文字列に変換（存在しない日付があればエントリー番号を示してValueError）"""
+    import pandas as pd
+    
+    codes, days = pd.factorize(dates)
+    if (codes < 0).any():
+        invalid = ', '.join(map(str, ids[codes < 0].tolist()))
+        raise ValueError(f"日付が正しくないエントリーがあります（No. {invalid}）")
+    labels = pd.DatetimeIndex(days).strftime('%Y-%m-%d').tolist()
+    return [labels[code] for code in codes]
+
+def entry_hashes(df, dates, distances):
+    """エントリーの内容キーを作成（同じ内容のエントリーは出現順で区別する）"""
+    occurrences = {}
+    hashes = []
+    for name, iso_date, route, distance in zip(df['name'].tolist(), dates, df['route'].tolist(), distances.tolist()):
+        content = f"{name}\x1f{iso_date}\x1f{route}\x1f{distance!r}"
+        occurrence = occurrences[content] = occurrences.get(content, -1) + 1
+        hashes.append(hashlib.blake2b(f"{content}\x1f{occurrence}".encode('utf-8'), digest_size=16).hexdigest())
+    return hashes
+
+class EntryStore:
+    """解析済みエントリーをSQLiteに保存・検索するストア（スレッド間で共有可能）"""
+    
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(STORE_SCHEMA)
+        # 重複の種類の列がない以前のストアには列を追加する（保存済みのエントリーは重複なしとして扱う）
+        columns = {column for _, column, *_ in self.connection.execute("PRAGMA table_info(entries)")}
+        if 'duplicate' not in columns:
+            self.connection.execute("ALTER TABLE entries ADD COLUMN duplicate TEXT")
+        self.lock = threading.Lock()
+        self.index = None  # 経路ごとの距離の索引（route_index()で初めて作成）
+        self.index_lock = threading.Lock()
+        
+    def close(self):
+        self.connection.close()
+        
+    @stage('store_upsert', rows=lambda args, count: count)
+    def upsert(self, df, year, month, source=None, duplicates=None):
+        """精算期間（year年month月）のエントリーを追加・更新し、件数を返す（同じ内容は重複して保存しない）
+        
+        精算から除外するかどうかに関わらず全エントリーを保存し、重複エントリー（duplicatesは
+        find_duplicates()の結果、省略した場合は検出する）には種類を記録する。読み込む側で除外する種類を選ぶ。
+        日付が精算期間（精算月までの12か月）に含まれないエントリーがある場合はValueError。
+        """
+        if df.empty:
+            return 0
+        dates = iso_dates(df['date'].to_numpy(), df['id'].to_numpy())
+        period = period_key(year, month)
+        # 別の精算期間で日付を補完したデータを保存しないよう、日付が精算期間の範囲内か確認する
+        start, end = period_range(year, month)
+        if min(dates) < start or max(dates) > end:
+            raise ValueError(
+                f"{period}の精算期間（{start}〜{end}）に含まれない日付のエントリーがあります（{min(dates)}〜{max(dates)}）"
+            )
+        distances = entry_distances(df)
+        hashes = entry_hashes(df, dates, distances)
+        if duplicates is None:
+            duplicates = find_duplicates(df)
+        kinds = dict(zip(duplicates['id'].tolist(), duplicates['kind'].tolist()))
+        imported_at = date.today().isoformat()
+        rows = zip(
+            hashes, [period] * len(df), df['name'].tolist(), dates, df['route'].tolist(),
+            distances.tolist(), [source] * len(df), [imported_at] * len(df),
+            [kinds.get(entry_id) for entry_id in df['id'].tolist()]
+        )
+        with self.index_lock:
+            # 索引を作成済みの場合は、新しく保存するエントリーのみ索引に追加する
+            index = self.index
+            with self.lock, self.connection:
+                existing = self.existing_hashes(hashes) if index is not None else None
+                self.connection.executemany(
+                    """
+                    INSERT INTO entries (hash, period, name, date, route, distance, source, imported_at, duplicate)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (hash) DO UPDATE SET
+                        period = excluded.period, source = excluded.source, imported_at = excluded.imported_at,
+                        duplicate = excluded.duplicate
+                    """,
+                    rows
+                )
+            if index is not None:
+                index.update(df[[entry_hash not in existing for entry_hash in hashes]])
+        return len(df)
+        
+    def existing_hashes(self, hashes):
+        """保存済みのエントリーの内容キーを取得（ロック中に呼び出す）"""
+        existing = set()
+        for start in range(0, len(hashes), STORE_QUERY_CHUNK):
+            chunk = hashes[start:start + STORE_QUERY_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = self.connection.execute(f"SELECT hash FROM entries WHERE hash IN ({placeholders})", chunk)
+            existing.update(entry_hash for entry_hash, in rows)
+        return existing
+        
+    def route_index(self):
+        """保存済みの全エントリーから作成した経路ごとの距離の索引（以降は保存のたびに更新）"""
+        from .routes import RouteIndex
+        
+        with self.index_lock:
+            if self.index is None:
+                index = RouteIndex()
+                index.update(self.query(['route', 'distance']))
+                self.index = index
+            return self.index
+        
+    def periods(self):
+        """保存されている精算期間（YYYY-MM）と件数の一覧（新しい順）"""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT period, COUNT(*) FROM entries GROUP BY period ORDER BY period DESC"
+            ).fetchall()
+            
+    @stage('store_query', rows=lambda args, df: len(df))
+    def query(self, columns=STORE_COLUMNS, period=None, start=None, end=None, name=None, duplicates=()):
+        """条件に合うエントリーを日付・取り込み順に取得（columnsで読み込む列を絞り込み、duplicatesの種類の重複は除く）"""
+        import pandas as pd
+        
+        unknown = set(columns) - set(STORE_COLUMNS)
+        if unknown:
+            raise ValueError(f"未対応の列です: {', '.join(sorted(unknown))}")
+        conditions = []
+        params = []
+        for condition, value in [('period = ?', period), ('date >= ?', start), ('date <= ?', end), ('name = ?', name)]:
+            if value is not None:
+                conditions.append(condition)
+                params.append(str(value))
+        if duplicates:
+            conditions.append(f"(duplicate IS NULL OR duplicate NOT IN ({', '.join('?' * len(duplicates))}))")
+            params.extend(duplicates)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        sql = f"SELECT {', '.join(columns)} FROM entries {where} ORDER BY date, rowid"
+        with self.lock:
+            return pd.read_sql_query(sql, self.connection, params=params)
+            
+    def load_period(self, year, month):
+        """精算期間のエントリーを解析結果と同じ形式（ENTRY_COLUMNS）で取得（再解析は不要）"""
+        return self.load_entries(period=period_key(year, month))
+        
+    def load_entries(self, **conditions):
+        """条件（query()と同じ）に合うエントリーを解析結果と同じ形式で取得（複数の精算期間をまとめて再計算する場合など）
+        
+        duplicatesに精算で除外する重複の種類を渡すと、精算と同じエントリーだけを読み込む。
+        """
+        import pandas as pd
+        
+        df = self.query(['name', 'date', 'route', 'distance'], **conditions)
+        df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d').astype('datetime64[ns]')
+        df['id'] = range(1, len(df) + 1)
+        return compact_entries(df)
+        
+    def export_parquet(self, path, columns=STORE_COLUMNS, **conditions):
+        """条件に合うエントリーをParquetファイルに書き出す（pyarrowが必要）"""
+        self.query(columns, **conditions).to_parquet(path, index=False)
+
+def read_parquet(path, columns=None, start=None, end=None):
+    """Parquetに書き出したエントリーを必要な列・期間だけ読み込む（pyarrowが必要）"""
+    import pandas as pd
+    
+    filters = []
+    if start is not None:
+        filters.append(('date', '>=', str(start)))
+    if end is not None:
+        filters.append(('date', '<=', str(end)))
+    return pd.read_parquet(path, columns=columns, filters=filters or None)
@@ -0,0 +1,403 @@
+"""テンプレートのレイアウトを複製したxlsxの直接書き出し
+
+書式を設定したxlsxテンプレートを1回だけ読み込み、スタイル（styles.xml）・テーマ・列幅・
+ページ設定・タイトル行・注釈行をそのまま使って、担当者ごとのシートのXMLを列の配列から直接書き出す。
+セルごとのオブジェクトを作らないため、openpyxlで書き出すより大幅に速く、メモリもほとんど使わない。
+
+テンプレートの最初のシートは次の行で構成する（行の高さ・セルの書式・結合セルを各シートに複製する）。
+
+1. タイトル行（「{name}」に担当者名、「{period}」に精算期間を埋め込む）
+2. 見出し行（各列の見出しは精算書の列名で置き換える）
+3. 明細行の書式見本
+4. 合計行の書式見本
+5. 任意の数の空行と、注釈行（「{period}」などを含む行、明細の行数に合わせて下にずらす）
+
+明細・合計行以外のセルは値の種類（文字列・数値・真偽値など）と数式をそのまま複製する。数式のセル参照は
+明細の行数に合わせてずらし、明細行だけを参照する範囲（「F3:F3」など）は全明細行の範囲に広げる。
+"""
+import os
+import posixpath
+import re
+import threading
+import zipfile
+
+from lxml import etree
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+# xlsx（SpreadsheetML）の名前空間・コンテンツタイプ
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.'
+NS = {'m': MAIN_NS, 'r': REL_NS, 'p': PACKAGE_REL_NS}
+
+# 各シートに複製するテンプレートのシートの要素（SpreadsheetMLのスキーマの順序）
+SHEET_HEAD_ELEMENTS = ('sheetPr', 'sheetViews', 'sheetFormatPr', 'cols')
+SHEET_TAIL_ELEMENTS = ('printOptions', 'pageMargins', 'pageSetup', 'headerFooter')
+
+# テンプレートのプレースホルダー
+PLACEHOLDER_PATTERN = re.compile(r'\{(?:name|period)\}')
+# XMLに書けない制御文字
+ILLEGAL_CHARACTERS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# シート名に使えない文字とシート名の最大長
+SHEET_TITLE_PATTERN = re.compile(r'[\[\]:*?/\\]')
+SHEET_TITLE_LENGTH = 31
+CELL_REFERENCE = re.compile(r'([A-Z]+)(\d+)')
+# 数式中のセル参照（「$F$3」「F3:F4」、関数名・シート名の一部は除く）と文字列定数
+FORMULA_REFERENCE = re.compile(
+    r'"(?:[^"]|"")*"'
+    r'|(?<![\w.!$])(\$?[A-Z]{1,3}\$?)(\d+)(?::(\$?[A-Z]{1,3}\$?)(\d+))?(?![\w(])'
+)
+
+XLSX_CHUNK_ROWS = 2000  # シートのXMLをまとめて書き出す行数
+XLSX_COMPRESS_LEVEL = 1  # ZIPの圧縮レベル（シートのXMLは繰り返しが多く、低いレベルでも十分に縮む）
+
+def escape(text):
+    """XMLのテキスト・属性値用にエスケープ（書けない制御文字は除く）"""
+    text = ILLEGAL_CHARACTERS.sub('', text)
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+def shift_formula(formula, detail, shift):
+    """数式のセル参照を明細の行数に合わせてずらす（明細行より下の行はshift行下へ、明細行で終わる範囲は広げる）"""
+    def shift_row(row, stop=False):
+        row = int(row)
+        if row > detail or (stop and row == detail):
+            row += shift
+        return row
+        
+    def replace(match):
+        start_column, start_row, stop_column, stop_row = match.groups()
+        if start_column is None:
+            return match.group()  # 文字列定数
+        if stop_column is None:
+            return f"{start_column}{shift_row(start_row)}"
+        return f"{start_column}{shift_row(start_row)}:{stop_column}{shift_row(stop_row, stop=True)}"
+        
+    return FORMULA_REFERENCE.sub(replace, formula)
+
+def fill_placeholders(text, name, period):
+    """テンプレートの文字列に担当者名・精算期間を埋め込む"""
+    return text.replace('{name}', name).replace('{period}', period)
+
+class TemplateRow:
+    """テンプレートの1行（行番号・高さ・セルの列番号と書式番号と値）"""
+    
+    def __init__(self, number, height=None, cells=()):
+        self.number = number
+        self.height = height  # 行の高さ（Noneは既定の高さ）
+        # [(列番号（0始まり）, 書式番号, 値の種類（セルのt属性、文字列は's'）, 値またはNone, 数式またはNone), ...]
+        self.cells = list(cells)
+        
+    @property
+    def styles(self):
+        """列番号 -> 書式番号"""
+        return {column: style for column, style, *_ in self.cells}
+        
+    def attributes(self):
+        """行の要素の属性（高さ）"""
+        return f' ht="{self.height}" customHeight="1"' if self.height else ''
+
+class XlsxTemplate:
+    """読み込み済みのxlsxテンプレート（スタイル・テーマ・シートのレイアウト、dataはパスまたはファイルオブジェクト）"""
+    
+    def __init__(self, data):
+        with zipfile.ZipFile(data) as package:
+            parts = self.read_parts(package)
+            self.styles = package.read(parts['styles'])  # styles.xmlはそのまま使う（書式番号を共有する）
+            self.theme = package.read(parts['theme']) if 'theme' in parts else None
+            strings = self.read_strings(package.read(parts['sharedStrings'])) if 'sharedStrings' in parts else []
+            sheet = etree.fromstring(package.read(parts['sheet']))
+        self.read_layout(sheet, strings)
+        
+    @staticmethod
+    def read_parts(package):
+        """ブックの関係ファイルからスタイル・テーマ・共有文字列・最初のシートのパスを取得"""
+        workbook = etree.fromstring(package.read('xl/workbook.xml'))
+        relations = etree.fromstring(package.read('xl/_rels/workbook.xml.rels'))
+        targets = {}
+        parts = {}
+        for relation in relations.iterfind('p:Relationship', NS):
+            target = relation.get('Target')
+            path = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+            targets[relation.get('Id')] = path
+            kind = relation.get('Type').rsplit('/', 1)[-1]
+            if kind in ('styles', 'theme', 'sharedStrings'):
+                parts[kind] = path
+        first_sheet = workbook.find('m:sheets/m:sheet', NS)
+        if first_sheet is None or 'styles' not in parts:
+            raise ValueError("テンプレートにシート・スタイルがありません")
+        parts['sheet'] = targets[first_sheet.get(f'{{{REL_NS}}}id')]
+        return parts
+        
+    @staticmethod
+    def read_strings(data):
+        """共有文字列の一覧を読み込む（書式付き文字列は文字だけをつなげる）"""
+        return [''.join(item.itertext()) for item in etree.fromstring(data).iterfind('m:si', NS)]
+        
+    def read_layout(self, sheet, strings):
+        """シートの行・結合セル・列幅・ページ設定を読み込む"""
+        rows = {}
+        for row in sheet.iterfind('m:sheetData/m:row', NS):
+            number = int(row.get('r'))
+            height = row.get('ht') if row.get('customHeight') in ('1', 'true') else None
+            cells = []
+            for cell in row.iterfind('m:c', NS):
+                column, _ = CELL_REFERENCE.fullmatch(cell.get('r')).groups()
+                kind = cell.get('t', 'n')
+                value = cell.findtext('m:v', namespaces=NS)
+                formula = cell.find('m:f', NS)
+                if formula is not None:
+                    # 共有数式・配列数式は他のセルとの関係を複製できないため読み込まない
+                    if formula.get('t') in ('shared', 'array') or not formula.text:
+                        raise ValueError(f"テンプレートの共有数式・配列数式には対応していません（{cell.get('r')}）")
+                    formula = formula.text
+                if kind == 's' and value is not None:
+                    value = strings[int(value)]
+                elif kind == 'inlineStr':
+                    kind, value = 's', ''.join(cell.find('m:is', NS).itertext())
+                cells.append((column_index_from_string(column) - 1, int(cell.get('s', 0)), kind, value, formula))
+            rows[number] = TemplateRow(number, height, cells)
+            
+        # タイトル行（最初のプレースホルダーを含む行）から見出し行・明細行・合計行を決める
+        placeholders = [number for number, row in sorted(rows.items())
+                        if any(kind == 's' and value and PLACEHOLDER_PATTERN.search(value)
+                               for _, _, kind, value, _ in row.cells)]
+        if not placeholders:
+            raise ValueError("テンプレートにタイトル行（{name}・{period}を含む行）がありません")
+        title = placeholders[0]
+        self.top_rows = [row for number, row in sorted(rows.items()) if number <= title]
+        self.header = rows.get(title + 1, TemplateRow(title + 1))
+        self.detail = rows.get(title + 2, TemplateRow(title + 2))
+        self.total = rows.get(title + 3, self.detail)
+        self.total_number = title + 3
+        self.bottom_rows = [row for number, row in sorted(rows.items()) if number > self.total_number]
+        
+        # 結合セル（明細・合計行の結合は複製しない）
+        self.top_merges = []
+        self.bottom_merges = []
+        for merge in sheet.iterfind('m:mergeCells/m:mergeCell', NS):
+            start, stop = merge.get('ref').split(':')
+            (start_column, start_row), (stop_column, stop_row) = (
+                CELL_REFERENCE.fullmatch(start).groups(), CELL_REFERENCE.fullmatch(stop).groups()
+            )
+            span = (start_column, int(start_row), stop_column, int(stop_row))
+            if span[3] <= title + 1:
+                self.top_merges.append(span)
+            elif span[1] > self.total_number:
+                self.bottom_merges.append(span)
+                
+        # 列幅・ページ設定などはXMLのまま複製する（シートの選択状態・プリンター設定への参照は除く）
+        head = []
+        tail = []
+        for element in sheet:
+            name = etree.QName(element).localname
+            if name in SHEET_HEAD_ELEMENTS or name in SHEET_TAIL_ELEMENTS:
+                for view in element.iterfind('m:sheetView', NS):
+                    view.attrib.pop('tabSelected', None)
+                element.attrib.pop(f'{{{REL_NS}}}id', None)
+                xml = etree.tostring(element, encoding='unicode').replace(f' xmlns="{MAIN_NS}"', '')
+                (head if name in SHEET_HEAD_ELEMENTS else tail).append(xml)
+        self.head = ''.join(head)
+        self.tail = ''.join(tail)
+
+def sheet_title(name, used):
+    """シート名（「担当者名様」、使えない文字は置き換えて31文字までにし、重複は番号を付ける）"""
+    base = SHEET_TITLE_PATTERN.sub('_', f"{name}様")[:SHEET_TITLE_LENGTH]
+    title = base
+    suffix = 1
+    while title.lower() in used:
+        suffix += 1
+        title = f"{base[:SHEET_TITLE_LENGTH - len(str(suffix)) - 1]}_{suffix}"
+    used.add(title.lower())
+    return title
+
+class XlsxBook:
+    """テンプレートのレイアウトでシートを追加していくxlsxの書き出し（close()で完成する）"""
+    
+    def __init__(self, template, output):
+        self.template = template
+        self.archive = zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED, compresslevel=XLSX_COMPRESS_LEVEL)
+        self.strings = {}   # 文字列 -> 共有文字列の番号
+        self.titles = []    # シート名（追加した順）
+        self.used_titles = set()
+        
+    def string(self, text):
+        """文字列の共有文字列の番号（初出の場合は追加）"""
+        return self.strings.setdefault(text, len(self.strings))
+        
+    def string_column(self, values):
+        """文字列の列を共有文字列の番号のリストに変換（同じ文字列は1回だけ登録する）"""
+        import pandas as pd
+        
+        codes, uniques = pd.factorize(pd.array(values, dtype=object))
+        numbers = [self.string(text) for text in uniques.tolist()]
+        return [numbers[code] for code in codes.tolist()]
+        
+    def cell(self, column, row, style, value):
+        """1つのセルのXML（空の値は書式のみのセル）"""
+        reference = f"{get_column_letter(column + 1)}{row}"
+        if value is None or value == '':
+            return f'<c r="{reference}" s="{style}"/>'
+        if isinstance(value, str):
+            return f'<c r="{reference}" s="{style}" t="s"><v>{self.string(value)}</v></c>'
+        return f'<c r="{reference}" s="{style}"><v>{value}</v></c>'
+        
+    def typed_cell(self, column, row, style, kind, value, formula):
+        """テンプレートの値の種類・数式のまま1つのセルのXML（数式は計算結果を持たせずExcelで再計算させる）"""
+        reference = f"{get_column_letter(column + 1)}{row}"
+        if formula is not None:
+            return f'<c r="{reference}" s="{style}"><f>{escape(formula)}</f></c>'
+        if value is None:
+            return f'<c r="{reference}" s="{style}"/>'
+        kind = '' if kind == 'n' else f' t="{kind}"'
+        return f'<c r="{reference}" s="{style}"{kind}><v>{escape(value)}</v></c>'
+        
+    def fixed_row(self, template_row, number, name, period, values=None, shift=0):
+        """テンプレートの行を複製（valuesがあれば各列の値を置き換える、shiftは数式の参照をずらす行数）"""
+        cells = []
+        for column, style, kind, value, formula in template_row.cells:
+            if values is not None:
+                cells.append(self.cell(column, number, style, values[column] if column < len(values) else None))
+            elif formula is not None:
+                formula = shift_formula(formula, self.template.detail.number, shift)
+                cells.append(self.typed_cell(column, number, style, kind, value, formula))
+            elif kind in ('s', 'str'):
+                cells.append(self.cell(column, number, style, None if value is None else fill_placeholders(value, name, period)))
+            else:
+                cells.append(self.typed_cell(column, number, style, kind, value, None))
+        return f'<row r="{number}"{template_row.attributes()}>{"".join(cells)}</row>'
+        
+    def row_format(self, count, text_columns):
+        """明細行のXMLの書式文字列（{0}は行番号、{1}以降は各列の値・共有文字列の番号）"""
+        styles = self.template.detail.styles
+        cells = []
+        for index in range(count):
+            reference = f"{get_column_letter(index + 1)}{{0}}"
+            style = styles.get(index, 0)
+            if index in text_columns:
+                cells.append(f'<c r="{reference}" s="{style}" t="s"><v>{{{index + 1}}}</v></c>')
+            else:
+                cells.append(f'<c r="{reference}" s="{style}"><v>{{{index + 1}}}</v></c>')
+        return f'<row r="{{0}}"{self.template.detail.attributes()}>{"".join(cells)}</row>'
+        
+    def add_sheet(self, name, period, headers, columns, total, text_columns=None):
+        """担当者1人分のシートを追加（columnsは明細の列ごとの値のリスト、totalは合計行の値）
+        
+        text_columnsは文字列の列の位置で、指定した場合はその列の値をstring_column()で変換済みの
+        共有文字列の番号として書き込む（未指定の場合は文字列の列をここで変換する）。
+        """
+        template = self.template
+        title = sheet_title(name, self.used_titles)
+        self.titles.append(title)
+        count = len(columns[0]) if columns else 0
+        shift = count - 1  # 合計行より下の行（注釈など）をずらす行数
+        
+        if text_columns is None:
+            text_columns = {index for index, values in enumerate(columns) if len(values) and isinstance(values[0], str)}
+            columns = [self.string_column(values) if index in text_columns else values for index, values in enumerate(columns)]
+        row_format = self.row_format(len(columns), text_columns).format
+        
+        path = f"xl/worksheets/sheet{len(self.titles)}.xml"
+        with self.archive.open(path, 'w', force_zip64=True) as stream:
+            stream.write((
+                f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                f'<worksheet xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">{template.head}<sheetData>'
+            ).encode('utf-8'))
+            parts = [self.fixed_row(row, row.number, name, period, shift=shift) for row in template.top_rows]
+            parts.append(self.fixed_row(template.header, template.header.number, name, period, list(headers)))
+            stream.write(''.join(parts).encode('utf-8'))
+            
+            # 明細行（一定の行数ごとにまとめて書き出す）
+            first = template.detail.number
+            for start in range(0, count, XLSX_CHUNK_ROWS):
+                stop = min(start + XLSX_CHUNK_ROWS, count)
+                chunk = map(row_format, range(first + start, first + stop), *(values[start:stop] for values in columns))
+                stream.write(''.join(chunk).encode('utf-8'))
+                
+            parts = [self.fixed_row(template.total, first + count, name, period, list(total))]
+            parts.extend(self.fixed_row(row, row.number + shift, name, period, shift=shift) for row in template.bottom_rows)
+            merges = [
+                f"{start_column}{start_row + offset}:{stop_column}{stop_row + offset}"
+                for merges, offset in [(template.top_merges, 0), (template.bottom_merges, shift)]
+                for start_column, start_row, stop_column, stop_row in merges
+            ]
+            parts.append('</sheetData>')
+            if merges:
+                parts.append(f'<mergeCells count="{len(merges)}">')
+                parts.extend(f'<mergeCell ref="{merge}"/>' for merge in merges)
+                parts.append('</mergeCells>')
+            parts.append(f'{template.tail}</worksheet>')
+            stream.write(''.join(parts).encode('utf-8'))
+            
+    def close(self):
+        """共有文字列・ブック・関係ファイルを書き込んでxlsxを完成させる"""
+        if not self.titles:
+            # シートが1つもないブックはExcelで開けないため空のシートを追加する
+            self.titles.append('Sheet')
+            self.archive.writestr(
+                'xl/worksheets/sheet1.xml',
+                f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet xmlns="{MAIN_NS}"><sheetData/></worksheet>'
+            )
+        header = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        sheets = range(1, len(self.titles) + 1)
+        
+        strings = ''.join(f'<si><t xml:space="preserve">{escape(text)}</t></si>' for text in self.strings)
+        self.archive.writestr('xl/sharedStrings.xml', (
+            f'{header}<sst xmlns="{MAIN_NS}" count="{len(self.strings)}" uniqueCount="{len(self.strings)}">{strings}</sst>'
+        ))
+        self.archive.writestr('xl/styles.xml', self.template.styles)
+        if self.template.theme is not None:
+            self.archive.writestr('xl/theme/theme1.xml', self.template.theme)
+            
+        workbook_sheets = ''.join(
+            f'<sheet name="{escape(title)}" sheetId="{number}" r:id="rId{number}"/>'
+            for number, title in zip(sheets, self.titles)
+        )
+        self.archive.writestr('xl/workbook.xml', (
+            f'{header}<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">'
+            f'<bookViews><workbookView activeTab="0"/></bookViews><sheets>{workbook_sheets}</sheets></workbook>'
+        ))
+        
+        relations = [(f'rId{number}', 'worksheet', f'worksheets/sheet{number}.xml') for number in sheets]
+        relations.append(('rIdStyles', 'styles', 'styles.xml'))
+        relations.append(('rIdStrings', 'sharedStrings', 'sharedStrings.xml'))
+        if self.template.theme is not None:
+            relations.append(('rIdTheme', 'theme', 'theme/theme1.xml'))
+        self.archive.writestr('xl/_rels/workbook.xml.rels', (
+            f'{header}<Relationships xmlns="{PACKAGE_REL_NS}">'
+            + ''.join(f'<Relationship Id="{rid}" Type="{REL_TYPE}{kind}" Target="{target}"/>' for rid, kind, target in relations)
+            + '</Relationships>'
+        ))
+        self.archive.writestr('_rels/.rels', (
+            f'{header}<Relationships xmlns="{PACKAGE_REL_NS}">'
+            f'<Relationship Id="rId1" Type="{REL_TYPE}officeDocument" Target="xl/workbook.xml"/></Relationships>'
+        ))
+        
+        overrides = [('/xl/workbook.xml', 'spreadsheetml.sheet.main+xml')]
+        overrides.extend((f'/xl/worksheets/sheet{number}.xml', 'spreadsheetml.worksheet+xml') for number in sheets)
+        overrides.append(('/xl/styles.xml', 'spreadsheetml.styles+xml'))
+        overrides.append(('/xl/sharedStrings.xml', 'spreadsheetml.sharedStrings+xml'))
+        if self.template.theme is not None:
+            overrides.append(('/xl/theme/theme1.xml', 'theme+xml'))
+        self.archive.writestr('[Content_Types].xml', (
+            f'{header}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            + ''.join(f'<Override PartName="{part}" ContentType="{CONTENT_TYPE}{kind}"/>' for part, kind in overrides)
+            + '</Types>'
+        ))
+        self.archive.close()
+
+# 読み込んだテンプレートはプロセスごとにパス単位で使い回す
+template_lock = threading.Lock()
+templates = {}
+
+def load_template(path, build_default):
+    """テンプレートを読み込む（pathがNoneの場合はbuild_default()で作成した既定のテンプレート）"""
+    key = None if path is None else (os.fspath(path), os.stat(path).st_mtime_ns)
+    with template_lock:
+        template = templates.get(key)
+        if template is None:
+            template = templates[key] = XlsxTemplate(build_default() if path is None else path)
+        return template
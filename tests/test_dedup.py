@@ -0,0 +1,52 @@
+"""重複エントリーの検出（pinos.dedup）の確認"""
+import pandas as pd
+
+from pinos.dedup import DUPLICATE_EXACT, DUPLICATE_NEAR, drop_duplicates, find_duplicates, similar_place
+from pinos.parser import compact_entries
+
+def entries(rows):
+    df = pd.DataFrame(rows, columns=['name', 'date', 'route', 'distance'])
+    df['id'] = range(1, len(df) + 1)
+    return compact_entries(df, (2025, 1))
+
+def kinds(duplicates):
+    return {entry_id: (first, kind) for entry_id, first, kind in duplicates[['id', 'duplicate_of', 'kind']].itertuples(index=False)}
+
+def test_exact_duplicates():
+    df = entries([
+        ('山田', '1/6', '本社→現場', 12.5),
+        ('山田', '1/6', '本社 ー> 現場', 12.5),   # 矢印・空白の表記揺れ
+        ('山田', '1/6', '本社→現場', 12.5),
+        ('山田', '1/7', '本社→現場', 12.5),      # 別の日
+        ('佐藤', '1/6', '本社→現場', 12.5),      # 別の担当者
+    ])
+    assert kinds(find_duplicates(df)) == {2: (1, DUPLICATE_EXACT), 3: (1, DUPLICATE_EXACT)}
+
+def test_near_duplicates():
+    df = entries([
+        ('山田', '1/6', '本社→山田工務店→本社', 20.0),
+        ('山田', '1/6', '本社→山田工務点→本社', 20.4),  # 1文字の誤字・距離の差も許容値以内
+        ('山田', '1/6', '本社ビル→山田工務店→本社', 20.0),  # 表記を補った経由地
+        ('山田', '1/6', '本社→山田工務店→本社', 25.0),  # 距離の差が大きい
+        ('山田', '1/6', '本社→山田工務店', 20.0),       # 経由地の数が違う
+    ])
+    duplicates = find_duplicates(df)
+    assert kinds(duplicates) == {2: (1, DUPLICATE_NEAR), 3: (1, DUPLICATE_NEAR)}
+    assert drop_duplicates(df, duplicates, (DUPLICATE_EXACT,))['id'].tolist() == [1, 2, 3, 4, 5]
+    assert drop_duplicates(df, duplicates, (DUPLICATE_EXACT, DUPLICATE_NEAR))['id'].tolist() == [1, 4, 5]
+
+def test_short_and_empty_places_are_not_near():
+    df = entries([
+        ('山田', '1/6', '本社', 10.0),
+        ('山田', '1/6', '', 10.0),
+        ('山田', '1/6', '本社→駅→本社', 6.0),
+        ('山田', '1/6', '本社→駅前店→本社', 6.0),
+    ])
+    assert find_duplicates(df).empty
+    assert not similar_place('', '本社')
+    assert not similar_place('駅', '駅前店')
+    assert similar_place('本社', '本社ビル')
+
+def test_empty_routes_are_exact_duplicates_only():
+    df = entries([('山田', '1/6', '', 10.0), ('山田', '1/6', '', 10.0), ('山田', '1/6', '', 10.2)])
+    assert kinds(find_duplicates(df)) == {2: (1, DUPLICATE_EXACT)}
@@ -0,0 +1,48 @@
+"""LINEトーク履歴の解析（pinos.parser）の確認"""
+import pandas as pd
+import pytest
+
+from pinos.parser import (
+    ENTRY_COLUMNS, compact_entries, format_invalid_dates, invalid_dates, parse_expense_data, resolve_dates
+)
+
+LOG = """\
+【ピノ】山田 12/28(日) 本社→現場 12.5km
+【ピノ】山田 1/5(月) 本社→支店 8km
+"""
+
+def test_parse_requires_period():
+    with pytest.raises(ValueError):
+        parse_expense_data(LOG)
+    # 日付の補完が不要な場合（エントリーがない・日付が変換済み）は精算期間を指定しなくてよい
+    assert compact_entries(pd.DataFrame(columns=ENTRY_COLUMNS)).empty
+    df = parse_expense_data(LOG, period=(2026, 1))
+    assert compact_entries(df)['date'].tolist() == df['date'].tolist()
+
+def test_resolve_dates_across_year_boundary():
+    # 精算月より後の月は前年の日付になる
+    dates = resolve_dates(['12/28', '1/5', '1/31', '2/1'], 2026, 1)
+    assert pd.DatetimeIndex(dates).strftime('%Y-%m-%d').tolist() == ['2025-12-28', '2026-01-05', '2026-01-31', '2025-02-01']
+    dates = resolve_dates(['12/31', '1/1'], 2025, 12)
+    assert pd.DatetimeIndex(dates).strftime('%Y-%m-%d').tolist() == ['2025-12-31', '2025-01-01']
+
+def test_resolve_dates_invalid():
+    dates = resolve_dates(['2/30', '13/1', '2/29', '2/3'], 2025, 2)
+    assert pd.isna(dates).tolist() == [True, True, True, False]
+    # うるう年の2/29は正しい日付
+    assert pd.Timestamp(resolve_dates(['2/29'], 2024, 3)[0]) == pd.Timestamp('2024-02-29')
+
+def test_invalid_dates_are_dropped_and_reported():
+    log = """\
+【ピノ】山田 2/3(月) 本社→現場 10km
+【ピノ】山田 2/30(日) 本社→支店 8km
+【ピノ】山田 13/1(月) 本社→倉庫 5km
+【ピノ】山田 2/31(月) 本社→現場 10km
+"""
+    df = parse_expense_data(log, period=(2025, 2))
+    assert df['id'].tolist() == [1]
+    assert df['date'].notna().all()
+    assert invalid_dates(df) == {2: '2/30', 3: '13/1', 4: '2/31'}
+    assert format_invalid_dates(invalid_dates(df), limit=2) == 'No. 2 (2/30), No. 3 (13/1) ...'
+    # 正しい日付だけのデータには記録しない
+    assert invalid_dates(parse_expense_data(LOG, period=(2026, 1))) == {}
@@ -0,0 +1,73 @@
+"""精算データの作成・設定表による再計算（pinos.settlement・pinos.policy）の確認"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pinos.parser import compact_entries
+from pinos.policy import PolicyTable, RatePolicy
+from pinos.settlement import compare_policies, create_settlement, split_settlements
+
+def entries(rows, period=(2025, 1)):
+    df = pd.DataFrame(rows, columns=['name', 'date', 'route', 'distance'])
+    df['id'] = range(1, len(df) + 1)
+    return compact_entries(df, period)
+
+def policies(*rows):
+    return PolicyTable([RatePolicy(*row) for row in rows])
+
+def test_allowance_once_per_person_and_date():
+    df = entries([
+        ('山田', '1/7', '本社→支店', 5.0),
+        ('佐藤', '1/6', '本社→現場', 12.0),
+        ('山田', '1/6', '本社→現場', 10.0),
+        ('山田', '1/6', '現場→本社', 10.0),
+    ])
+    settlement = create_settlement(df)
+    assert settlement.names == ['佐藤', '山田']
+    # 同じ日付の2件目以降には運転手当を付けない（同じ日付の経路は入力順）
+    assert settlement.details('山田')[['日付', '経路', '運転手当(円)']].values.tolist() == [
+        ['1/6', '本社→現場', 200], ['1/6', '現場→本社', 0], ['1/7', '本社→支店', 200]
+    ]
+    assert settlement.totals.loc['山田'].tolist() == [25.0, 375, 400, 775]
+    assert settlement.totals.loc['佐藤'].tolist() == [12.0, 180, 200, 380]
+
+def test_settlement_keeps_only_its_period():
+    # 20日締めでは1/21以降は2月の精算になる
+    table = policies((date(2000, 1, 1), 15, 200, 20))
+    df = entries([('山田', '1/10', '本社→現場', 10.0), ('山田', '1/25', '本社→支店', 4.0)], period=(2025, 2))
+    january = create_settlement(df, table, (2025, 1))
+    assert january.rows['日付'].tolist() == ['1/10']
+    assert january.excluded == 1
+    february = create_settlement(df, table, (2025, 2))
+    assert february.rows['日付'].tolist() == ['1/25']
+    # 精算期間を指定しない場合は、複数の精算期間にまたがるとエラーになり、split_settlements()で分ける
+    with pytest.raises(ValueError):
+        create_settlement(df, table)
+    settlements = split_settlements(df, table)
+    assert list(settlements) == [(2025, 1), (2025, 2)]
+    assert [settlement.period_label for settlement in settlements.values()] == ['2025年1月', '2025年2月']
+    assert create_settlement(df).period == (2025, 1)
+
+def test_lookup_missing_date_uses_first_policy():
+    table = policies((date(2025, 1, 1), 15), (date(2025, 2, 1), 20))
+    dates = np.array(['NaT', '2024-12-31', '2025-01-15', '2025-02-01'], dtype='datetime64[ns]')
+    assert table.lookup(dates).tolist() == [0, 0, 0, 1]
+    assert table.periods(dates)[0] == 0
+
+def test_compare_policies_with_mid_period_rate_change():
+    df = entries([
+        ('山田', '1/10', '本社→現場', 10.0),
+        ('山田', '1/20', '本社→現場', 10.0),
+        ('佐藤', '1/10', '本社→支店', 4.0),
+    ])
+    old = policies((date(2000, 1, 1), 15, 200))
+    new = policies((date(2000, 1, 1), 15, 200), (date(2025, 1, 16), 20, 300))
+    diff = compare_policies(df, old, new)
+    assert diff.index.tolist() == [('2025-01', '山田'), ('2025-01', '佐藤')]
+    assert diff.loc[('2025-01', '山田'), ['fee_old', 'fee_new', 'allowance_old', 'allowance_new']].tolist() == [300, 350, 400, 500]
+    assert diff.loc[('2025-01', '山田'), 'difference'] == 150
+    assert diff.loc[('2025-01', '佐藤'), 'difference'] == 0
+    # 期間内で単価が変わる場合は交通費の列名に単価を表示しない
+    assert create_settlement(df, new).fee_column == '交通費（距離×単価）(円)'
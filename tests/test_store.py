@@ -0,0 +1,52 @@
+"""解析済みエントリーの永続ストア（pinos.store）の確認"""
+import pandas as pd
+import pytest
+
+from pinos.dedup import DUPLICATE_EXACT
+from pinos.parser import compact_entries
+from pinos.store import EntryStore, period_range
+
+def entries(rows, period=(2025, 1)):
+    df = pd.DataFrame(rows, columns=['name', 'date', 'route', 'distance'])
+    df['id'] = range(1, len(df) + 1)
+    return compact_entries(df, period)
+
+@pytest.fixture
+def store(tmp_path):
+    store = EntryStore(tmp_path / 'entries.db')
+    yield store
+    store.close()
+
+def test_upsert_is_idempotent(store):
+    df = entries([
+        ('山田', '12/28', '本社→現場', 12.5),
+        ('山田', '1/6', '本社→現場', 12.5),
+        ('山田', '1/6', '本社→現場', 12.5),  # 同じ内容のエントリーは出現順で区別して両方保存する
+    ])
+    assert store.upsert(df, 2025, 1, source='a.txt') == 3
+    assert store.upsert(df, 2025, 1, source='b.txt') == 3
+    stored = store.query()
+    assert len(stored) == 3
+    assert stored['date'].tolist() == ['2024-12-28', '2025-01-06', '2025-01-06']
+    assert set(stored['source']) == {'b.txt'}
+    assert store.periods() == [('2025-01', 3)]
+    # 読み込んだデータは解析結果と同じ形式で、同じ金額になる
+    loaded = store.load_period(2025, 1)
+    assert loaded['date'].tolist() == df['date'].tolist()
+    assert loaded['distance'].tolist() == df['distance'].tolist()
+
+def test_upsert_rejects_dates_outside_period(store):
+    assert period_range(2025, 1) == ('2024-02-01', '2025-01-31')
+    assert period_range(2025, 12) == ('2025-01-01', '2025-12-31')
+    # 2024年1月の精算期間で補完した日付を2025年1月として保存しようとした場合
+    df = entries([('山田', '1/6', '本社→現場', 12.5)], period=(2024, 1))
+    with pytest.raises(ValueError):
+        store.upsert(df, 2025, 1)
+    assert store.query().empty
+
+def test_duplicates_are_stored_and_excluded_on_query(store):
+    df = entries([('山田', '1/6', '本社→現場', 12.5), ('山田', '1/6', '本社 → 現場', 12.5)])
+    store.upsert(df, 2025, 1)
+    assert store.query(['duplicate'])['duplicate'].fillna('').tolist() == ['', DUPLICATE_EXACT]
+    assert len(store.load_entries(period='2025-01', duplicates=(DUPLICATE_EXACT,))) == 1
+    assert len(store.load_entries(period='2025-01')) == 2
@@ -0,0 +1,162 @@
+"""xlsxの直接書き出し（pinos.xlsx）をopenpyxlで読み込み直して確認"""
+from copy import copy
+from io import BytesIO
+
+import openpyxl
+import pandas as pd
+import pytest
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.worksheet.formula import ArrayFormula
+
+from pinos.excel import build_excel_template, export_person_excel, export_to_excel
+from pinos.parser import compact_entries
+from pinos.settlement import create_expense_report, create_settlement
+from pinos.xlsx import XlsxTemplate, sheet_title
+
+PERIOD = (2026, 10)
+NAMES = ['A&B', '<C>', 'D"E']
+ENTRIES = [
+    ('A&B', '10/1', '本社 & <倉庫> "往復"', 12.5),
+    ('A&B', '10/2', '本社→現場', 30.0),
+    ('A&B', '10/3', 'a < b > c', 7.25),
+    ('<C>', '10/1', '本社→"支店"', 8.0),
+    ('D"E', '10/4', '現場&現場', 15.0),
+    ('D"E', '10/5', '<>&"', 3.0),
+]
+
+@pytest.fixture
+def settlement():
+    df = pd.DataFrame(ENTRIES, columns=['name', 'date', 'route', 'distance'])
+    df['id'] = range(1, len(df) + 1)
+    return create_settlement(compact_entries(df, PERIOD), period=PERIOD)
+
+@pytest.fixture
+def template(tmp_path):
+    """既定と異なるレイアウト（タイトル行の上の行・独自の書式・数式を含む2行の注釈）のテンプレート"""
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    thin = Side(style='thin')
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+
+    worksheet['A1'] = "社内通貨 精算"
+    worksheet.merge_cells('A1:C1')
+    worksheet.row_dimensions[1].height = 20
+    worksheet['A2'] = "{name}様（{period}）"
+    worksheet['A2'].font = Font(size=16, bold=True)
+    worksheet['A2'].alignment = Alignment(horizontal='center')
+    worksheet.merge_cells('A2:F2')
+    worksheet.row_dimensions[2].height = 40
+    for column in range(1, 7):
+        header = worksheet.cell(row=3, column=column, value='見出し')
+        header.font = Font(bold=True, color='FFFFFF')
+        header.fill = PatternFill(start_color='336699', end_color='336699', fill_type='solid')
+        detail = worksheet.cell(row=4, column=column)
+        detail.border = border
+        detail.number_format = '0.0' if column == 3 else '#,##0"円"' if column > 3 else '@'
+        total = worksheet.cell(row=5, column=column)
+        total.font = Font(bold=True)
+        total.fill = PatternFill(start_color='EEEEEE', end_color='EEEEEE', fill_type='solid')
+        total.number_format = detail.number_format
+    worksheet.row_dimensions[4].height = 22
+    worksheet['A7'] = "※{period}分 {name}"
+    worksheet['A7'].font = Font(italic=True)
+    worksheet.merge_cells('A7:F7')
+    worksheet.row_dimensions[7].height = 25
+    # 注釈行の下の行（数値・数式・真偽値はそのまま複製し、数式の参照は明細の行数に合わせてずらす）
+    worksheet['A8'] = 123
+    worksheet['B8'] = '=1+2'
+    worksheet['C8'] = '=SUM(F4:F4)'
+    worksheet['D8'] = '=$F$5*2'
+    worksheet['E8'] = "承認"
+    worksheet['F8'] = True
+    worksheet.column_dimensions['B'].width = 60
+
+    path = tmp_path / 'template.xlsx'
+    workbook.save(path)
+    return path
+
+def assert_same_style(cell, expected):
+    """セルの書式がテンプレートのセルと同じか"""
+    for attribute in ('font', 'fill', 'border', 'alignment'):
+        assert copy(getattr(cell, attribute)) == copy(getattr(expected, attribute))
+    assert cell.number_format == expected.number_format
+
+def test_round_trip_with_custom_template(settlement, template):
+    data = export_to_excel(None, NAMES, settlement, template=template)
+    workbook = openpyxl.load_workbook(BytesIO(data))
+    source = openpyxl.load_workbook(template).active
+
+    assert workbook.sheetnames == ['A&B様', '<C>様', 'D"E様']
+    rows = settlement.rows
+    for name, worksheet in zip(NAMES, workbook.worksheets):
+        start, stop = settlement.index[name]
+        count = stop - start
+        shift = count - 1
+
+        # タイトル行とその上の行
+        assert worksheet['A1'].value == "社内通貨 精算"
+        assert worksheet['A2'].value == f"{name}様（2026年10月）"
+        assert_same_style(worksheet['A2'], source['A2'])
+        assert worksheet.row_dimensions[1].height == 20
+        assert worksheet.row_dimensions[2].height == 40
+
+        # 見出し・明細・合計
+        assert [cell.value for cell in worksheet[3]] == list(rows.columns)
+        for offset, expected in enumerate(rows.iloc[start:stop].itertuples(index=False, name=None)):
+            row = worksheet[4 + offset]
+            assert tuple(cell.value for cell in row) == pytest.approx(expected)
+            for cell, template_cell in zip(row, source[4]):
+                assert_same_style(cell, template_cell)
+            assert worksheet.row_dimensions[4 + offset].height == 22
+        total_row = worksheet[4 + count]
+        assert [cell.value for cell in total_row] == ['合計', None, *settlement.totals.loc[name].tolist()]
+        for cell, template_cell in zip(total_row, source[5]):
+            assert_same_style(cell, template_cell)
+
+        # 注釈行は明細の行数に合わせて下にずれる
+        note = worksheet.cell(row=7 + shift, column=1)
+        assert note.value == f"※2026年10月分 {name}"
+        assert_same_style(note, source['A7'])
+        assert worksheet.row_dimensions[7 + shift].height == 25
+        footer = worksheet[8 + shift]
+        assert [cell.value for cell in footer] == [
+            123, '=1+2', f'=SUM(F4:F{4 + shift})', f'=$F${5 + shift}*2', "承認", True
+        ]
+        assert [cell.data_type for cell in footer] == ['n', 'f', 'f', 'f', 's', 'b']
+
+        assert sorted(str(merge) for merge in worksheet.merged_cells.ranges) == sorted(
+            ['A1:C1', 'A2:F2', f'A{7 + shift}:F{7 + shift}']
+        )
+        assert worksheet.column_dimensions['B'].width == 60
+
+def test_template_with_array_formula(tmp_path):
+    workbook = openpyxl.load_workbook(build_excel_template())
+    workbook.active['A8'] = ArrayFormula('A8', '=SUM(F3:F4)')
+    path = tmp_path / 'template.xlsx'
+    workbook.save(path)
+    with pytest.raises(ValueError):
+        XlsxTemplate(path)
+
+def test_person_excel_with_default_template():
+    df = pd.DataFrame([entry for entry in ENTRIES if entry[0] == 'A&B'], columns=['name', 'date', 'route', 'distance'])
+    df['id'] = range(1, len(df) + 1)
+    report = create_expense_report(compact_entries(df, PERIOD), period=PERIOD)
+
+    worksheet = openpyxl.load_workbook(BytesIO(export_person_excel('A&B', report))).active
+    assert worksheet.title == 'A&B様'
+    assert worksheet['A1'].value == "A&B様 2026年10月 社内通貨（交通費）清算額"
+    # 空文字（合計行の経路）は値のないセルになる
+    values = [
+        tuple('' if cell.value is None else cell.value for cell in row)
+        for row in worksheet.iter_rows(min_row=3, max_row=2 + len(report))
+    ]
+    assert values == pytest.approx(list(report.itertuples(index=False, name=None)))
+    assert worksheet['A8'].value == "※2026年10月分給与にて清算しました。"
+    assert sorted(str(merge) for merge in worksheet.merged_cells.ranges) == ['A1:F1', 'A8:F8']
+
+def test_sheet_title():
+    used = set()
+    assert sheet_title('営業/山田', used) == '営業_山田様'
+    assert sheet_title('営業_山田', used) == '営業_山田様_2'
+    assert sheet_title('あ' * 40, used) == 'あ' * 31
+    assert sheet_title('あ' * 40, used) == 'あ' * 29 + '_2'